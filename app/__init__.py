@@ -13,7 +13,34 @@ moment = Moment(app)
 
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
+from . import logs
+from . import metrics
+from . import querycheck
 from . import models
+from . import clients
+from . import outbox
+from . import availability
+from . import events
+from . import jobs
+from . import search
+from . import answers
+from . import videos
+from . import uploads
+from . import listcache
 from .api import api
 
+metrics.init_app(app)
+logs.init_app(app)
+querycheck.init_app(app)
+clients.init_app(app)
+outbox.init_app(app)
+availability.init_app(app)
+events.init_app(app)
+jobs.init_app(app)
+search.init_app(app)
+answers.init_app(app)
+videos.init_app(app)
+uploads.init_app(app)
+listcache.init_app(app)
+
 app.register_blueprint(api)
\ No newline at end of file
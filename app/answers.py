@@ -0,0 +1,208 @@
+"""Cache for /api/chatgpt answers.
+
+Questions are normalized (case, whitespace, trailing punctuation) and
+hashed together with the model name, so near-identical questions share one
+cached answer. Answers live in a size-bounded in-process LRU or, with
+``CHATGPT_CACHE_BACKEND=redis``, in Redis where every worker shares them.
+Concurrent requests for the same uncached question in one process are
+coalesced: one of them calls OpenAI and the others wait for its answer.
+Streamed answers are cached once they complete. Errors are never cached.
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from app import metrics
+
+_space = re.compile(r'\s+')
+
+
+def normalize(question):
+    question = unicodedata.normalize('NFKC', question).lower()
+    return _space.sub(' ', question).strip(' ?!.')
+
+
+class MemoryCache:
+    def __init__(self, config):
+        self.ttl = config['CHATGPT_CACHE_TTL']
+        self.maxsize = config['CHATGPT_CACHE_SIZE']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            answer, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def set(self, key, answer):
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    def __init__(self, config):
+        import redis
+
+        self.ttl = int(config['CHATGPT_CACHE_TTL'])
+        self.prefix = config['CHATGPT_CACHE_PREFIX']
+        self.client = redis.Redis.from_url(config['REDIS_URL'])
+
+    def get(self, key):
+        answer = self.client.get(self.prefix + key)
+        return answer.decode() if answer is not None else None
+
+    def set(self, key, answer):
+        self.client.setex(self.prefix + key, self.ttl, answer)
+
+    def __len__(self):
+        # Shared with other workers and bounded by Redis' own eviction policy
+        return 0
+
+
+CACHE_BACKENDS = {
+    'memory': MemoryCache,
+    'redis': RedisCache,
+}
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.answer = None
+        self.error = None
+
+
+class AnswerCache:
+    def __init__(self, app):
+        self.app = app
+        self.model = app.config['OPENAI_MODEL']
+        self.backend = CACHE_BACKENDS[app.config['CHATGPT_CACHE_BACKEND']](app.config)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    def key(self, question):
+        return hashlib.sha256(f'{self.model}\n{normalize(question)}'.encode()).hexdigest()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _lookup(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception:
+            # A cache outage degrades to calling OpenAI, not to failing the request
+            self.app.logger.exception("ChatGPT cache lookup failed")
+            return None
+
+    def _store(self, key, answer):
+        try:
+            self.backend.set(key, answer)
+        except Exception:
+            self.app.logger.exception("ChatGPT cache store failed")
+
+    def stream(self, question, open_stream):
+        """Yield the answer to ``question`` as text fragments.
+
+        A cached answer is yielded whole. Otherwise the fragments from
+        ``open_stream()`` are relayed as they arrive and the joined answer is
+        cached once the stream completes. Streams are not coalesced: each
+        waiting client needs its own tokens as they are generated.
+        """
+        key = self.key(question)
+        answer = self._lookup(key)
+        if answer is not None:
+            self._count('hits')
+            yield answer
+            return
+
+        self._count('misses')
+        parts = []
+        try:
+            for fragment in open_stream():
+                parts.append(fragment)
+                yield fragment
+        except Exception:
+            self._count('errors')
+            raise
+        self._store(key, ''.join(parts).strip())
+
+    def get_or_compute(self, question, compute):
+        """The cached answer to ``question``, calling ``compute()`` at most once per key on a miss."""
+        key = self.key(question)
+        answer = self._lookup(key)
+        if answer is not None:
+            self._count('hits')
+            return answer
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.answer
+
+        try:
+            flight.answer = compute()
+            self._store(key, flight.answer)
+            return flight.answer
+        except Exception as e:
+            flight.error = e
+            self._count('errors')
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['size'] = len(self.backend)
+        stats['backend'] = self.app.config['CHATGPT_CACHE_BACKEND']
+        return stats
+
+
+cache = None
+
+
+def init_app(app):
+    global cache
+    cache = AnswerCache(app)
+
+    def collect():
+        stats = cache.snapshot()
+        return [
+            ('chatgpt_cache_lookups_total', 'counter', 'ChatGPT answer cache lookups by result.',
+             {(('result', result),): stats[result] for result in ('hits', 'misses', 'coalesced', 'errors')}),
+            ('chatgpt_cache_entries', 'gauge', 'Answers held in the in-process cache.', {(): stats['size']}),
+        ]
+
+    metrics.registry.add_collector(collect)
@@ -1,38 +1,21 @@
 import os
-from flask import Blueprint, request, jsonify, redirect, make_response, send_from_directory
+from flask import Blueprint, Response, request, jsonify
 from app import app, db
-from app.models import User, Appointment, Doctor, TimeSlot, Class, UploadedFile, Message, Chat
-import logging, time, jwt, requests, base64, hashlib, hmac, random, string
+from app.models import User, Appointment, Doctor, Class, UploadedFile, UploadSession, Message, Chat, Job
+from app import answers, availability, booking, events, inbox, jobs, listcache, metrics, search, uploads, videos
+from app.clients import clients
+from app.querycheck import query_budget
+import base64, random, string
 from . import api
 from datetime import datetime, timedelta
 from flask_cors import cross_origin, CORS
-import smtplib
-from googleapiclient.discovery import build
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
-from pprint import pprint
-from dotenv import load_dotenv
-from openai import OpenAI
-import openai
 import uuid
 from werkzeug.utils import secure_filename
-
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-
-load_dotenv()
-
-logging.basicConfig(level=logging.DEBUG)
+from sqlalchemy.exc import IntegrityError
+from app.outbox import enqueue_email
 
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
-# cred = credentials.Certificate('path/to/serviceAccountKey.json')
-# firebase_admin.initialize_app(cred)
-# firestore_db = firestore.client()
-
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
 CLIENT_ID = os.getenv('CLIENT_ID')
 CLIENT_SECRET = os.getenv('CLIENT_SECRET')
 REDIRECT_URI = os.getenv('REDIRECT_URI')
@@ -40,22 +23,19 @@ SECRET_TOKEN = os.getenv('SECRET_TOKEN')
 AUTHORIZATION_BASE_URL = os.getenv('AUTHORIZATION_BASE_URL')
 TOKEN_URL = os.getenv('TOKEN_URL')
 API_BASE_URL = os.getenv('API_BASE_URL')
-SENDINBLUE_API_KEY = os.getenv('SENDINBLUE_API_KEY')  # Your Sendinblue API key
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx'}
+MAX_AVAILABILITY_DAYS = 62
+MAX_NEXT_AVAILABLE_DAYS = 90
+MAX_NEXT_AVAILABLE_LIMIT = 100
+MAX_CHATS_PAGE = 100
+MAX_MESSAGES_PAGE = 200
+MAX_SEARCH_RESULTS = 50
+MAX_YOUTUBE_RESULTS = 50
 
 api = Blueprint('api', __name__, url_prefix='/api')
 classes = []
 appointments = []
-youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -64,33 +44,9 @@ def generate_jitsi_link():
     random_string = ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
     return f'https://meet.jit.si/{random_string}'
 
-def generate_timeslots_for_doctor(doctor_id):
-    start_time = datetime(2024, 1, 1, 9, 0)
-    end_time = datetime(2024, 12, 31, 17, 0)
-
-    slots = []
-    while start_time < end_time:
-        app.logger.debug(f"Generating time slot for {doctor_id} at {start_time}")
-        slots.append(TimeSlot(
-            doctor_id=doctor_id,
-            start_time=start_time,
-            is_available=True
-        ))
-        start_time += timedelta(minutes=30)
-
-    db.session.bulk_save_objects(slots)
-    db.session.commit()
-    app.logger.info(f"Time slots generated for doctor {doctor_id}")
-
 def generate_full_day_slots(date):
     """Generate all possible slots for a given date from 9:00 AM to 5:00 PM."""
-    start_time = datetime.combine(date, datetime.min.time()) + timedelta(hours=9)
-    end_time = datetime.combine(date, datetime.min.time()) + timedelta(hours=17)
-    slots = []
-    while start_time < end_time:
-        slots.append(start_time)
-        start_time += timedelta(minutes=30)
-    return slots
+    return availability.working_slots(availability.DEFAULT_WORKING_HOURS, date)
 
 def get_taken_slots(doctor_id, date):
     start_day = datetime.combine(date, datetime.min.time())
@@ -116,17 +72,32 @@ def generate_random_string(length=12):
     letters = string.ascii_letters + string.digits
     return ''.join(random.choice(letters) for i in range(length))
 
+def booking_conflict(key, endpoint, error):
+    """Answer a lost booking race, replaying the winner's response if it was a retry of the same key."""
+    replay = booking.stored_response(key, endpoint) if key else None
+    if replay:
+        return jsonify(replay[0]), replay[1]
+    app.logger.error(error)
+    return jsonify({'error': error}), 400
+
 @app.route('/api/schedule_meeting', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(12)
 def schedule_meeting():
     data = request.json
+    key = booking.idempotency_key()
+    if key:
+        replay = booking.stored_response(key, 'schedule_meeting')
+        if replay:
+            return jsonify(replay[0]), replay[1]
+
     date_str = data.get('date')
     purpose = data.get('purpose')
     doctor_id = data.get('doctor')
     user_email = data.get('email')
     user_name = data.get('name')
 
-    app.logger.debug(f"Received data: {data}")
+    app.logger.debug("Received data: %s", data)
 
     if not all([date_str, purpose, doctor_id, user_email, user_name]):
         app.logger.error('Missing data in schedule_meeting request')
@@ -134,11 +105,10 @@ def schedule_meeting():
 
     # Parse the date and subtract 4 hours
     date = datetime.fromisoformat(date_str) - timedelta(hours=4)
-    app.logger.debug(f"Parsed date (adjusted): {date}")
+    app.logger.debug("Parsed date (adjusted): %s", date)
 
-    # Check if the slot is available
-    time_slot = TimeSlot.query.filter_by(doctor_id=doctor_id, start_time=date, is_available=True).first()
-    if not time_slot:
+    # Check the slot is within the doctor's working hours; whether it is free is decided atomically below
+    if not availability.is_working_slot(doctor_id, date):
         app.logger.error("Time slot is already booked")
         return jsonify({'error': 'Time slot is already booked'}), 400
 
@@ -149,35 +119,29 @@ def schedule_meeting():
 
     subject = f"Meeting Scheduled: {purpose}"
 
-    user = User.query.filter_by(email=user_email).first()
-    if not user:
-        user = User(id=generate_random_string(), email=user_email, name=user_name)
-        db.session.add(user)
-        db.session.commit()
-    else:
-        user.name = user_name  # Update the name if it already exists
-
-    doctor = Doctor.query.filter_by(id=doctor_id).first()
+    doctor = Doctor.query.filter_by(id=doctor_id, deleting=False).first()
     if not doctor:
         app.logger.error("Doctor not found")
         return jsonify({'error': 'Doctor not found'}), 404
 
+    # The user upsert, appointment, slot claim and emails all commit together
+    user_id = booking.upsert_user(generate_random_string(), user_email, user_name)
+
     appointment = Appointment(
         id=meeting_id,
         date=date,
         purpose=purpose,
         doctor_id=doctor.id,
-        user_id=user.id,
+        user_id=user_id,
         meeting_url=meeting_url,
         moderator_url=moderator_url,
         meeting_password=meeting_password
     )
     db.session.add(appointment)
 
-    # Update the TimeSlot to mark it as booked
-    time_slot.is_available = False
-    time_slot.appointment_id = appointment.id
-    db.session.commit()
+    if not availability.claim_slot(doctor.id, date, appointment.id):
+        db.session.rollback()
+        return booking_conflict(key, 'schedule_meeting', 'Time slot is already booked')
 
     body = f"""
     Meeting Details:
@@ -191,7 +155,7 @@ def schedule_meeting():
 
     moderator_body = f"""
     Meeting Details:
-    Patient: {user.name}
+    Patient: {user_name}
     Purpose: {purpose}
     Date and Time: {date}
     Meeting URL: {meeting_url}
@@ -201,15 +165,25 @@ def schedule_meeting():
     Please join the meeting at the specified time.
     """
 
-    app.logger.info(f"Meeting scheduled successfully: {appointment.to_dict()}")
+    enqueue_email(doctor.email, subject, moderator_body)
+    enqueue_email(user_email, subject, body)
 
-    send_email(doctor.email, subject, moderator_body)
-    send_email(user_email, subject, body)
+    response = {'message': 'Meeting scheduled successfully', 'appointment': appointment.to_dict()}
+    if key:
+        booking.remember_response(key, 'schedule_meeting', response, 200)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return booking_conflict(key, 'schedule_meeting', 'Time slot is already booked')
 
-    return jsonify({'message': 'Meeting scheduled successfully', 'appointment': appointment.to_dict()})
+    app.logger.info("Meeting scheduled successfully: %s", response['appointment'])
+
+    return jsonify(response)
 
 @app.route('/api/appointments', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(3)
 def list_appointments():
     user_email = request.args.get('email')
     if not user_email:
@@ -218,17 +192,24 @@ def list_appointments():
 
     user = User.query.filter_by(email=user_email).first()
     if not user:
-        app.logger.warning(f'User with email {user_email} not found')
+        app.logger.warning('User with email %s not found', user_email)
         return jsonify({'appointments': []})
 
-    appointments = Appointment.query.filter_by(user_id=user.id).all()
-    app.logger.info(f"Appointments retrieved for user {user_email}: {[a.to_dict() for a in appointments]}")
-    return jsonify({'appointments': [a.to_dict() for a in appointments]})
+    appointments = Appointment.serialize_all(Appointment.query.filter_by(user_id=user.id))
+    app.logger.info("Retrieved %s appointments for user %s", len(appointments), user_email)
+    return jsonify({'appointments': appointments})
 
 @app.route('/api/appointments', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(12)
 def schedule_appointment():
     data = request.json
+    key = booking.idempotency_key()
+    if key:
+        replay = booking.stored_response(key, 'schedule_appointment')
+        if replay:
+            return jsonify(replay[0]), replay[1]
+
     doctor_id = data['doctor_id']
     user_id = data['user_id']
     date = datetime.fromisoformat(data['date'])
@@ -237,9 +218,7 @@ def schedule_appointment():
     moderator_url = data['moderator_url']
     meeting_password = data['meeting_password']
 
-    time_slot = TimeSlot.query.filter_by(doctor_id=doctor_id, start_time=date, is_available=True).first()
-
-    if not time_slot:
+    if not availability.is_working_slot(doctor_id, date):
         return jsonify({'error': 'Time slot is not available'}), 400
 
     appointment = Appointment(
@@ -254,14 +233,24 @@ def schedule_appointment():
     )
 
     db.session.add(appointment)
-    time_slot.is_available = False
-    time_slot.appointment_id = appointment.id
-    db.session.commit()
+    if not availability.claim_slot(doctor_id, date, appointment.id):
+        db.session.rollback()
+        return booking_conflict(key, 'schedule_appointment', 'Time slot is not available')
 
-    return jsonify(appointment.to_dict()), 201
+    response = appointment.to_dict()
+    if key:
+        booking.remember_response(key, 'schedule_appointment', response, 201)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return booking_conflict(key, 'schedule_appointment', 'Time slot is not available')
+
+    return jsonify(response), 201
 
 @app.route('/api/appointments/<appointment_id>', methods=['DELETE'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(8)
 def cancel_appointment(appointment_id):
     appointment = Appointment.query.get(appointment_id)
 
@@ -292,14 +281,10 @@ def cancel_appointment(appointment_id):
     Meeting Password: {appointment.meeting_password}
     """
 
-    send_email(doctor.email, subject, moderator_body)
-    send_email(user.email, subject, body)
-
-    time_slots = TimeSlot.query.filter_by(appointment_id=appointment_id).all()
-    for time_slot in time_slots:
-        time_slot.is_available = True
-        time_slot.appointment_id = None
+    enqueue_email(doctor.email, subject, moderator_body)
+    enqueue_email(user.email, subject, body)
 
+    availability.release_slots(appointment_id)
     db.session.delete(appointment)
     db.session.commit()
 
@@ -308,9 +293,10 @@ def cancel_appointment(appointment_id):
 
 @app.route('/api/appointments/<appointment_id>', methods=['PUT'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(12)
 def reschedule_appointment(appointment_id):
     data = request.json
-    app.logger.debug(f"Received data for rescheduling: {data}")
+    app.logger.debug("Received data for rescheduling: %s", data)
     new_date = data.get('date')
 
     if not new_date:
@@ -319,32 +305,28 @@ def reschedule_appointment(appointment_id):
 
     appointment = Appointment.query.get(appointment_id)
     if not appointment:
-        app.logger.error(f"Appointment with ID {appointment_id} not found")
+        app.logger.error("Appointment with ID %s not found", appointment_id)
         return jsonify({'error': 'Appointment not found'}), 404
 
     try:
         new_datetime = datetime.fromisoformat(new_date) - timedelta(hours=4)
     except ValueError as e:
-        app.logger.error(f"Invalid date format: {e}")
+        app.logger.error("Invalid date format: %s", e)
         return jsonify({'error': 'Invalid date format'}), 400
 
-    app.logger.debug(f"New datetime for rescheduling: {new_datetime}")
+    app.logger.debug("New datetime for rescheduling: %s", new_datetime)
 
-    new_timeslot = TimeSlot.query.filter_by(doctor_id=appointment.doctor_id, start_time=new_datetime, is_available=True).first()
-    if not new_timeslot:
-        app.logger.error(f"New time slot not found or not available")
+    if not availability.is_working_slot(appointment.doctor_id, new_datetime):
+        app.logger.error("New time slot not found or not available")
         return jsonify({'error': 'The new time slot is not available'}), 400
 
-    old_timeslot = TimeSlot.query.filter_by(doctor_id=appointment.doctor_id, start_time=appointment.date).first()
-    if old_timeslot:
-        old_timeslot.is_available = True
-        old_timeslot.appointment_id = None
-
-    new_timeslot.is_available = False
-    new_timeslot.appointment_id = appointment.id
+    availability.release_slots(appointment.id)
+    if not availability.claim_slot(appointment.doctor_id, new_datetime, appointment.id):
+        db.session.rollback()
+        app.logger.error("New time slot not found or not available")
+        return jsonify({'error': 'The new time slot is not available'}), 400
 
     appointment.date = new_datetime
-    db.session.commit()
 
     user = User.query.get(appointment.user_id)
     doctor = Doctor.query.get(appointment.doctor_id)
@@ -370,33 +352,13 @@ def reschedule_appointment(appointment_id):
     Meeting Password: {appointment.meeting_password}
     """
 
-    send_email(doctor.email, subject, moderator_body)
-    send_email(user.email, subject, body)
+    enqueue_email(doctor.email, subject, moderator_body)
+    enqueue_email(user.email, subject, body)
+    db.session.commit()
 
     return jsonify({'message': 'Appointment rescheduled successfully', 'appointment': appointment.to_dict()})
 
 
-def send_email(to_email, subject, body):
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = SENDINBLUE_API_KEY
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-
-    sender = {"email": "your-email@example.com", "name": "Your Name"}  # Replace with your verified Sendinblue sender email and name
-    receivers = [{"email": to_email}]
-
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-        to=receivers,
-        sender=sender,
-        subject=subject,
-        text_content=body
-    )
-
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        pprint(api_response)
-    except ApiException as e:
-        print(f"Failed to send email to {to_email}: {e}")
-
 @app.route('/api/doctors', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def create_doctor():
@@ -411,16 +373,13 @@ def create_doctor():
     db.session.add(doctor)
     db.session.commit()
 
-    generate_timeslots_for_doctor(doctor.id)
-
     return jsonify({'message': 'Doctor created successfully', 'doctor': {'id': doctor.id, 'name': doctor.name, 'email': doctor.email}}), 201
 
 @app.route('/api/admin/doctors', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(2)
 def admin_list_doctors():
-    doctors = Doctor.query.all()
-    app.logger.info(f"Doctors retrieved: {[doctor.name for doctor in doctors]}")
-    return jsonify({'doctors': [{'id': doctor.id, 'name': doctor.name, 'email': doctor.email} for doctor in doctors]})
+    return listcache.respond('doctors', None, doctors_payload)
 
 @app.route('/api/admin/doctors', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
@@ -443,17 +402,20 @@ def admin_create_doctor():
     db.session.add(doctor)
     db.session.commit()
 
-    generate_timeslots_for_doctor(doctor.id)  # Ensure this line is present
-
-    app.logger.info(f"Doctor created successfully: {doctor}")
+    app.logger.info("Doctor created successfully: %s", doctor)
     return jsonify({'message': 'Doctor created successfully', 'doctor': {'id': doctor.id, 'name': doctor.name, 'email': doctor.email}}), 201
 
 @app.route('/api/doctors', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(2)
 def list_doctors():
-    doctors = Doctor.query.all()
-    app.logger.info(f"Doctors retrieved: {[doctor.name for doctor in doctors]}")
-    return jsonify({'doctors': [{'id': doctor.id, 'name': doctor.name, 'email': doctor.email} for doctor in doctors]})
+    return listcache.respond('doctors', None, doctors_payload)
+
+
+def doctors_payload():
+    doctors = Doctor.query.filter_by(deleting=False).all()
+    app.logger.info("Doctors retrieved: %d", len(doctors))
+    return {'doctors': [{'id': doctor.id, 'name': doctor.name, 'email': doctor.email} for doctor in doctors]}
 
 @app.route('/api/is_doctor', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
@@ -466,55 +428,124 @@ def is_doctor():
     doctor = Doctor.query.filter_by(email=user_email).first()
     is_doctor = doctor is not None
 
-    app.logger.info(f"Checked if user is a doctor: {user_email}, is_doctor: {is_doctor}")
+    app.logger.info("Checked if user is a doctor: %s, is_doctor: %s", user_email, is_doctor)
     return jsonify({'is_doctor': is_doctor})
 
+@app.route('/api/doctors/<doctor_id>/working_hours', methods=['GET'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def get_working_hours(doctor_id):
+    template = availability.get_working_hours(doctor_id)
+    hours = [
+        {'weekday': weekday, 'start': start.strftime('%H:%M'), 'end': end.strftime('%H:%M')}
+        for weekday, intervals in sorted(template.items())
+        for start, end in intervals
+    ]
+    return jsonify({'working_hours': hours})
+
+@app.route('/api/doctors/<doctor_id>/working_hours', methods=['PUT'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def update_working_hours(doctor_id):
+    data = request.json
+    doctor = Doctor.query.get(doctor_id)
+    if not doctor:
+        return jsonify({'error': 'Doctor not found'}), 404
+
+    try:
+        intervals = [
+            (int(entry['weekday']),
+             datetime.strptime(entry['start'], '%H:%M').time(),
+             datetime.strptime(entry['end'], '%H:%M').time())
+            for entry in data.get('working_hours', [])
+        ]
+        availability.set_working_hours(doctor_id, intervals)
+    except (KeyError, ValueError) as e:
+        db.session.rollback()
+        app.logger.error("Invalid working hours for doctor %s: %s", doctor_id, e)
+        return jsonify({'error': 'Invalid working hours'}), 400
+
+    db.session.commit()
+    return jsonify({'message': 'Working hours updated successfully'})
+
 @app.route('/api/available_slots', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(3)
 def get_available_slots():
     doctor_id = request.args.get('doctor_id')
     date_str = request.args.get('date')
+    days = request.args.get('days', type=int)
 
     if not all([doctor_id, date_str]):
         app.logger.error('Missing data in available_slots request')
         return jsonify({'error': 'Missing data'}), 400
 
-    date = datetime.fromisoformat(date_str)
-    start_time = date.replace(hour=9, minute=0, second=0, microsecond=0)
-    end_time = date.replace(hour=17, minute=0, second=0, microsecond=0)
+    date = datetime.fromisoformat(date_str).date()
 
-    all_slots = [start_time + timedelta(minutes=30 * i) for i in range(17)]  # 9 AM to 5 PM inclusive
+    # Range mode: one call returns a week or month of availability
+    if days is not None:
+        if not 1 <= days <= MAX_AVAILABILITY_DAYS:
+            return jsonify({'error': f'days must be between 1 and {MAX_AVAILABILITY_DAYS}'}), 400
+        slots_by_day = availability.available_slots_range(doctor_id, date, days)
+        return jsonify({'available_slots': {
+            day.isoformat(): [slot.isoformat() for slot in slots] for day, slots in slots_by_day
+        }})
 
-    taken_slots = TimeSlot.query.filter_by(doctor_id=doctor_id, is_available=False).filter(
-        TimeSlot.start_time >= start_time,
-        TimeSlot.start_time < end_time
-    ).all()
-
-    taken_times = {slot.start_time for slot in taken_slots}
-    available_slots = [slot for slot in all_slots if slot not in taken_times]
+    available_slots = availability.available_slots(doctor_id, date)
 
     return jsonify({'available_slots': [slot.isoformat() for slot in available_slots]})
 
 
+@app.route('/api/next_available_slots', methods=['GET'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(6)
+def next_available_slots():
+    start_str = request.args.get('start')
+    days = request.args.get('days', 14, type=int)
+    limit = request.args.get('limit', 10, type=int)
+    doctor_ids = request.args.get('doctor_ids')
+
+    try:
+        start = datetime.fromisoformat(start_str) if start_str else datetime.now()
+    except ValueError as e:
+        app.logger.error("Invalid start in next_available_slots request: %s", e)
+        return jsonify({'error': 'Invalid start'}), 400
+
+    if not 1 <= days <= MAX_NEXT_AVAILABLE_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_NEXT_AVAILABLE_DAYS}'}), 400
+    if not 1 <= limit <= MAX_NEXT_AVAILABLE_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {MAX_NEXT_AVAILABLE_LIMIT}'}), 400
+
+    doctor_ids = [doctor_id for doctor_id in doctor_ids.split(',') if doctor_id] if doctor_ids else None
+    slots = availability.next_available(start, days, limit, doctor_ids)
+
+    doctors = {doctor.id: doctor for doctor in Doctor.query.filter(
+        Doctor.id.in_({doctor_id for _, doctor_id in slots}), Doctor.deleting == False
+    )} if slots else {}
+    return jsonify({'slots': [
+        {'start': slot.isoformat(), 'doctor': {'id': doctor_id, 'name': doctors[doctor_id].name}}
+        for slot, doctor_id in slots if doctor_id in doctors
+    ]})
+
+
 @app.route('/api/doctor_appointments', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(2)
 def doctor_appointments():
     doctor_id = request.args.get('doctor_id')
-    app.logger.info(f"Received doctor_appointments request for doctor_id: {doctor_id}")
+    app.logger.info("Received doctor_appointments request for doctor_id: %s", doctor_id)
     if not doctor_id:
         app.logger.error("Missing doctor_id in doctor_appointments request")
         return jsonify({'error': 'Missing doctor_id'}), 400
 
-    appointments = Appointment.query.filter_by(doctor_id=doctor_id).all()
-    app.logger.info(f"Fetched appointments: {appointments}")
-    return jsonify({'appointments': [appointment.to_dict() for appointment in appointments]})
+    appointments = Appointment.serialize_all(Appointment.query.filter_by(doctor_id=doctor_id))
+    app.logger.info("Fetched %s appointments for doctor %s", len(appointments), doctor_id)
+    return jsonify({'appointments': appointments})
 
 
 @app.route('/api/doctor_by_email', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def get_doctor_by_email():
     email = request.args.get('email')
-    app.logger.info(f"Received get_doctor_by_email request for email: {email}")
+    app.logger.info("Received get_doctor_by_email request for email: %s", email)
     if not email:
         app.logger.error("Missing email in get_doctor_by_email request")
         return jsonify({'error': 'Missing email'}), 400
@@ -524,11 +555,12 @@ def get_doctor_by_email():
         app.logger.error("Doctor not found")
         return jsonify({'error': 'Doctor not found'}), 404
 
-    app.logger.info(f"Fetched doctor: {doctor}")
+    app.logger.info("Fetched doctor: %s", doctor)
     return jsonify({'id': doctor.id, 'name': doctor.name, 'email': doctor.email})
 
 @app.route('/api/request_time_off', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(10)
 def request_time_off():
     data = request.json
     date_str = data.get('date')
@@ -538,7 +570,7 @@ def request_time_off():
     user_email = data.get('email')
     user_name = data.get('name')
 
-    app.logger.debug(f"Received data: {data}")
+    app.logger.debug("Received data: %s", data)
 
     if not all([date_str, end_date_str, purpose, doctor_id, user_email, user_name]):
         app.logger.error('Missing data in request_time_off request')
@@ -546,26 +578,17 @@ def request_time_off():
 
     start_date = datetime.fromisoformat(date_str) - timedelta(hours=4)
     end_date = datetime.fromisoformat(end_date_str) - timedelta(hours=4)
-    app.logger.debug(f"Parsed dates (adjusted): {start_date} to {end_date}")
+    app.logger.debug("Parsed dates (adjusted): %s to %s", start_date, end_date)
 
-    doctor = Doctor.query.filter_by(id=doctor_id).first()
+    doctor = Doctor.query.filter_by(id=doctor_id, deleting=False).first()
     if not doctor:
-        app.logger.error(f"Doctor with ID {doctor_id} not found")
+        app.logger.error("Doctor with ID %s not found", doctor_id)
         return jsonify({'error': 'Doctor not found'}), 404
 
-    user = User.query.filter_by(email=user_email).first()
-    if not user:
-        user = User(id=generate_random_string(), email=user_email, name=user_name)
-        db.session.add(user)
-        db.session.commit()
+    user_id = booking.upsert_user(generate_random_string(), user_email, user_name, update_name=False)
 
-    user_id = user.id
-
-    existing_appointments = Appointment.query.filter_by(doctor_id=doctor_id).filter(
-        Appointment.date.between(start_date, end_date)
-    ).all()
-    if existing_appointments:
-        app.logger.error(f"Some time slots within the range are already booked")
+    if availability.overlapping(doctor_id, start_date, end_date).first():
+        app.logger.error("Some time slots within the range are already booked")
         return jsonify({'error': 'Some time slots within the range are already booked'}), 400
 
     appointment_id = generate_random_string()
@@ -583,27 +606,27 @@ def request_time_off():
     )
     db.session.add(appointment)
 
-    current_time = start_date
-    while current_time < end_date:
-        time_slot = TimeSlot.query.filter_by(doctor_id=doctor_id, start_time=current_time).first()
-        if not time_slot:
-            time_slot = TimeSlot(doctor_id=doctor_id, start_time=current_time, is_available=False)
-            db.session.add(time_slot)
-        else:
-            time_slot.is_available = False
-        current_time += timedelta(minutes=30)
-
-    db.session.commit()
+    if not availability.book_range(doctor_id, start_date, end_date, appointment_id):
+        db.session.rollback()
+        app.logger.error("Some time slots within the range are already booked")
+        return jsonify({'error': 'Some time slots within the range are already booked'}), 400
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        app.logger.error("Some time slots within the range are already booked")
+        return jsonify({'error': 'Some time slots within the range are already booked'}), 400
 
     return jsonify({'message': 'Time off requested successfully'}), 201
 
 @app.route('/api/request_time_off/<appointment_id>', methods=['PUT'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(10)
 def reschedule_time_off(appointment_id):
     data = request.json
     new_start_date_str = data.get('new_start_date')
     new_end_date_str = data.get('new_end_date')
-    app.logger.debug(f"Received data for rescheduling time off: {data}")
+    app.logger.debug("Received data for rescheduling time off: %s", data)
 
     if not all([new_start_date_str, new_end_date_str]):
         app.logger.error("New start date and end date are required")
@@ -611,44 +634,38 @@ def reschedule_time_off(appointment_id):
 
     appointment = Appointment.query.get(appointment_id)
     if not appointment:
-        app.logger.error(f"Appointment with ID {appointment_id} not found")
+        app.logger.error("Appointment with ID %s not found", appointment_id)
         return jsonify({'error': 'Appointment not found'}), 404
 
     try:
         new_start_datetime = datetime.fromisoformat(new_start_date_str) - timedelta(hours=4)
         new_end_datetime = datetime.fromisoformat(new_end_date_str) - timedelta(hours=4)
     except ValueError as e:
-        app.logger.error(f"Invalid date format: {e}")
+        app.logger.error("Invalid date format: %s", e)
         return jsonify({'error': 'Invalid date format'}), 400
 
-    app.logger.debug(f"New datetime for rescheduling: {new_start_datetime} to {new_end_datetime}")
+    app.logger.debug("New datetime for rescheduling: %s to %s", new_start_datetime, new_end_datetime)
 
-    existing_appointments = Appointment.query.filter_by(doctor_id=appointment.doctor_id).filter(
-        Appointment.date.between(new_start_datetime, new_end_datetime)
-    ).all()
-    if existing_appointments:
-        app.logger.error(f"Some time slots within the range are already booked")
+    if availability.overlapping(
+        appointment.doctor_id, new_start_datetime, new_end_datetime, exclude=appointment.id
+    ).first():
+        app.logger.error("Some time slots within the range are already booked")
         return jsonify({'error': 'Some time slots within the range are already booked'}), 400
 
-    old_time_slots = TimeSlot.query.filter_by(appointment_id=appointment.id).all()
-    for time_slot in old_time_slots:
-        time_slot.is_available = True
-        time_slot.appointment_id = None
-
-    current_time = new_start_datetime
-    while current_time < new_end_datetime:
-        time_slot = TimeSlot.query.filter_by(doctor_id=appointment.doctor_id, start_time=current_time).first()
-        if not time_slot:
-            time_slot = TimeSlot(doctor_id=appointment.doctor_id, start_time=current_time, is_available=False, appointment_id=appointment.id)
-            db.session.add(time_slot)
-        else:
-            time_slot.is_available = False
-            time_slot.appointment_id = appointment.id
-        current_time += timedelta(minutes=30)
+    availability.release_slots(appointment.id)
+    if not availability.book_range(appointment.doctor_id, new_start_datetime, new_end_datetime, appointment.id):
+        db.session.rollback()
+        app.logger.error("Some time slots within the range are already booked")
+        return jsonify({'error': 'Some time slots within the range are already booked'}), 400
 
     appointment.date = new_start_datetime
     appointment.end_date = new_end_datetime
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        app.logger.error("Some time slots within the range are already booked")
+        return jsonify({'error': 'Some time slots within the range are already booked'}), 400
 
     return jsonify({'message': 'Time off rescheduled successfully', 'appointment': appointment.to_dict()})
 
@@ -658,64 +675,98 @@ def reschedule_time_off(appointment_id):
 def chatgpt_query():
     app.logger.info('chatgpt_query route accessed')
     data = request.json
-    app.logger.debug(f"Received data: {data}")
+    app.logger.debug("Received data: %s", data)
     
     question = data.get('question')
     if not question:
         app.logger.error("Question parameter is required")
         return jsonify({"error": "Question parameter is required"}), 400
 
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": f"Answer the following question about pregnancy: {question}"}
+    ]
+
+    # Streaming is opt-in so existing clients keep getting one JSON answer
+    if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        return Response(stream_chatgpt_answer(question, messages), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    def ask_openai():
+        with metrics.outbound('openai'):
+            response = clients.get('openai').chat.completions.create(model=app.config['OPENAI_MODEL'], messages=messages)
+        return response.choices[0].message.content.strip()
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"Answer the following question about pregnancy: {question}"}
-            ]
-        )
-        answer = response.choices[0].message.content.strip()
-        app.logger.debug(f"Generated answer: {answer}")
+        answer = answers.cache.get_or_compute(question, ask_openai)
+        app.logger.debug("Generated answer: %s", answer)
         return jsonify({"answer": answer})
     except Exception as e:
-        app.logger.error(f"Error generating answer: {e}")
+        app.logger.error("Error generating answer: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def stream_chatgpt_answer(question, messages):
+    """SSE relay of an answer: ``token`` events as they arrive, then ``done`` with the full answer."""
+    def openai_tokens():
+        # The request is only sent once the client starts reading, and closing
+        # the stream early (client went away) closes the upstream connection
+        with metrics.outbound('openai_stream'), \
+                clients.get('openai').chat.completions.create(model=app.config['OPENAI_MODEL'], messages=messages, stream=True) as stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    parts = []
+    try:
+        for token in answers.cache.stream(question, openai_tokens):
+            parts.append(token)
+            yield events.sse_event('token', {'text': token})
+        yield events.sse_event('done', {'answer': ''.join(parts).strip()})
+    except Exception as e:
+        app.logger.error("Error streaming answer: %s", e)
+        yield events.sse_event('error', {'error': str(e)})
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/chatgpt/cache', methods=['GET'])
+@cross_origin(origins=['https://hello-belly-22577.web.app', 'http://localhost:5173', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def chatgpt_cache_stats():
+    return jsonify(answers.cache.snapshot()), 200
+
 @app.route('/api/youtube', methods=['GET'])
 @cross_origin(origins=['https://hello-belly-22577.web.app', 'http://localhost:5173', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def youtube_search():
     app.logger.info('youtube_search route accessed')
     query = request.args.get('query')
-    max_results = request.args.get('maxResults', 5)  # Default to 20 if not provided
+    max_results = request.args.get('maxResults', 5, type=int)
 
     if not query:
         app.logger.error("Query parameter is required")
         return jsonify({"error": "Query parameter is required"}), 400
+    if not 1 <= max_results <= MAX_YOUTUBE_RESULTS:
+        return jsonify({"error": f"maxResults must be between 1 and {MAX_YOUTUBE_RESULTS}"}), 400
 
-    app.logger.debug(f"Searching YouTube for query: {query}")
-    url = f'https://www.googleapis.com/youtube/v3/search?part=snippet&q={query}&maxResults={max_results}&key={YOUTUBE_API_KEY}&type=video'
-    response = requests.get(url)
-    videos = response.json().get('items', [])
-    
-    video_data = [
-        {
-            'id': video['id']['videoId'],
-            'title': video['snippet']['title'],
-            'description': video['snippet']['description']
-        }
-        for video in videos
-    ]
-    
-    app.logger.debug(f"Found videos: {video_data}")
+    app.logger.debug("Searching YouTube for query: %s", query)
+    try:
+        video_data = videos.video_search.search(query, max_results)
+    except videos.YouTubeError as e:
+        app.logger.error("YouTube search failed: %s", e)
+        return jsonify({"error": "YouTube search is unavailable"}), 502
+
+    app.logger.debug("Found videos: %s", video_data)
     return jsonify({"videos": video_data})
 
 @app.route('/api/classes', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def get_classes():
     try:
-        classes = Class.query.all()
-        return jsonify([class_instance.to_dict() for class_instance in classes])
+        return listcache.respond('classes', None, lambda: [class_instance.to_dict() for class_instance in Class.query.all()])
     except Exception as e:
-        app.logger.error(f"Error fetching classes: {e}")
+        app.logger.error("Error fetching classes: %s", e)
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/update_class/<class_id>', methods=['PUT'])
@@ -733,7 +784,7 @@ def update_class(class_id):
         db.session.commit()
         return jsonify(class_instance.to_dict())
     except Exception as e:
-        app.logger.error(f"Error updating class: {e}")
+        app.logger.error("Error updating class: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/delete_class/<class_id>', methods=['DELETE'])
@@ -748,7 +799,7 @@ def delete_class(class_id):
         db.session.commit()
         return jsonify({"message": "Class deleted successfully"})
     except Exception as e:
-        app.logger.error(f"Error deleting class: {e}")
+        app.logger.error("Error deleting class: %s", e)
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/add_class', methods=['POST'])
@@ -766,17 +817,14 @@ def add_class():
         db.session.commit()
         return jsonify(new_class.to_dict()), 201
     except Exception as e:
-        app.logger.error(f"Error adding class: {e}")
+        app.logger.error("Error adding class: %s", e)
         return jsonify({"error": str(e)}), 500
 
-google_maps_key = os.getenv('VITE_GOOGLE_MAPS_API_KEY')    
-print(f"Loaded Google Maps API key: {os.getenv('VITE_GOOGLE_MAPS_API_KEY')}")
-
 @app.route('/api/google_maps_key', methods=['GET', 'POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def get_google_maps_key():
     google_maps_key = os.getenv('VITE_GOOGLE_MAPS_API_KEY')
-    app.logger.debug(f"Fetching Google Maps API key: {google_maps_key}")
+    app.logger.debug("Fetching Google Maps API key: %s", google_maps_key)
     if not google_maps_key:
         app.logger.error("Google Maps API key not found")
         return jsonify({'error': 'Google Maps API key not found'}), 404
@@ -798,19 +846,36 @@ def update_doctor(doctor_id):
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def delete_doctor(doctor_id):
     try:
-        TimeSlot.query.filter(TimeSlot.doctor_id == doctor_id).delete()
-
-        Appointment.query.filter(Appointment.doctor_id == doctor_id).delete()
-
-        Doctor.query.filter(Doctor.id == doctor_id).delete()
-
+        doctor = db.session.get(Doctor, doctor_id)
+        if not doctor:
+            return jsonify({"error": "Doctor not found"}), 404
+
+        # A doctor can own years of slots and appointments, so the rows are
+        # removed in batches by a background job instead of in this request.
+        # Flagging the doctor first hides them and stops new bookings meanwhile.
+        doctor.deleting = True
+        job = jobs.find_active('delete_doctor', doctor_id=doctor_id)
+        if job is None:
+            job = jobs.enqueue('delete_doctor', doctor_id=doctor_id)
         db.session.commit()
-        
-        return jsonify({"message": "Doctor and all associated appointments and time slots deleted successfully."}), 200
+
+        return jsonify({
+            "message": "Doctor deletion started.",
+            "job": job.to_dict(),
+            "status_url": f"/api/jobs/{job.id}"
+        }), 202
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
-    
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
 @app.route('/api/files', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def list_files():
@@ -818,27 +883,91 @@ def list_files():
     if not doctor_id:
         return jsonify({'error': 'Doctor ID is required'}), 400
 
-    files = UploadedFile.query.filter_by(doctor_id=doctor_id).all()
-    file_paths = [{'id': f.id, 'filename': f.filename, 'file_path': f.file_path} for f in files]
-    return jsonify({'files': file_paths}), 200
+    return listcache.respond('files', doctor_id, lambda: {'files': [
+        f.to_dict() for f in UploadedFile.query.filter_by(doctor_id=doctor_id)
+    ]})
 
 @app.route('/api/upload', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
+    # The body is streamed to disk while it is hashed; never touch request.files here
+    try:
+        form, filename, content_type, part = uploads.receive_file(request, 'file', allowed_file)
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    doctor_id = form.get('doctor_id') or request.args.get('doctor_id')
+    if not doctor_id:
+        part.discard()
+        return jsonify({'error': 'Doctor ID is required'}), 400
+
+    record = uploads.store_file(part.path, part.sha256, part.size, filename, doctor_id, content_type)
+    db.session.commit()
+    return jsonify({'filePath': record.public_name, 'file': record.to_dict()}), 200
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        return jsonify({'filePath': filename}), 200
+@app.route('/api/upload/sessions', methods=['POST'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def create_upload_session():
+    data = request.json
+    doctor_id = data.get('doctor_id')
+    filename = data.get('filename')
+    size = data.get('size')
+    if not doctor_id or not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Doctor ID, filename and a positive size are required'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
 
-    return jsonify({'error': 'File type not allowed'}), 400
+    try:
+        upload_session = uploads.open_session(doctor_id, filename, size, data.get('content_type'))
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    db.session.commit()
+    return jsonify({'session': upload_session.to_dict(), 'chunk_size': app.config['UPLOAD_CHUNK_SIZE']}), 201
+
+
+@app.route('/api/upload/sessions/<session_id>', methods=['GET'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def get_upload_session(session_id):
+    upload_session = db.session.get(UploadSession, session_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload session not found'}), 404
+    return jsonify({'session': upload_session.to_dict()}), 200, {uploads.OFFSET_HEADER: str(upload_session.received)}
+
+
+@app.route('/api/upload/sessions/<session_id>', methods=['PATCH'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def upload_chunk(session_id):
+    upload_session = db.session.get(UploadSession, session_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload session not found'}), 404
+    offset = request.headers.get(uploads.OFFSET_HEADER, type=int)
+    if offset is None:
+        return jsonify({'error': f'{uploads.OFFSET_HEADER} header is required'}), 400
+
+    try:
+        record = uploads.append_chunk(upload_session, offset, request.stream, request.content_length)
+    except uploads.UploadError as e:
+        db.session.rollback()
+        current = db.session.get(UploadSession, session_id)
+        headers = {uploads.OFFSET_HEADER: str(current.received)} if current else {}
+        return jsonify({'error': str(e), 'offset': current.received if current else None}), e.status, headers
+    db.session.commit()
+
+    if record is None:
+        return jsonify({'session': upload_session.to_dict()}), 200, {uploads.OFFSET_HEADER: str(upload_session.received)}
+    return jsonify({'filePath': record.public_name, 'file': record.to_dict()}), 201
+
+
+@app.route('/api/upload/sessions/<session_id>', methods=['DELETE'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def cancel_upload_session(session_id):
+    upload_session = db.session.get(UploadSession, session_id)
+    if not upload_session:
+        return jsonify({'error': 'Upload session not found'}), 404
+    uploads.cancel_session(upload_session)
+    db.session.commit()
+    return jsonify({'message': 'Upload canceled'}), 200
 
 
 @app.route('/api/rename_file', methods=['PUT'])
@@ -853,6 +982,12 @@ def rename_file():
     if not file_record:
         return jsonify({'error': 'File not found'}), 404
 
+    # Content-addressed files keep their blob; only the display name changes
+    if file_record.sha256 is not None:
+        file_record.filename = secure_filename(new_file_name)
+        db.session.commit()
+        return jsonify({'message': 'File renamed successfully'}), 200
+
     old_path = file_record.file_path
     new_file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(new_file_name))
 
@@ -876,19 +1011,16 @@ def delete_file():
     if not file_record:
         return jsonify({'error': 'File not found'}), 404
 
-    try:
-        os.remove(file_record.file_path)
-        db.session.delete(file_record)
-        db.session.commit()
-        return jsonify({'message': 'File deleted successfully'}), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    # The file itself is removed once the commit succeeds, and only if no other upload shares it
+    uploads.release_file(file_record)
+    db.session.commit()
+    return jsonify({'message': 'File deleted successfully'}), 200
     
 @app.route('/api/uploads/<filename>')
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def uploaded_file(filename):
-    app.logger.debug(f"Serving file: {filename}")
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    app.logger.debug("Serving file: %s", filename)
+    return uploads.deliver(filename)
 
 @app.route('/api/sync_doctors', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
@@ -905,74 +1037,104 @@ def sync_doctors():
     
 @app.route('/api/search_users', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(3)
 def search_users():
-    term = request.args.get('term', '').lower()
-    results = []
-
-    if term:
-        users = User.query.filter(User.name.ilike(f'%{term}%') | User.email.ilike(f'%{term}%')).all()
-        doctors = Doctor.query.filter(Doctor.name.ilike(f'%{term}%') | Doctor.email.ilike(f'%{term}%')).all()
-
-        results = [{'id': user.id, 'name': user.name, 'email': user.email, 'role': 'user'} for user in users]
-        results += [{'id': doctor.id, 'name': doctor.name, 'email': doctor.email, 'role': 'doctor'} for doctor in doctors]
+    term = request.args.get('term', '')
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return jsonify({'error': f'limit must be between 1 and {MAX_SEARCH_RESULTS}'}), 400
 
+    results = search.search(term, limit) if term.strip() else []
     return jsonify({'results': results})
 
 @app.route('/api/chats', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(3)
 def get_chats():
     user_id = request.args.get('userId')
     if not user_id:
         return jsonify({'error': 'User ID is required'}), 400
 
-    sent_messages = Message.query.filter_by(sender_id=user_id).order_by(Message.timestamp.desc()).all()
-    received_messages = Message.query.filter_by(receiver_id=user_id).order_by(Message.timestamp.desc()).all()
-
-    chat_map = {}
-    for message in sent_messages + received_messages:
-        chat_id = message.thread_id
-        if chat_id not in chat_map:
-            other_user_id = message.receiver_id if message.sender_id == user_id else message.sender_id
-            other_user = User.query.get(other_user_id) or Doctor.query.get(other_user_id)
-            chat_map[chat_id] = {
-                'id': chat_id,
-                'otherUserName': other_user.name if other_user else 'Unknown',
-                'receiverId': message.receiver_id,
-                'timestamp': message.timestamp,
-                'subject': message.subject,
-                'lastMessage': message.message
-            }
-        else:
-            chat_map[chat_id]['timestamp'] = max(chat_map[chat_id]['timestamp'], message.timestamp)
-
-    sorted_chats = sorted(chat_map.values(), key=lambda x: x['timestamp'], reverse=True)
-    return jsonify({'chats': sorted_chats})
+    limit = request.args.get('limit', 50, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not 1 <= limit <= MAX_CHATS_PAGE or offset < 0:
+        return jsonify({'error': f'limit must be between 1 and {MAX_CHATS_PAGE}'}), 400
+
+    chats = inbox.chats_for(user_id, limit, offset)
+    other_ids = [chat.user2_id if chat.user1_id == user_id else chat.user1_id for chat in chats]
+    names = inbox.resolve_names(other_ids)
+
+    results = []
+    for chat, other_user_id in zip(chats, other_ids):
+        results.append({
+            'id': chat.id,
+            'otherUserName': names.get(other_user_id, 'Unknown'),
+            'receiverId': other_user_id,
+            'timestamp': chat.last_timestamp,
+            'subject': chat.subject,
+            'lastMessage': chat.last_message,
+            'unreadCount': chat.user1_unread if chat.user1_id == user_id else chat.user2_unread
+        })
+
+    response = {'chats': results}
+    if len(chats) == limit:
+        response['nextOffset'] = offset + limit
+    return jsonify(response)
+
+@app.route('/api/chats/<thread_id>/read', methods=['POST'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def mark_chat_read(thread_id):
+    user_id = request.args.get('userId')
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    inbox.mark_read(thread_id, user_id)
+    db.session.commit()
+    return jsonify({'message': 'Chat marked as read'})
 
 @app.route('/api/messages', methods=['GET'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(3)
 def get_messages():
     thread_id = request.args.get('threadId')
     if not thread_id:
         return jsonify({'error': 'Thread ID is required'}), 400
 
-    messages = Message.query.filter_by(thread_id=thread_id).order_by(Message.timestamp.asc()).all()
+    limit = request.args.get('limit', 50, type=int)
+    before = request.args.get('before')
+    after = request.args.get('after')
+    if not 1 <= limit <= MAX_MESSAGES_PAGE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_MESSAGES_PAGE}'}), 400
+    if before and after:
+        return jsonify({'error': 'Use either before or after, not both'}), 400
+
+    try:
+        messages, has_older = inbox.messages_page(thread_id, limit, before=before, after=after)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    names = inbox.resolve_names(message.sender_id for message in messages)
     messages_data = []
     for message in messages:
-        sender = User.query.get(message.sender_id) or Doctor.query.get(message.sender_id)
         messages_data.append({
             'id': message.id,
             'senderId': message.sender_id,
-            'senderName': sender.name if sender else 'Unknown',
+            'senderName': names.get(message.sender_id, 'Unknown'),
             'message': message.message,
             'timestamp': message.timestamp,
             'fileUrl': message.file_url,
             'fileName': message.file_name,
         })
 
-    return jsonify({'messages': messages_data})
+    return jsonify({
+        'messages': messages_data,
+        'prevCursor': inbox.message_cursor(messages[0]) if messages and has_older else None,
+        'nextCursor': inbox.message_cursor(messages[-1]) if messages else after,
+    })
 
 @app.route('/api/messages', methods=['POST'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+@query_budget(4)
 def add_message():
     data = request.json
     sender_id = data['senderId']
@@ -995,16 +1157,53 @@ def add_message():
         file_name=file_name,
     )
     db.session.add(new_message)
+    inbox.record_message(new_message)
+
+    sender_name = inbox.resolve_names([sender_id]).get(sender_id, 'Unknown')
+    message_event = {
+        'id': new_message.id,
+        'threadId': thread_id,
+        'senderId': sender_id,
+        'senderName': sender_name,
+        'message': message,
+        'timestamp': new_message.timestamp.isoformat(),
+        'fileUrl': file_url,
+        'fileName': file_name,
+        'cursor': inbox.message_cursor(new_message),
+    }
+    chat_event = {
+        'id': thread_id,
+        'subject': subject,
+        'lastMessage': message,
+        'timestamp': new_message.timestamp.isoformat(),
+        'senderId': sender_id,
+    }
+    for participant_id in {sender_id, receiver_id}:
+        events.publish(participant_id, 'message', message_event)
+        events.publish(participant_id, 'chat', chat_event)
     db.session.commit()
 
     return jsonify({'message': 'Message added successfully'})
 
+@app.route('/api/stream', methods=['GET'])
+@cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
+def stream_events():
+    user_id = request.args.get('userId')
+    if not user_id:
+        return jsonify({'error': 'User ID is required'}), 400
+
+    subscription = events.broker.subscribe(user_id)
+    stream = events.sse_stream(subscription, app.config['SSE_HEARTBEAT_SECONDS'], app.config['SSE_MAX_DURATION'])
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/messages/<thread_id>', methods=['DELETE'])
 @cross_origin(origins=['http://localhost:5173', 'https://hello-belly-22577.web.app', 'https://hello-belly-22577.firebaseapp.com/'], supports_credentials=True)
 def delete_chat(thread_id):
-    messages = Message.query.filter_by(thread_id=thread_id).all()
-    for message in messages:
-        db.session.delete(message)
+    Message.query.filter_by(thread_id=thread_id).delete()
+    Chat.query.filter_by(id=thread_id).delete()
 
     db.session.commit()
 
@@ -0,0 +1,416 @@
+"""Doctor availability computed from weekly working hours.
+
+Only booked intervals are stored, as ``TimeSlot`` rows with
+``is_available=False`` (appointments and time off). A slot is free when it
+falls inside the doctor's working hours for that weekday and no booked row
+starts at the same time. Doctors without a template use
+``DEFAULT_WORKING_HOURS``, so creating a doctor writes nothing here.
+
+Read paths go through ``occupancy``, an in-process bitmap index with one
+48-bit mask per doctor per day. Writes made through this module are applied
+to the index when the surrounding transaction commits; entries written by
+other worker processes are picked up once ``OCCUPANCY_TTL`` expires. Booking
+claims (``claim_slot``) always go to the database.
+"""
+import heapq
+import json
+import threading
+import time as _time
+from array import array
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from sqlalchemy import (
+    DateTime, and_, bindparam, delete, event, exists, false, func, literal, or_, select
+)
+from sqlalchemy.orm import Session
+
+from app import db
+from app.booking import dialect_insert
+from app.models import Appointment, Doctor, TimeSlot, WorkingHours
+
+SLOT_MINUTES = 30
+SLOT_LENGTH = timedelta(minutes=SLOT_MINUTES)
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DEFAULT_WORKING_HOURS = {weekday: [(time(9, 0), time(17, 0))] for weekday in range(7)}
+
+
+def slot_index(moment):
+    return (moment.hour * 60 + moment.minute) // SLOT_MINUTES
+
+
+def mask_to_slots(day, mask):
+    midnight = datetime.combine(day, time())
+    return [midnight + SLOT_LENGTH * bit for bit in range(SLOTS_PER_DAY) if mask >> bit & 1]
+
+
+def get_working_hours(doctor_id):
+    """Return ``{weekday: [(start, end), ...]}`` for a doctor."""
+    rows = WorkingHours.query.filter_by(doctor_id=doctor_id).order_by(
+        WorkingHours.weekday, WorkingHours.start_time
+    ).all()
+    if not rows:
+        return DEFAULT_WORKING_HOURS
+    template = {}
+    for row in rows:
+        template.setdefault(row.weekday, []).append((row.start_time, row.end_time))
+    return template
+
+
+def set_working_hours(doctor_id, intervals):
+    """Replace a doctor's template with ``[(weekday, start, end), ...]``. The caller commits."""
+    WorkingHours.query.filter_by(doctor_id=doctor_id).delete()
+    for weekday, start, end in intervals:
+        if not 0 <= weekday <= 6 or start >= end:
+            raise ValueError(f"Invalid working hours: {weekday} {start}-{end}")
+        if start.minute % SLOT_MINUTES or end.minute % SLOT_MINUTES:
+            raise ValueError(f"Working hours must fall on {SLOT_MINUTES}-minute boundaries")
+        db.session.add(WorkingHours(doctor_id=doctor_id, weekday=weekday, start_time=start, end_time=end))
+    _pending_doctors().add(doctor_id)
+
+
+def working_slots(template, day):
+    """All slot start times the template offers on ``day``."""
+    slots = []
+    for start, end in template.get(day.weekday(), []):
+        current = datetime.combine(day, start)
+        end_time = datetime.combine(day, end)
+        while current + SLOT_LENGTH <= end_time:
+            slots.append(current)
+            current += SLOT_LENGTH
+    return slots
+
+
+def template_masks(template):
+    """One bitmask per weekday (index 0 = Monday) of the slots the template offers."""
+    masks = []
+    for weekday in range(7):
+        mask = 0
+        for start, end in template.get(weekday, []):
+            for bit in range(slot_index(start), slot_index(end)):
+                mask |= 1 << bit
+        masks.append(mask)
+    return masks
+
+
+def booked_starts(doctor_id, start, end):
+    rows = db.session.query(TimeSlot.start_time).filter(
+        TimeSlot.doctor_id == doctor_id,
+        TimeSlot.is_available == False,
+        TimeSlot.start_time >= start,
+        TimeSlot.start_time < end
+    ).all()
+    return {row.start_time for row in rows}
+
+
+def available_slots(doctor_id, day):
+    return mask_to_slots(day, occupancy.free_masks(doctor_id, day, 1)[0])
+
+
+def available_slots_range(doctor_id, first_day, days):
+    """``[(day, [slot, ...]), ...]`` for ``days`` consecutive days starting at ``first_day``."""
+    masks = occupancy.free_masks(doctor_id, first_day, days)
+    return [(first_day + timedelta(days=offset), mask_to_slots(first_day + timedelta(days=offset), mask))
+            for offset, mask in enumerate(masks)]
+
+
+def next_available(start, days, limit, doctor_ids=None):
+    """Earliest ``limit`` free ``(slot, doctor_id)`` pairs at or after ``start``.
+
+    The window is read in growing chunks (the first day, the next 6 to
+    complete the week, then the rest) with one bookings query per chunk
+    covering every doctor, a range scan on the index that leads with
+    ``start_time``. Within a chunk the per-doctor streams of free
+    slots, already in time order, are k-way merged with a heap, so the
+    search stops as soon as ``limit`` slots are found.
+    """
+    first_day = start.date()
+    all_doctors = doctor_ids is None
+    if all_doctors:
+        doctor_ids = [row.id for row in db.session.query(Doctor.id).filter(Doctor.deleting == false())]
+    if not doctor_ids:
+        return []
+
+    hours = WorkingHours.query
+    if not all_doctors:
+        hours = hours.filter(WorkingHours.doctor_id.in_(doctor_ids))
+    templates = {}
+    for row in hours:
+        templates.setdefault(row.doctor_id, {}).setdefault(row.weekday, []).append((row.start_time, row.end_time))
+    default_masks = template_masks(DEFAULT_WORKING_HOURS)
+    masks = {doctor_id: template_masks(template) for doctor_id, template in templates.items()}
+
+    def chunk_bookings(chunk_first, chunk_days):
+        chunk_start = datetime.combine(chunk_first, time())
+        rows = db.session.query(TimeSlot.doctor_id, TimeSlot.start_time).filter(
+            TimeSlot.is_available == False,
+            TimeSlot.start_time >= chunk_start,
+            TimeSlot.start_time < chunk_start + timedelta(days=chunk_days)
+        )
+        if not all_doctors:
+            rows = rows.filter(TimeSlot.doctor_id.in_(doctor_ids))
+        booked = {}
+        for row in rows:
+            key = (row.doctor_id, row.start_time.toordinal())
+            booked[key] = booked.get(key, 0) | 1 << slot_index(row.start_time)
+        return booked
+
+    def doctor_slots(doctor_id, chunk_first, chunk_days, booked):
+        weekday_masks = masks.get(doctor_id, default_masks)
+        for offset in range(chunk_days):
+            day = chunk_first + timedelta(days=offset)
+            free = weekday_masks[day.weekday()] & ~booked.get((doctor_id, day.toordinal()), 0)
+            for slot in mask_to_slots(day, free):
+                if slot >= start:
+                    yield slot, doctor_id
+
+    found = []
+    offset = 0
+    for chunk_days in (1, 6, days):
+        chunk_days = min(chunk_days, days - offset)
+        if chunk_days <= 0:
+            break
+        chunk_first = first_day + timedelta(days=offset)
+        booked = chunk_bookings(chunk_first, chunk_days)
+        streams = (doctor_slots(doctor_id, chunk_first, chunk_days, booked) for doctor_id in doctor_ids)
+        found.extend(islice(heapq.merge(*streams), limit - len(found)))
+        if len(found) >= limit:
+            break
+        offset += chunk_days
+    return found
+
+
+def is_working_slot(doctor_id, start):
+    return start in working_slots(get_working_hours(doctor_id), start.date())
+
+
+def claim_slot(doctor_id, start, appointment_id):
+    """Atomically book ``start`` for ``appointment_id``. The caller commits.
+
+    The INSERT only succeeds if no booked row exists for the same doctor and
+    start time (enforced by ``uq_time_slot_doctor_id_start_time``); a
+    concurrent claim either waits for the other transaction or loses.
+    Returns False when the slot is already taken or the doctor is being deleted.
+    """
+    db.session.flush()
+    row = select(literal(doctor_id), literal(start), false(), literal(appointment_id)).where(_bookable(doctor_id))
+    stmt = dialect_insert(TimeSlot).from_select(
+        ['doctor_id', 'start_time', 'is_available', 'appointment_id'], row
+    ).on_conflict_do_nothing(index_elements=['doctor_id', 'start_time'])
+    claimed = db.session.execute(stmt.returning(TimeSlot.id)).first() is not None
+    if claimed:
+        _pending_changes().append((doctor_id, start, True))
+    return claimed
+
+
+def book_range(doctor_id, start, end, appointment_id):
+    """Claim every slot in ``[start, end)`` for ``appointment_id``. The caller commits.
+
+    A single ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` claims the free
+    slots, however long the range is; rows already held by another
+    appointment are left alone. Returns False when any slot in the range was
+    taken or the doctor is being deleted, in which case the caller must roll
+    back.
+    """
+    starts = []
+    current_time = start
+    while current_time < end:
+        starts.append(current_time)
+        current_time += SLOT_LENGTH
+    if not starts:
+        return True
+
+    db.session.flush()
+    claimed = db.session.execute(_claim_starts(doctor_id, starts, appointment_id)).scalars().all()
+    _pending_changes().extend((doctor_id, slot, True) for slot in claimed)
+    return len(claimed) == len(starts)
+
+
+def _claim_starts(doctor_id, starts, appointment_id):
+    """``INSERT`` claiming a booked row at each of ``starts``, returning the ones it got."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import ARRAY
+
+        start_time = func.unnest(bindparam('starts', starts, type_=ARRAY(DateTime))).column_valued()
+    else:
+        # SQLite has no array parameters; expand a JSON list in the same format SQLAlchemy stores
+        values = func.json_each(json.dumps([slot.strftime('%Y-%m-%d %H:%M:%S.%f') for slot in starts]))
+        start_time = values.table_valued('value').c.value
+    # Besides the doctor check, a WHERE keeps SQLite from reading ON CONFLICT as a join constraint
+    rows = select(literal(doctor_id), start_time, false(), literal(appointment_id)).where(_bookable(doctor_id))
+    return dialect_insert(TimeSlot).from_select(
+        ['doctor_id', 'start_time', 'is_available', 'appointment_id'], rows
+    ).on_conflict_do_nothing(index_elements=['doctor_id', 'start_time']).returning(TimeSlot.start_time)
+
+
+def _bookable(doctor_id):
+    """Condition that holds while ``doctor_id`` exists and is not being deleted."""
+    return exists().where(Doctor.id == doctor_id, Doctor.deleting == false())
+
+
+def overlapping(doctor_id, start, end, exclude=None):
+    """Query for the doctor's appointments whose interval intersects ``[start, end)``.
+
+    Appointments without an ``end_date`` last one slot.
+    """
+    query = Appointment.query.filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.date < end,
+        or_(
+            Appointment.end_date > start,
+            and_(Appointment.end_date.is_(None), Appointment.date > start - SLOT_LENGTH),
+        ),
+    )
+    if exclude is not None:
+        query = query.filter(Appointment.id != exclude)
+    return query
+
+
+def release_slots(appointment_id):
+    """Drop every booked interval held by an appointment. The caller commits."""
+    released = db.session.execute(
+        delete(TimeSlot).where(TimeSlot.appointment_id == appointment_id)
+        .returning(TimeSlot.doctor_id, TimeSlot.start_time)
+    ).all()
+    _pending_changes().extend((row.doctor_id, row.start_time, False) for row in released)
+
+
+def forget_doctor(doctor_id):
+    """Drop a doctor from the index once the current transaction commits."""
+    _pending_doctors().add(doctor_id)
+
+
+class _DoctorCalendar:
+    """Contiguous run of day masks for one doctor, indexed by ``ordinal - base``."""
+
+    def __init__(self, ordinal):
+        self.base = ordinal
+        self.masks = array('Q')
+        self.loaded_at = array('d')
+
+    def _cover(self, first, last):
+        if not self.masks:
+            self.base = first
+        if first < self.base:
+            missing = self.base - first
+            self.masks = array('Q', bytes(8 * missing)) + self.masks
+            self.loaded_at = array('d', bytes(8 * missing)) + self.loaded_at
+            self.base = first
+        grow = last - self.base + 1 - len(self.masks)
+        if grow > 0:
+            self.masks.extend(array('Q', bytes(8 * grow)))
+            self.loaded_at.extend(array('d', bytes(8 * grow)))
+
+    def get(self, ordinal, fresh_after):
+        offset = ordinal - self.base
+        if 0 <= offset < len(self.masks) and self.loaded_at[offset] > fresh_after:
+            return self.masks[offset]
+        return None
+
+    def put(self, ordinal, mask, loaded_at):
+        self._cover(ordinal, ordinal)
+        self.masks[ordinal - self.base] = mask
+        self.loaded_at[ordinal - self.base] = loaded_at
+
+    def update(self, ordinal, bit, booked):
+        offset = ordinal - self.base
+        if 0 <= offset < len(self.masks) and self.loaded_at[offset]:
+            if booked:
+                self.masks[offset] |= 1 << bit
+            else:
+                self.masks[offset] &= ~(1 << bit)
+
+
+class OccupancyIndex:
+    """Per-doctor, per-day occupancy bitmaps rebuilt lazily from ``TimeSlot``.
+
+    Bit ``n`` of a day mask is the half hour starting ``n * 30`` minutes after
+    midnight. Missing or expired days are loaded for a whole range with a
+    single query.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._calendars = {}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def free_masks(self, doctor_id, first_day, days):
+        templates = self._template_masks(doctor_id)
+        occupied = self.occupied_masks(doctor_id, first_day, days)
+        return [templates[(first_day + timedelta(days=offset)).weekday()] & ~mask
+                for offset, mask in enumerate(occupied)]
+
+    def occupied_masks(self, doctor_id, first_day, days):
+        first = first_day.toordinal()
+        fresh_after = _time.monotonic() - self.ttl
+        with self._lock:
+            calendar = self._calendars.get(doctor_id)
+            masks = [calendar.get(first + offset, fresh_after) if calendar else None for offset in range(days)]
+        missing = [offset for offset, mask in enumerate(masks) if mask is None]
+        if not missing:
+            return masks
+
+        loaded_at = _time.monotonic()
+        load_first = first_day + timedelta(days=missing[0])
+        load_days = missing[-1] - missing[0] + 1
+        loaded = [0] * load_days
+        range_start = datetime.combine(load_first, time())
+        for start in booked_starts(doctor_id, range_start, range_start + timedelta(days=load_days)):
+            loaded[(start.date() - load_first).days] |= 1 << slot_index(start)
+
+        with self._lock:
+            calendar = self._calendars.setdefault(doctor_id, _DoctorCalendar(first))
+            for offset in range(load_days):
+                calendar.put(load_first.toordinal() + offset, loaded[offset], loaded_at)
+        for offset in missing:
+            masks[offset] = loaded[offset - missing[0]]
+        return masks
+
+    def _template_masks(self, doctor_id):
+        now = _time.monotonic()
+        cached = self._templates.get(doctor_id)
+        if cached and cached[0] > now - self.ttl:
+            return cached[1]
+        masks = template_masks(get_working_hours(doctor_id))
+        self._templates[doctor_id] = (now, masks)
+        return masks
+
+    def apply(self, changes):
+        with self._lock:
+            for doctor_id, start, booked in changes:
+                calendar = self._calendars.get(doctor_id)
+                if calendar:
+                    calendar.update(start.toordinal(), slot_index(start), booked)
+
+    def forget(self, doctor_ids):
+        with self._lock:
+            for doctor_id in doctor_ids:
+                self._calendars.pop(doctor_id, None)
+                self._templates.pop(doctor_id, None)
+
+
+def _pending_changes():
+    return db.session.info.setdefault('occupancy_changes', [])
+
+
+def _pending_doctors():
+    return db.session.info.setdefault('occupancy_doctors', set())
+
+
+occupancy = None
+
+
+def init_app(app):
+    global occupancy
+    occupancy = OccupancyIndex(app.config['OCCUPANCY_TTL'])
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply_occupancy_changes(session):
+        occupancy.apply(session.info.pop('occupancy_changes', []))
+        occupancy.forget(session.info.pop('occupancy_doctors', set()))
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_occupancy_changes(session):
+        session.info.pop('occupancy_changes', None)
+        session.info.pop('occupancy_doctors', None)
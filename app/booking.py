@@ -0,0 +1,69 @@
+"""Helpers that let a booking run as one transaction.
+
+``upsert_user`` and ``availability.claim_slot`` use INSERT ... ON CONFLICT so
+concurrent requests never have to read-then-write, and idempotency keys let
+clients retry a booking without creating a duplicate.
+"""
+import json
+
+from flask import request
+from sqlalchemy import select
+
+from app import db, search
+from app.models import IdempotencyKey, User
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def dialect_insert(model):
+    """``INSERT`` construct with ``on_conflict_*`` support for the configured database."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def upsert_user(new_id, email, name, update_name=True):
+    """Return the id of the user with ``email``, creating it as ``new_id`` if needed.
+
+    The search index is only refreshed when a user is created or renamed;
+    a returning patient with the same name costs no re-tokenizing.
+    """
+    stmt = dialect_insert(User).values(id=new_id, email=email, name=name)
+    if update_name:
+        # Only a real rename updates the row, so a returned id means something changed;
+        # the conflicting row is locked either way
+        stmt = stmt.on_conflict_do_update(index_elements=['email'], set_={'name': stmt.excluded.name},
+                                          where=User.name.is_distinct_from(stmt.excluded.name))
+        user_id = db.session.execute(stmt.returning(User.id)).scalar()
+        if user_id is None:
+            return db.session.execute(select(User.id).where(User.email == email)).scalar_one()
+        search.mark_dirty('user', user_id)
+        return user_id
+
+    # A no-op update still locks the row and lets RETURNING report the existing id
+    stmt = stmt.on_conflict_do_update(index_elements=['email'], set_={'email': stmt.excluded.email})
+    user_id = db.session.execute(stmt.returning(User.id)).scalar_one()
+    if user_id == new_id:
+        search.mark_dirty('user', user_id)
+    return user_id
+
+
+def idempotency_key():
+    return request.headers.get(IDEMPOTENCY_HEADER)
+
+
+def stored_response(key, endpoint):
+    """The ``(body, status)`` recorded for ``key``, or None if it has not been used yet."""
+    record = db.session.get(IdempotencyKey, key)
+    if record is None:
+        return None
+    if record.endpoint != endpoint:
+        return {'error': 'Idempotency key was already used for a different request'}, 422
+    return json.loads(record.response), record.status_code
+
+
+def remember_response(key, endpoint, body, status_code):
+    """Stage the response for ``key`` in the current transaction."""
+    db.session.add(IdempotencyKey(key=key, endpoint=endpoint, status_code=status_code, response=json.dumps(body)))
@@ -0,0 +1,63 @@
+"""Lazily constructed third-party API clients.
+
+SDKs such as ``openai`` are slow to import, so nothing here is imported or
+built until a request first needs it: ``clients.get('openai')`` creates the
+client on first use (once per process) and returns the same instance after
+that. Worker boot only pays for Flask and SQLAlchemy.
+"""
+import threading
+
+
+class ClientRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._clients.pop(name, None)
+
+    def get(self, name):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = self._factories[name]()
+        return client
+
+    def created(self):
+        return sorted(self._clients)
+
+
+def _openai(config):
+    from openai import OpenAI
+
+    return OpenAI(api_key=config['OPENAI_API_KEY'], base_url=config['OPENAI_BASE_URL'], timeout=config['OPENAI_TIMEOUT'])
+
+
+def _youtube(config):
+    import requests
+
+    return requests.Session()
+
+
+def _sendinblue(config):
+    import sib_api_v3_sdk
+
+    configuration = sib_api_v3_sdk.Configuration()
+    configuration.api_key['api-key'] = config['SENDINBLUE_API_KEY']
+    if config['SENDINBLUE_API_URL']:
+        configuration.host = config['SENDINBLUE_API_URL']
+    return sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+
+
+clients = ClientRegistry()
+
+
+def init_app(app):
+    clients.register('openai', lambda: _openai(app.config))
+    clients.register('youtube', lambda: _youtube(app.config))
+    clients.register('sendinblue', lambda: _sendinblue(app.config))
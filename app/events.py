@@ -0,0 +1,187 @@
+"""In-process pub/sub for pushing new messages to connected clients.
+
+``publish`` stages an event for a user in the current transaction; once it
+commits the event goes to the configured backend. The ``local`` backend
+delivers straight to subscribers in this process. The ``redis`` backend
+publishes through Redis pub/sub so every worker process receives it and fans
+it out to its own subscribers. ``local`` is only correct with a single
+process; gunicorn.conf.py defaults to ``redis`` otherwise and refuses to
+start with ``local``.
+
+Each open stream blocks its worker for up to ``SSE_MAX_DURATION``, so
+streams are meant to be served by a separate gevent pool (``GUNICORN_POOL=stream``)
+rather than by the threads that handle ordinary requests.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, broker, user_id, maxsize):
+        self.broker = broker
+        self.user_id = user_id
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # A client this far behind reconnects and reloads rather than pinning memory
+            self.broker.unsubscribe(self)
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(CLOSED)
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBackend:
+    def __init__(self, config):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, user_id, payload):
+        # Nothing has subscribed in this process yet, so nobody to deliver to
+        if self._deliver is not None:
+            self._deliver(user_id, payload)
+
+
+class RedisBackend:
+    def __init__(self, config):
+        import redis
+
+        self.prefix = config['EVENTS_CHANNEL_PREFIX']
+        self.client = redis.Redis.from_url(config['REDIS_URL'])
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, deliver):
+        # One listener thread per worker process, restarted after fork
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._deliver = deliver
+            thread = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def publish(self, user_id, payload):
+        self.client.publish(self.prefix + user_id, json.dumps(payload, default=str))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for message in pubsub.listen():
+                    user_id = message['channel'].decode()[len(self.prefix):]
+                    self._deliver(user_id, json.loads(message['data']))
+            except Exception:
+                time.sleep(1)
+
+
+BACKENDS = {
+    'local': LocalBackend,
+    'redis': RedisBackend,
+}
+
+
+class EventBroker:
+    def __init__(self, config):
+        self.config = config
+        self.backend = BACKENDS[config['EVENTS_BACKEND']](config)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        self.backend.start(self.deliver)
+        subscription = Subscription(self, user_id, self.config['SSE_QUEUE_SIZE'])
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event_type, data):
+        self.backend.publish(user_id, {'type': event_type, 'data': data})
+
+    def deliver(self, user_id, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(payload)
+
+
+def publish(user_id, event_type, data):
+    """Send ``data`` to ``user_id``'s open streams once the current transaction commits."""
+    db.session.info.setdefault('pending_events', []).append((user_id, event_type, data))
+
+
+def sse_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_stream(subscription, heartbeat, max_duration):
+    """Yield server-sent events for a subscription until it closes or ``max_duration`` passes.
+
+    Streams are capped so a worker thread is never pinned indefinitely; the
+    browser's EventSource reconnects on its own after ``retry`` milliseconds.
+    """
+    deadline = time.monotonic() + max_duration
+    try:
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            item = subscription.get(timeout=heartbeat)
+            if item is CLOSED:
+                break
+            if item is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield sse_event(item['type'], item['data'])
+    finally:
+        subscription.close()
+
+
+broker = None
+
+
+def init_app(app):
+    global broker
+    broker = EventBroker(app.config)
+
+    @event.listens_for(Session, 'after_commit')
+    def _publish_pending_events(session):
+        for user_id, event_type, data in session.info.pop('pending_events', []):
+            try:
+                broker.publish(user_id, event_type, data)
+            except Exception:
+                app.logger.exception("Failed to publish %s event", event_type)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_pending_events(session):
+        session.info.pop('pending_events', None)
@@ -0,0 +1,143 @@
+"""Per-thread inbox summaries kept in the ``Chat`` table.
+
+Every new message upserts its thread's row (last message, timestamp and the
+unread counter of the receiver) in the same transaction as the message, so
+the inbox is a single indexed read instead of a scan of message history.
+Thread messages are paged by keyset so long conversations stay cheap too.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, select, union_all, update
+
+from app import db
+from app.booking import dialect_insert
+from app.models import Chat, Doctor, Message, User
+
+
+def record_message(message):
+    """Fold ``message`` into its thread summary. The caller commits."""
+    stmt = dialect_insert(Chat).values(
+        id=message.thread_id,
+        user1_id=message.sender_id,
+        user2_id=message.receiver_id,
+        subject=message.subject,
+        last_message=message.message,
+        last_timestamp=message.timestamp,
+        user1_unread=0,
+        user2_unread=1
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=['id'], set_={
+        'subject': func.coalesce(stmt.excluded.subject, Chat.subject),
+        'last_message': stmt.excluded.last_message,
+        'last_timestamp': stmt.excluded.last_timestamp,
+        'user1_unread': Chat.user1_unread + case((Chat.user1_id == message.receiver_id, 1), else_=0),
+        'user2_unread': Chat.user2_unread + case((Chat.user2_id == message.receiver_id, 1), else_=0),
+    })
+    db.session.execute(stmt)
+
+
+def mark_read(thread_id, user_id):
+    """Reset ``user_id``'s unread counter on a thread. The caller commits."""
+    db.session.execute(
+        update(Chat).where(Chat.id == thread_id).values(
+            user1_unread=case((Chat.user1_id == user_id, 0), else_=Chat.user1_unread),
+            user2_unread=case((Chat.user2_id == user_id, 0), else_=Chat.user2_unread)
+        )
+    )
+
+
+def chats_for(user_id, limit, offset=0):
+    return Chat.query.filter(
+        or_(Chat.user1_id == user_id, Chat.user2_id == user_id)
+    ).order_by(Chat.last_timestamp.desc(), Chat.id).limit(limit).offset(offset).all()
+
+
+def message_cursor(message):
+    return f"{message.timestamp.isoformat()}|{message.id}"
+
+
+def parse_cursor(cursor):
+    timestamp, message_id = cursor.split('|', 1)
+    return datetime.fromisoformat(timestamp), message_id
+
+
+def messages_page(thread_id, limit, before=None, after=None):
+    """One page of a thread in chronological order, by keyset on ``(timestamp, id)``.
+
+    Without a cursor this is the newest ``limit`` messages. ``before`` pages
+    towards older messages and ``after`` fetches anything newer (for polling).
+    Returns ``(messages, has_older)``; ``has_older`` is only meaningful when
+    paging backwards.
+    """
+    query = Message.query.filter(Message.thread_id == thread_id)
+    if after:
+        timestamp, message_id = parse_cursor(after)
+        messages = query.filter(or_(
+            Message.timestamp > timestamp,
+            and_(Message.timestamp == timestamp, Message.id > message_id)
+        )).order_by(Message.timestamp.asc(), Message.id.asc()).limit(limit).all()
+        return messages, True
+
+    if before:
+        timestamp, message_id = parse_cursor(before)
+        query = query.filter(or_(
+            Message.timestamp < timestamp,
+            and_(Message.timestamp == timestamp, Message.id < message_id)
+        ))
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_older = len(messages) > limit
+    return list(reversed(messages[:limit])), has_older
+
+
+def resolve_names(ids):
+    """Map user/doctor ids to display names with one query. Users win over doctors, as before."""
+    ids = set(ids)
+    if not ids:
+        return {}
+    rows = db.session.execute(union_all(
+        select(User.id, User.name, literal(0).label('priority')).where(User.id.in_(ids)),
+        select(Doctor.id, Doctor.name, literal(1).label('priority')).where(Doctor.id.in_(ids))
+    )).all()
+    names = {}
+    for row in sorted(rows, key=lambda row: row.priority, reverse=True):
+        names[row.id] = row.name
+    return names
+
+
+def rebuild_summaries():
+    """Recompute every thread summary from ``Message``. Unread counters restart at zero."""
+    latest = select(
+        Message.thread_id, func.max(Message.timestamp).label('last_timestamp')
+    ).group_by(Message.thread_id).subquery()
+    first = select(
+        Message.thread_id, func.min(Message.timestamp).label('first_timestamp')
+    ).group_by(Message.thread_id).subquery()
+
+    last_messages = {
+        row.thread_id: row for row in db.session.execute(
+            select(Message).join(latest, (Message.thread_id == latest.c.thread_id) & (Message.timestamp == latest.c.last_timestamp))
+        ).scalars()
+    }
+    first_messages = {
+        row.thread_id: row for row in db.session.execute(
+            select(Message).join(first, (Message.thread_id == first.c.thread_id) & (Message.timestamp == first.c.first_timestamp))
+        ).scalars()
+    }
+
+    db.session.execute(delete(Chat))
+    if not last_messages:
+        return 0
+    db.session.execute(insert(Chat), [
+        {
+            'id': thread_id,
+            'user1_id': first_messages[thread_id].sender_id,
+            'user2_id': first_messages[thread_id].receiver_id,
+            'subject': last.subject or first_messages[thread_id].subject,
+            'last_message': last.message,
+            'last_timestamp': last.timestamp,
+            'user1_unread': 0,
+            'user2_unread': 0,
+        }
+        for thread_id, last in last_messages.items()
+    ])
+    return len(last_messages)
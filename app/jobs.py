@@ -0,0 +1,211 @@
+"""Background jobs for operations too heavy to run inside a request.
+
+A job is a row in the ``job`` table. Request handlers call ``enqueue`` and
+return the job id straight away; worker threads claim queued jobs with the
+same conditional-update lease the email outbox uses, run the registered
+handler and record progress. Handlers work in batches and call
+``JobContext.advance`` after each one, which commits the batch and extends
+the lease, so the database never sees one giant transaction. Handlers must
+be safe to re-run: a job whose worker dies is picked up again once its lease
+expires.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Appointment, Doctor, Job, TimeSlot, WorkingHours
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, **params):
+    """Stage a job in the current transaction and return it. The caller commits."""
+    job = Job(kind=kind, params=json.dumps(params, sort_keys=True))
+    db.session.add(job)
+    db.session.info['jobs_dirty'] = True
+    return job
+
+
+def find_active(kind, **params):
+    """A queued or running job of ``kind`` with exactly these params, if any."""
+    return Job.query.filter(
+        Job.kind == kind,
+        Job.params == json.dumps(params, sort_keys=True),
+        Job.status.in_(['queued', 'running'])
+    ).first()
+
+
+class JobContext:
+    def __init__(self, runner, job):
+        self.runner = runner
+        self.job = job
+        self.batch_size = runner.config['JOBS_BATCH_SIZE']
+
+    def set_total(self, total):
+        self.job.total = total
+        db.session.commit()
+
+    def advance(self, amount):
+        """Commit the work done so far and record ``amount`` more units of progress."""
+        self.job.progress += amount
+        self.job.lease_until = datetime.utcnow() + timedelta(seconds=self.runner.config['JOBS_LEASE_SECONDS'])
+        db.session.commit()
+
+
+class JobRunner:
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._threads = []
+            for i in range(self.config['JOBS_WORKERS']):
+                thread = threading.Thread(target=self._run, name=f'jobs-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self.run_once()
+            except Exception:
+                self.app.logger.exception("Job runner iteration failed")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.config['JOBS_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def run_once(self):
+        """Claim and run one due job. Returns whether a job ran."""
+        now = datetime.utcnow()
+        candidates = [row.id for row in db.session.query(Job.id).filter(
+            or_(Job.status == 'queued', (Job.status == 'running') & (Job.lease_until < now))
+        ).order_by(Job.created_at).limit(5)]
+        db.session.commit()
+
+        for job_id in candidates:
+            if self._claim(job_id, now):
+                self._execute(job_id)
+                return True
+        return False
+
+    def _claim(self, job_id, now):
+        claimed = Job.query.filter(
+            Job.id == job_id,
+            or_(Job.status == 'queued', (Job.status == 'running') & (Job.lease_until < now))
+        ).update({
+            Job.status: 'running',
+            Job.lease_until: now + timedelta(seconds=self.config['JOBS_LEASE_SECONDS']),
+            Job.started_at: now
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _execute(self, job_id):
+        job = db.session.get(Job, job_id)
+        try:
+            HANDLERS[job.kind](JobContext(self, job), **json.loads(job.params))
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            self.app.logger.exception("Job %s (%s) failed", job_id, job.kind)
+        else:
+            job.status = 'succeeded'
+            self.app.logger.info("Job %s (%s) finished", job_id, job.kind)
+        job.finished_at = datetime.utcnow()
+        job.lease_until = None
+        db.session.commit()
+
+
+@handler('delete_doctor')
+def delete_doctor(ctx, doctor_id):
+    """Delete a doctor's booked slots and appointments in committed batches, then the doctor.
+
+    The doctor is flagged as ``deleting`` first (normally already done by the
+    route), so no new booking can land between batches.
+    """
+    from app import availability, listcache, search
+
+    Doctor.query.filter(Doctor.id == doctor_id).update({Doctor.deleting: True}, synchronize_session=False)
+    listcache.bump('doctors')
+    db.session.commit()
+
+    slot_count = TimeSlot.query.filter(TimeSlot.doctor_id == doctor_id).count()
+    appointment_count = Appointment.query.filter(Appointment.doctor_id == doctor_id).count()
+    ctx.set_total(slot_count + appointment_count + 1)
+
+    for model in (TimeSlot, Appointment):
+        while True:
+            ids = [row.id for row in db.session.query(model.id).filter(model.doctor_id == doctor_id).limit(ctx.batch_size)]
+            if not ids:
+                break
+            if model is Appointment:
+                # Slots booked by this doctor's appointments were removed above;
+                # this only catches rows inserted while the job was running.
+                TimeSlot.query.filter(TimeSlot.appointment_id.in_(ids)).delete(synchronize_session=False)
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            ctx.advance(len(ids))
+
+    WorkingHours.query.filter(WorkingHours.doctor_id == doctor_id).delete()
+    Doctor.query.filter(Doctor.id == doctor_id).delete()
+    search.mark_dirty('doctor', doctor_id)
+    availability.forget_doctor(doctor_id)
+    listcache.bump('doctors')
+    ctx.advance(1)
+
+
+runner = None
+
+
+def init_app(app):
+    global runner
+    runner = JobRunner(app)
+
+    if app.config['JOBS_ENABLED']:
+        app.before_request(runner.ensure_started)
+
+    @event.listens_for(Session, 'after_commit')
+    def _wake_runner(session):
+        if session.info.pop('jobs_dirty', False):
+            runner.wake()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _forget_jobs(session):
+        session.info.pop('jobs_dirty', None)
@@ -0,0 +1,175 @@
+"""Versioned response cache for read-mostly list endpoints.
+
+Each collection (doctors, classes, a doctor's files) has a version that
+changes whenever one of its rows is inserted, updated or deleted through the
+ORM; writes that bypass it (bulk ``Query.delete()``) call ``bump``. The bump
+is applied when the transaction commits. ``respond`` serves the JSON body
+serialized for the current version, with a strong ETag over that body, and
+answers ``If-None-Match`` with 304, in both cases without querying the
+database.
+
+With ``LIST_CACHE_BACKEND=redis`` versions live in Redis, so every worker
+sees a write at once. The default ``local`` backend keeps them per process;
+a worker that did not make the write notices it once ``LIST_CACHE_TTL``
+expires.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from flask import Response, current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import Class, Doctor, UploadedFile
+
+# model -> (collection, scope of a row)
+TRACKED = {
+    Doctor: ('doctors', lambda doctor: None),
+    Class: ('classes', lambda class_instance: None),
+    UploadedFile: ('files', lambda uploaded_file: uploaded_file.doctor_id),
+}
+
+
+class LocalVersions:
+    exact = False
+
+    def __init__(self, config):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._versions.setdefault(key, uuid.uuid4().hex)
+
+    def bump(self, keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = uuid.uuid4().hex
+
+
+class RedisVersions:
+    exact = True
+
+    def __init__(self, config):
+        import redis
+
+        self.prefix = config['LIST_CACHE_PREFIX']
+        self.client = redis.Redis.from_url(config['REDIS_URL'])
+
+    def _key(self, key):
+        collection, scope = key
+        return f'{self.prefix}{collection}:{scope or ""}'
+
+    def get(self, key):
+        return (self.client.get(self._key(key)) or b'0').decode()
+
+    def bump(self, keys):
+        pipeline = self.client.pipeline()
+        for key in keys:
+            pipeline.incr(self._key(key))
+        pipeline.execute()
+
+
+VERSION_BACKENDS = {
+    'local': LocalVersions,
+    'redis': RedisVersions,
+}
+
+
+class ListCache:
+    def __init__(self, config):
+        self.versions = VERSION_BACKENDS[config['LIST_CACHE_BACKEND']](config)
+        self.ttl = None if self.versions.exact else config['LIST_CACHE_TTL']
+        self.max_entries = config['LIST_CACHE_SIZE']
+        # key -> (version, built_at, body, etag)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        try:
+            version = self.versions.get(key)
+        except Exception:
+            current_app.logger.exception("List cache version lookup failed for %s", key)
+            return None, None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return version, None
+        if self.ttl is not None and time.monotonic() - entry[1] >= self.ttl:
+            return version, None
+        return version, entry
+
+    def store(self, key, version, body):
+        entry = (version, time.monotonic(), body, hashlib.sha256(body).hexdigest()[:32])
+        if version is not None:
+            with self._lock:
+                if len(self._entries) >= self.max_entries and key not in self._entries:
+                    self._entries.clear()
+                self._entries[key] = entry
+        return entry
+
+    def bump(self, keys):
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        try:
+            self.versions.bump(keys)
+        except Exception:
+            current_app.logger.exception("List cache version bump failed for %s", sorted(keys, key=str))
+
+
+def respond(collection, scope, build):
+    """JSON response for ``build()``, cached until the collection's version changes."""
+    key = (collection, scope)
+    # Read the version before building, so a write that lands meanwhile invalidates the result
+    version, entry = cache.lookup(key)
+    if entry is None:
+        entry = cache.store(key, version, current_app.json.dumps(build()).encode() + b'\n')
+    _, _, body, etag = entry
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def bump(collection, scope=None):
+    """Invalidate a collection once the current transaction commits."""
+    from app import db
+
+    _pending_bumps(db.session).add((collection, scope))
+
+
+def _pending_bumps(session):
+    return session.info.setdefault('list_cache_bumps', set())
+
+
+cache = None
+
+
+def init_app(app):
+    global cache
+    cache = ListCache(app.config)
+
+    for model, (collection, scope_of) in TRACKED.items():
+        def _mark(mapper, connection, target, collection=collection, scope_of=scope_of):
+            session = object_session(target)
+            if session is not None:
+                _pending_bumps(session).add((collection, scope_of(target)))
+
+        for mapper_event in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, mapper_event, _mark)
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply_bumps(session):
+        cache.bump(session.info.pop('list_cache_bumps', set()))
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_bumps(session):
+        session.info.pop('list_cache_bumps', None)
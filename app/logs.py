@@ -0,0 +1,174 @@
+"""Logging setup: per-logger levels, JSON lines, and a non-blocking handler.
+
+Request threads never write to stderr themselves. Records are put on a
+bounded queue and written by a ``QueueListener`` thread; if the queue is
+full the record is dropped and counted instead of stalling the request.
+Each record carries the id of the request that produced it (taken from the
+``X-Request-ID`` header or generated, and echoed back on the response).
+
+Levels come from ``LOG_LEVEL`` plus ``LOG_LEVELS`` overrides such as
+``app=DEBUG,sqlalchemy.engine=INFO``. DEBUG records are sampled at
+``LOG_DEBUG_SAMPLE_RATE``; a call can pass ``extra={'sample_rate': ...}`` to
+use its own rate. Log with ``%s`` arguments rather than f-strings so
+nothing is formatted for records that are filtered out.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+from app import metrics
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'sample_rate'}
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, debug_rate):
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', self.debug_rate if record.levelno <= logging.DEBUG else 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+
+FORMATTERS = {
+    'json': JsonFormatter,
+    'text': TextFormatter,
+}
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments here, in the calling thread, but leave
+        # rendering the full line (and any traceback) to the listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """``'app=DEBUG,werkzeug=WARNING'`` -> ``{'app': 'DEBUG', 'werkzeug': 'WARNING'}``."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+handler = None
+listener = None
+
+
+def init_app(app):
+    global handler, listener
+    config = app.config
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(FORMATTERS[config['LOG_FORMAT']]())
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=config['LOG_QUEUE_SIZE']))
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(config['LOG_DEBUG_SAMPLE_RATE']))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config['LOG_LEVEL'])
+    # Let Flask's logger propagate to the queue instead of writing directly
+    app.logger.removeHandler(default_handler)
+    for name, level in parse_levels(config['LOG_LEVELS']).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    listener.start()
+    atexit.register(_stop_listener)
+    # The listener thread does not survive a fork (e.g. gunicorn workers)
+    os.register_at_fork(after_in_child=_restart_listener)
+
+    metrics.registry.add_collector(lambda: [
+        ('log_records_dropped_total', 'counter', 'Log records dropped because the log queue was full.', {(): handler.dropped}),
+    ])
+
+    header = config['REQUEST_ID_HEADER']
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = request.headers.get(header) or uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        if 'request_id' in g:
+            response.headers[header] = g.request_id
+        return response
+
+
+def _restart_listener():
+    global listener
+    # A fresh queue: the parent's may have been locked mid-operation at fork time
+    handler.queue = queue.Queue(maxsize=handler.queue.maxsize)
+    listener = logging.handlers.QueueListener(handler.queue, *listener.handlers, respect_handler_level=False)
+    listener.start()
+
+
+def _stop_listener():
+    # Flushes whatever is still queued at interpreter exit
+    listener.stop()
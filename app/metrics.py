@@ -0,0 +1,203 @@
+"""Request, SQL and outbound-call metrics in Prometheus text format.
+
+Every request records its latency and status code under its Flask endpoint
+name, together with how many SQL statements it ran and how long they took
+(counted from SQLAlchemy engine events). Calls to third-party APIs are
+timed with ``with metrics.outbound('openai'):``. GET /api/metrics renders
+it all in the Prometheus text exposition format.
+
+Recording is a ``bisect`` and a few additions under a lock, cheap enough to
+leave on. Metrics are per process: with several gunicorn workers each one
+exports its own counters, so scrape every worker or aggregate downstream.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts plus +Inf, then sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def totals(self):
+        """``{labels: (count, sum)}`` for every series."""
+        with self._lock:
+            return {labels: (sum(values[:-1]), values[-1]) for labels, values in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        names = self.label_names + ('le',)
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                yield f'{self.name}_bucket', _labels(names, labels + (bound,)), cumulative
+            yield f'{self.name}_sum', _labels(self.label_names, labels), values[-1]
+            yield f'{self.name}_count', _labels(self.label_names, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Register ``collect()`` returning ``[(name, kind, help, {labels: value})]``, read at scrape time."""
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        for collect in self.collectors:
+            for name, kind, documentation, values in collect():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(f'{name}{_labels(tuple(n for n, _ in labels), tuple(v for _, v in labels))} {value}'
+                             for labels, value in values.items())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status code.', ('endpoint', 'method', 'status'))
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by endpoint.', ('endpoint', 'method'))
+request_queries = registry.histogram(
+    'http_request_db_queries', 'SQL statements executed per request, by endpoint.', ('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+query_duration = registry.histogram(
+    'db_query_duration_seconds', 'Duration of individual SQL statements, by endpoint (background for worker threads).', ('endpoint',))
+outbound_duration = registry.histogram(
+    'outbound_request_duration_seconds', 'Calls to third-party APIs, by service and outcome.', ('service', 'outcome'))
+
+
+# The endpoint and query count of the request this thread is serving. Kept
+# in a thread-local rather than ``g`` because the SQL hooks run for every
+# statement and Flask's context proxies are comparatively slow.
+_current = threading.local()
+
+
+@contextmanager
+def outbound(service):
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        outbound_duration.observe(time.perf_counter() - started, service, outcome)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    endpoint = getattr(_current, 'endpoint', None)
+    if endpoint is None:
+        query_duration.observe(elapsed, 'background')
+    else:
+        query_duration.observe(elapsed, endpoint)
+        _current.queries += 1
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def init_app(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def _start_timer():
+        _current.endpoint = request.endpoint or 'unmatched'
+        _current.queries = 0
+        _current.started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        endpoint = getattr(_current, 'endpoint', None)
+        if endpoint is not None:
+            request_duration.observe(time.perf_counter() - _current.started, endpoint, request.method)
+            request_queries.observe(_current.queries, endpoint)
+            requests_total.inc(endpoint, request.method, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _clear_request(exc):
+        _current.endpoint = None
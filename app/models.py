@@ -1,6 +1,6 @@
 import uuid
 from sqlalchemy import Column, String, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, joinedload
 from app import db
 from datetime import datetime
 
@@ -14,24 +14,40 @@ class Doctor(db.Model):
     id = db.Column(db.String(255), primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False)
+    # Set when deletion starts: the doctor is hidden and unbookable while the job removes their rows
+    deleting = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
     time_slots = db.relationship('TimeSlot', backref='doctor', lazy=True)  # Added relationship
 
 class Appointment(db.Model):
+    __table_args__ = (
+        db.Index('ix_appointment_doctor_id_date', 'doctor_id', 'date'),
+    )
+
     id = db.Column(db.String(255), primary_key=True)
     date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=True)  # Make this nullable
     purpose = db.Column(db.String(255), nullable=False)
     doctor_id = db.Column(db.String(255), db.ForeignKey('doctor.id'), nullable=False)
-    user_id = db.Column(db.String(255), db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.String(255), db.ForeignKey('user.id'), nullable=False, index=True)
     meeting_url = db.Column(db.String(255), nullable=False)
     moderator_url = db.Column(db.String(255), nullable=False)
     meeting_password = db.Column(db.String(255), nullable=False)
     is_time_off = db.Column(db.Boolean, default=False)
 
+    @classmethod
+    def serialize_all(cls, query):
+        """Serialize every appointment matched by ``query`` in a single SELECT.
+
+        The user and doctor are joined in eagerly so ``to_dict`` never has to
+        go back to the database per row.
+        """
+        appointments = query.options(joinedload(cls.user), joinedload(cls.doctor)).all()
+        return [appointment.to_dict() for appointment in appointments]
+
     def to_dict(self):
-        user = User.query.get(self.user_id)
-        doctor = Doctor.query.get(self.doctor_id)
+        user = self.user
+        doctor = self.doctor
         return {
             'id': self.id,
             'date': self.date.isoformat(),
@@ -54,11 +70,25 @@ class Appointment(db.Model):
         }
 
 class TimeSlot(db.Model):
+    __table_args__ = (
+        db.Index('ix_time_slot_doctor_id_start_time_is_available', 'doctor_id', 'start_time', 'is_available'),
+        # next_available reads every doctor's bookings in a time window
+        db.Index('ix_time_slot_start_time_doctor_id_is_available', 'start_time', 'doctor_id', 'is_available'),
+        db.UniqueConstraint('doctor_id', 'start_time', name='uq_time_slot_doctor_id_start_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.String(255), db.ForeignKey('doctor.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
     is_available = db.Column(db.Boolean, default=True)
-    appointment_id = db.Column(db.String(255), db.ForeignKey('appointment.id'), nullable=True)
+    appointment_id = db.Column(db.String(255), db.ForeignKey('appointment.id'), nullable=True, index=True)
+
+class WorkingHours(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.String(255), db.ForeignKey('doctor.id'), nullable=False, index=True)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday ... 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
 
 class Class(db.Model):
     id = db.Column(db.String(255), primary_key=True)
@@ -80,20 +110,66 @@ class UploadedFile(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
-    doctor_id = db.Column(db.String(50), nullable=False)
+    doctor_id = db.Column(db.String(50), nullable=False, index=True)
+    # Content-addressed uploads; NULL for files saved under their own name before blobs existed
+    sha256 = db.Column(db.String(64), db.ForeignKey('stored_blob.sha256'), nullable=True, index=True)
+    size = db.Column(db.BigInteger, nullable=True)
+    content_type = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow)
+
+    @property
+    def public_name(self):
+        """Name the file is served under at /api/uploads/<name>."""
+        if self.sha256 is None:
+            return self.filename
+        extension = self.filename.rsplit('.', 1)[1].lower() if '.' in self.filename else ''
+        return f'{self.sha256}.{extension}' if extension else self.sha256
 
     def to_dict(self):
         return {
             'id': self.id,
             'filename': self.filename,
             'file_path': self.file_path,
-            'doctor_id': self.doctor_id
+            'doctor_id': self.doctor_id,
+            'sha256': self.sha256,
+            'size': self.size,
+            'content_type': self.content_type,
+            'url': f'/api/uploads/{self.public_name}'
+        }
+
+class StoredBlob(db.Model):
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    doctor_id = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)
+    content_type = db.Column(db.String(255), nullable=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.received,
+            'upload_url': f'/api/upload/sessions/{self.id}'
         }
 
 class Message(db.Model):
+    __table_args__ = (
+        db.Index('ix_message_thread_id_timestamp', 'thread_id', 'timestamp'),
+    )
+
     id = db.Column(db.String(255), primary_key=True)
-    sender_id = db.Column(db.String(255), nullable=False)
-    receiver_id = db.Column(db.String(255), nullable=False)
+    sender_id = db.Column(db.String(255), nullable=False, index=True)
+    receiver_id = db.Column(db.String(255), nullable=False, index=True)
     message = db.Column(db.Text, nullable=False)
     subject = db.Column(db.String(255), nullable=True)
     thread_id = db.Column(db.String(255), nullable=False)
@@ -102,9 +178,71 @@ class Message(db.Model):
     file_name = db.Column(db.String(255), nullable=True)
 
 class Chat(db.Model):
-    id = db.Column(db.String(255), primary_key=True)
+    __table_args__ = (
+        db.Index('ix_chat_user1_id_last_timestamp', 'user1_id', 'last_timestamp'),
+        db.Index('ix_chat_user2_id_last_timestamp', 'user2_id', 'last_timestamp'),
+    )
+
+    id = db.Column(db.String(255), primary_key=True)  # Same as Message.thread_id
     user1_id = db.Column(db.String(255), nullable=False)
     user2_id = db.Column(db.String(255), nullable=False)
     subject = db.Column(db.String(255), nullable=True)
     last_message = db.Column(db.Text, nullable=True)
-    last_timestamp = db.Column(db.DateTime, nullable=True)
\ No newline at end of file
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    user1_unread = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    user2_unread = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class EmailOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class IdempotencyKey(db.Model):
+    key = db.Column(db.String(255), primary_key=True)
+    endpoint = db.Column(db.String(255), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Job(db.Model):
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class SearchToken(db.Model):
+    __table_args__ = (
+        db.Index('ix_search_token_role_person_id', 'role', 'person_id'),
+    )
+
+    token = db.Column(db.String(64), primary_key=True)
+    role = db.Column(db.String(10), primary_key=True)  # user or doctor
+    person_id = db.Column(db.String(255), primary_key=True)
+    weight = db.Column(db.Integer, nullable=False)
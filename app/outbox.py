@@ -0,0 +1,195 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db, metrics
+from app.clients import clients
+from app.models import EmailOutbox
+
+
+def enqueue_email(to_email, subject, body):
+    """Stage an email in the outbox as part of the current transaction.
+
+    Nothing is sent here: the row becomes visible to the dispatcher when the
+    caller commits, so the email goes out if and only if the booking does.
+    """
+    db.session.add(EmailOutbox(to_email=to_email, subject=subject, body=body))
+    db.session.info['outbox_dirty'] = True
+
+
+class SendinblueTransport:
+    def __init__(self, config):
+        self._sender = {"email": config['EMAIL_SENDER_ADDRESS'], "name": config['EMAIL_SENDER_NAME']}
+
+    def send(self, to_email, subject, body):
+        import sib_api_v3_sdk
+        from sib_api_v3_sdk.rest import ApiException
+
+        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": to_email}],
+            sender=self._sender,
+            subject=subject,
+            text_content=body
+        )
+        try:
+            with metrics.outbound('sendinblue'):
+                clients.get('sendinblue').send_transac_email(send_smtp_email)
+        except ApiException as e:
+            raise RuntimeError(f"Sendinblue rejected email to {to_email}: {e}") from e
+
+
+class StubTransport:
+    """Accepts every email without leaving the process. Used for offline load tests."""
+
+    def __init__(self, config):
+        self.latency = config['STUB_EMAIL_LATENCY_MS'] / 1000.0
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to_email, subject, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent.append((to_email, subject, body))
+
+
+TRANSPORTS = {
+    'sendinblue': SendinblueTransport,
+    'stub': StubTransport,
+}
+
+
+class OutboxDispatcher:
+    """Pool of background threads that drain the email outbox.
+
+    Rows are claimed with a conditional UPDATE that pushes ``next_attempt_at``
+    forward by a lease, so several workers (threads or gunicorn processes) can
+    poll the same table without sending an email twice. A claimed row whose
+    worker dies simply becomes due again once the lease expires.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.transport = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Threads do not survive fork, so a dispatcher inherited from a
+        # preloading gunicorn master is restarted inside each worker.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.transport = TRANSPORTS[self.config['EMAIL_TRANSPORT']](self.config)
+            self._stopping.clear()
+            self._threads = []
+            for i in range(self.config['OUTBOX_WORKERS']):
+                thread = threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    processed = self.drain_once()
+            except Exception:
+                self.app.logger.exception("Outbox dispatcher iteration failed")
+                processed = 0
+            if not processed:
+                self._wakeup.wait(self.config['OUTBOX_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def drain_once(self):
+        """Claim and deliver one batch of due emails. Returns how many were attempted."""
+        now = datetime.utcnow()
+        due_ids = [row.id for row in db.session.query(EmailOutbox.id).filter(
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= now
+        ).order_by(EmailOutbox.next_attempt_at).limit(self.config['OUTBOX_BATCH_SIZE'])]
+        db.session.commit()
+
+        processed = 0
+        for email_id in due_ids:
+            if self._claim(email_id, now):
+                self._deliver(email_id)
+                processed += 1
+        return processed
+
+    def _claim(self, email_id, now):
+        lease_until = now + timedelta(seconds=self.config['OUTBOX_LEASE_SECONDS'])
+        claimed = EmailOutbox.query.filter(
+            EmailOutbox.id == email_id,
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= now
+        ).update({
+            EmailOutbox.next_attempt_at: lease_until,
+            EmailOutbox.attempts: EmailOutbox.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _deliver(self, email_id):
+        email = db.session.get(EmailOutbox, email_id)
+        try:
+            self.transport.send(email.to_email, email.subject, email.body)
+        except Exception as e:
+            email.last_error = str(e)
+            if email.attempts >= self.config['OUTBOX_MAX_ATTEMPTS']:
+                email.status = 'failed'
+                self.app.logger.error("Giving up on email %s to %s: %s", email.id, email.to_email, e)
+            else:
+                email.next_attempt_at = datetime.utcnow() + self._backoff(email.attempts)
+                self.app.logger.warning("Email %s attempt %s failed, retrying: %s", email.id, email.attempts, e)
+        else:
+            email.status = 'sent'
+            email.sent_at = datetime.utcnow()
+            email.last_error = None
+        db.session.commit()
+
+    def _backoff(self, attempts):
+        base = self.config['OUTBOX_BACKOFF_BASE']
+        delay = base * (2 ** (attempts - 1))
+        return timedelta(seconds=delay + random.uniform(0, delay / 2))
+
+
+dispatcher = None
+
+
+def init_app(app):
+    global dispatcher
+    dispatcher = OutboxDispatcher(app)
+
+    if app.config['OUTBOX_ENABLED']:
+        app.before_request(dispatcher.ensure_started)
+
+    @event.listens_for(Session, 'after_commit')
+    def _wake_dispatcher(session):
+        if session.info.pop('outbox_dirty', False):
+            dispatcher.wake()
+
+    @event.listens_for(Session, 'after_rollback')
+    def _forget_outbox(session):
+        session.info.pop('outbox_dirty', None)
@@ -0,0 +1,183 @@
+"""Query budgets and N+1 detection for development and tests.
+
+With ``QUERY_CHECK_ENABLED`` on, every SQL statement a request runs is
+recorded together with the line of app code that issued it. When the
+request finishes, the count is compared with the route's budget (declared
+with ``@query_budget(n)``, falling back to ``QUERY_DEFAULT_BUDGET``), and
+any statement repeated ``QUERY_N_PLUS_ONE_THRESHOLD`` or more times with
+different parameters is reported as a probable N+1, with its call sites.
+``QUERY_CHECK_MODE=raise`` turns a violation into an exception so a test run
+fails; the default only logs it. Responses carry ``X-Query-Count``.
+
+Tests can also measure any block directly::
+
+    with querycheck.count_queries() as queries:
+        client.get('/api/chats?userId=u1')
+    queries.assert_at_most(3)
+    queries.assert_no_n_plus_one()
+
+Off by default: finding the call site walks the stack for every statement.
+``count_queries`` works either way; it installs the statement hook on first
+use and only records while a ``with`` block is open on the thread.
+"""
+import os
+import sys
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(APP_DIR)
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(APP_DIR, 'metrics.py')}
+
+_active = threading.local()
+_listen_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Declare the most SQL statements a route may run per request."""
+    def decorate(view):
+        view.query_budget = limit
+        return view
+    return decorate
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename not in _SKIP_FILES:
+            return f'{os.path.relpath(filename, ROOT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return '<outside app>'
+
+
+class QueryRecorder:
+    def __init__(self, n_plus_one_threshold=5):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, statement, site):
+        self.statements.append((statement, site))
+
+    def repeated(self, threshold=None):
+        """``{statement: [call sites]}`` for statements run at least ``threshold`` times."""
+        threshold = threshold or self.n_plus_one_threshold
+        sites = defaultdict(list)
+        for statement, site in self.statements:
+            sites[statement].append(site)
+        return {statement: found for statement, found in sites.items() if len(found) >= threshold}
+
+    def report(self, threshold=None):
+        lines = [f'{self.count} SQL statements']
+        by_site = defaultdict(int)
+        for _, site in self.statements:
+            by_site[site] += 1
+        for site, count in sorted(by_site.items(), key=lambda item: -item[1]):
+            lines.append(f'  {count}x from {site}')
+        for statement, sites in self.repeated(threshold).items():
+            lines.append(f'  repeated {len(sites)}x (probable N+1): {" ".join(statement.split())[:200]}')
+            for site in sorted(set(sites)):
+                lines.append(f'    from {site} ({sites.count(site)}x)')
+        return '\n'.join(lines)
+
+    def assert_at_most(self, budget):
+        if self.count > budget:
+            raise QueryBudgetExceeded(f'Query budget of {budget} exceeded: {self.report()}')
+
+    def assert_no_n_plus_one(self, threshold=None):
+        if self.repeated(threshold):
+            raise QueryBudgetExceeded(self.report(threshold))
+
+
+def _recorders():
+    recorders = getattr(_active, 'recorders', None)
+    if recorders is None:
+        recorders = _active.recorders = []
+    return recorders
+
+
+@contextmanager
+def count_queries(n_plus_one_threshold=5):
+    """Record the statements run on this thread inside the ``with`` block."""
+    _listen()
+    recorder = QueryRecorder(n_plus_one_threshold)
+    recorders = _recorders()
+    recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        recorders.remove(recorder)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = getattr(_active, 'recorders', None)
+    if recorders:
+        site = _call_site()
+        for recorder in recorders:
+            recorder.record(statement, site)
+
+
+def _listen():
+    with _listen_lock:
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+def init_app(app):
+    config = app.config
+    if not config['QUERY_CHECK_ENABLED']:
+        return
+
+    _listen()
+    threshold = config['QUERY_N_PLUS_ONE_THRESHOLD']
+    default_budget = config['QUERY_DEFAULT_BUDGET']
+    raise_on_violation = config['QUERY_CHECK_MODE'] == 'raise'
+
+    @app.before_request
+    def _start_recording():
+        recorder = QueryRecorder(threshold)
+        _recorders().append(recorder)
+        _active.request_recorder = recorder
+
+    @app.after_request
+    def _check_queries(response):
+        recorder = getattr(_active, 'request_recorder', None)
+        if recorder is None:
+            return response
+        _stop_recording(None)
+        response.headers['X-Query-Count'] = str(recorder.count)
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', default_budget)
+        problems = []
+        if budget is not None and recorder.count > budget:
+            problems.append(f'query budget of {budget} exceeded')
+        if recorder.repeated():
+            problems.append('probable N+1')
+        if problems:
+            message = f'{request.method} {request.path} ({request.endpoint}): {", ".join(problems)}\n{recorder.report()}'
+            if raise_on_violation:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning('%s', message)
+        return response
+
+    @app.teardown_request
+    def _stop_recording(exc):
+        recorder = getattr(_active, 'request_recorder', None)
+        if recorder is not None:
+            _active.request_recorder = None
+            if recorder in _recorders():
+                _recorders().remove(recorder)
@@ -0,0 +1,205 @@
+"""Prefix search over users and doctors.
+
+Names and emails are split into lowercase tokens stored in ``search_token``
+(one row per token and person, with a weight: name words rank above email
+parts). Queries are split into words the same way, except that a whole
+email address stays one word. A query word matches every token it is a
+prefix of, which is an index range scan rather than the ``ilike '%term%'``
+scan of both tables it replaces, and a query with several words only
+returns people matching all of them. Results rank exact word matches above
+prefix matches.
+
+The word with the fewest matching tokens drives the query: its matches are
+the candidates, and each other word is checked per candidate through the
+``(role, person_id)`` index, so a common word costs no more than a rare one.
+At most ``CANDIDATE_CAP`` tokens of the driving word are read, in index
+order (exact and shortest matches first); only a query whose every word is
+that common is ranked among a truncated candidate set.
+
+The index is kept in sync in the writing transaction: ORM inserts, updates
+and deletes of ``User`` and ``Doctor`` are picked up by mapper events, and
+code that writes those tables with bulk statements calls ``mark_dirty``.
+Either way the affected people are re-tokenized from their rows just
+before the session commits.
+"""
+import re
+
+from sqlalchemy import case, delete, event, func, insert, or_, select
+from sqlalchemy.orm import Session, aliased, object_session
+
+from app import db
+from app.models import Doctor, SearchToken, User
+
+NAME_WEIGHT = 2
+EMAIL_WEIGHT = 1
+MAX_TOKEN_LENGTH = 64
+CANDIDATE_CAP = 2000
+
+ROLES = {
+    'user': User,
+    'doctor': Doctor,
+}
+
+_word = re.compile(r'[^\W_]+')
+
+
+def tokens_for(name, email):
+    """``{token: weight}`` for a person's name and email."""
+    tokens = {}
+    email = (email or '').lower()
+    local = email.split('@', 1)[0]
+    for token in [email, local] + _word.findall(local):
+        tokens[token[:MAX_TOKEN_LENGTH]] = EMAIL_WEIGHT
+    for token in _word.findall((name or '').lower()):
+        tokens[token[:MAX_TOKEN_LENGTH]] = NAME_WEIGHT
+    tokens.pop('', None)
+    return tokens
+
+
+def _rows(role, person_id, name, email):
+    return [
+        {'token': token, 'role': role, 'person_id': person_id, 'weight': weight}
+        for token, weight in tokens_for(name, email).items()
+    ]
+
+
+def mark_dirty(role, person_id):
+    """Re-index ``person_id`` when the current transaction commits."""
+    db.session.info.setdefault('search_dirty', set()).add((role, person_id))
+
+
+def reindex(session, people):
+    """Rewrite the tokens of ``people`` (``(role, id)`` pairs) from their current rows."""
+    for role, model in ROLES.items():
+        ids = [person_id for person_role, person_id in people if person_role == role]
+        if not ids:
+            continue
+        session.execute(delete(SearchToken).where(SearchToken.role == role, SearchToken.person_id.in_(ids)))
+        rows = []
+        for person in session.execute(select(model.id, model.name, model.email).where(model.id.in_(ids))):
+            rows += _rows(role, person.id, person.name, person.email)
+        if rows:
+            session.execute(insert(SearchToken), rows)
+
+
+def rebuild_index(batch_size=5000):
+    """Recompute ``search_token`` for every user and doctor. The caller commits."""
+    db.session.execute(delete(SearchToken))
+    indexed = 0
+    for role, model in ROLES.items():
+        rows = []
+        for person in db.session.execute(select(model.id, model.name, model.email).execution_options(yield_per=batch_size)):
+            rows += _rows(role, person.id, person.name, person.email)
+            indexed += 1
+            if len(rows) >= batch_size:
+                db.session.execute(insert(SearchToken), rows)
+                rows = []
+        if rows:
+            db.session.execute(insert(SearchToken), rows)
+    return indexed
+
+
+def query_words(term):
+    """Split a query like ``tokens_for`` splits names and emails, keeping whole addresses."""
+    words = []
+    for part in term.lower().split():
+        if '@' in part:
+            words.append(part)
+        else:
+            words += _word.findall(part)
+    return list(dict.fromkeys(word[:MAX_TOKEN_LENGTH] for word in words))
+
+
+def _prefix_upper_bound(word):
+    return word[:-1] + chr(ord(word[-1]) + 1)
+
+
+def _matches(token, word):
+    # The range lets a plain btree index serve the prefix match on any
+    # dialect or collation; LIKE keeps it exact.
+    return (token.token >= word, token.token < _prefix_upper_bound(word), token.token.startswith(word, autoescape=True))
+
+
+def _score(token, word):
+    return token.weight * case((token.token == word, 2), else_=1)
+
+
+def search(term, limit):
+    """Up to ``limit`` people matching every word of ``term``, best first.
+
+    Returns dicts with ``id``, ``name``, ``email`` and ``role``.
+    """
+    words = query_words(term)
+    if not words:
+        return []
+    if len(words) > 1:
+        # Counting stops at the cap, so a common word costs no more to rule out than a rare one
+        counts = db.session.execute(select(*(
+            select(func.count()).select_from(
+                select(SearchToken.token).where(*_matches(SearchToken, word)).limit(CANDIDATE_CAP + 1).subquery()
+            ).scalar_subquery()
+            for word in words
+        ))).one()
+        words = [word for _, word in sorted(zip(counts, words), key=lambda pair: pair[0])]
+    driver, others = words[0], words[1:]
+
+    first = select(SearchToken.role, SearchToken.person_id, _score(SearchToken, driver).label('score')).where(
+        *_matches(SearchToken, driver)
+    ).order_by(SearchToken.token).limit(CANDIDATE_CAP).subquery()
+    candidates = select(first.c.role, first.c.person_id, func.max(first.c.score).label('score')).group_by(
+        first.c.role, first.c.person_id
+    ).subquery()
+
+    # Each other word is looked up among the candidate's own tokens; NULL means it does not match
+    other_scores = []
+    for position, word in enumerate(others):
+        token = aliased(SearchToken)
+        other_scores.append(select(func.max(_score(token, word))).where(
+            token.role == candidates.c.role, token.person_id == candidates.c.person_id, *_matches(token, word)
+        ).scalar_subquery().label(f'score{position}'))
+    scored = select(candidates.c.role, candidates.c.person_id, candidates.c.score, *other_scores).subquery()
+    other_scores = [scored.c[score.name] for score in other_scores]
+    total = sum(other_scores, scored.c.score).label('total')
+
+    stmt = select(scored.c.role, scored.c.person_id, total)
+    people = {}
+    for role, model in ROLES.items():
+        person = people[role] = aliased(model)
+        stmt = stmt.add_columns(person.name.label(f'{role}_name'), person.email.label(f'{role}_email')).outerjoin(
+            person, (scored.c.role == role) & (person.id == scored.c.person_id)
+        )
+    ranked = db.session.execute(
+        # A person deleted since they were indexed simply drops out
+        stmt.where(*(score.is_not(None) for score in other_scores),
+                   or_(*(person.id.is_not(None) for person in people.values())))
+        .order_by(total.desc(), scored.c.role, scored.c.person_id)
+        .limit(limit)
+    ).mappings().all()
+
+    return [
+        {'id': row['person_id'], 'name': row[f"{row['role']}_name"], 'email': row[f"{row['role']}_email"], 'role': row['role']}
+        for row in ranked
+    ]
+
+
+def init_app(app):
+    for role, model in ROLES.items():
+        def _mark(mapper, connection, target, role=role):
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault('search_dirty', set()).add((role, target.id))
+
+        for mapper_event in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, mapper_event, _mark)
+
+    @event.listens_for(Session, 'before_commit')
+    def _reindex_dirty(session):
+        # Flush first so mapper events for pending objects have run
+        session.flush()
+        dirty = session.info.pop('search_dirty', None)
+        if dirty:
+            reindex(session, dirty)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _forget_dirty(session):
+        session.info.pop('search_dirty', None)
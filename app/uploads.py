@@ -0,0 +1,380 @@
+"""Content-addressed file storage with streaming and resumable uploads.
+
+Every upload is written to a temporary file in ``UPLOAD_FOLDER/tmp`` while
+it is hashed, then moved to ``UPLOAD_FOLDER/blobs/<sha256[:2]>/<sha256>``
+once the transaction that records it commits; if it rolls back, the
+temporary file is removed instead, so no blob exists without its row.
+Identical content is stored once: ``StoredBlob.refcount`` counts the
+``UploadedFile`` rows pointing at a blob, and the file is unlinked when the
+transaction that drops the last reference commits.
+
+Multipart uploads are parsed with a stream factory that writes each chunk
+straight to disk, so the body is never held in memory, and a body larger than
+``UPLOAD_MAX_BYTES`` is refused from its Content-Length (or as soon as that
+many bytes have arrived) rather than after it has been read. Large files can
+instead go through an ``UploadSession``: the client sends ``UPLOAD_CHUNK_SIZE``
+pieces with their ``Upload-Offset`` and after a dropped connection asks for the
+offset to resume from. Each piece is read into a part file of its own and
+appended only once its offset is claimed in the database, so two requests
+racing for one offset cannot interleave their bytes.
+
+Downloads go through ``deliver``. A blob's name contains its hash, so it is
+served with that hash as a strong ETag and cached as immutable; an
+``If-None-Match`` for it is answered with 304 without touching the disk.
+Range requests get 206 responses, and the body is sent with the server's
+``wsgi.file_wrapper`` (sendfile under gunicorn). With ``UPLOAD_OFFLOAD`` set
+to ``x-sendfile`` (Apache, lighttpd) or ``x-accel-redirect`` (nginx, with an
+``internal`` location at ``UPLOAD_ACCEL_PREFIX`` aliased to
+``UPLOAD_FOLDER``), the worker only sets headers and the proxy sends the file.
+
+If the last reference to a blob is deleted while an identical file is being
+uploaded, the unlink can race the new upload's move into place. The next
+upload of that content writes the blob again.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Response, abort, request, send_file
+from sqlalchemy import delete, event, update
+from sqlalchemy.orm import Session
+from werkzeug.formparser import FormDataParser
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.booking import dialect_insert
+from app.models import StoredBlob, UploadedFile, UploadSession
+
+COPY_BUFFER = 1024 * 1024
+OFFSET_HEADER = 'Upload-Offset'
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+OFFLOAD_MODES = ('', 'x-sendfile', 'x-accel-redirect')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class HashingFile:
+    """Writable temporary file that hashes and counts what is written to it."""
+
+    def __init__(self, directory, max_bytes):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadError(f'File is larger than {self.max_bytes} bytes', 413)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def blob_path(sha256):
+    return os.path.join(store.blob_dir, sha256[:2], sha256)
+
+
+def deliver(public_name):
+    """Response for ``/api/uploads/<public_name>``: a content-addressed blob or a legacy file."""
+    mimetype = mimetypes.guess_type(public_name)[0] or 'application/octet-stream'
+    if BLOB_NAME.match(public_name):
+        sha256 = public_name.split('.', 1)[0]
+        if request.if_none_match.contains(sha256):
+            response = Response(status=304)
+        else:
+            response = _send(blob_path(sha256), mimetype, sha256)
+        response.set_etag(sha256)
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = store.cache_max_age
+        response.cache_control.immutable = True
+        return response
+
+    # Files saved under their own name could be overwritten, so clients revalidate
+    path = safe_join(store.folder, public_name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = _send(path, mimetype, None)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _send(path, mimetype, etag):
+    if store.offload:
+        if not os.path.isfile(path):
+            abort(404)
+        response = Response(mimetype=mimetype)
+        if store.offload == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = store.accel_prefix + os.path.relpath(path, store.folder).replace(os.sep, '/')
+        else:
+            response.headers['X-Sendfile'] = path
+        return response
+    try:
+        # conditional=True answers If-None-Match/If-Modified-Since and Range
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag or True, max_age=0)
+    except FileNotFoundError:
+        abort(404)
+    response.accept_ranges = 'bytes'
+    return response
+
+
+def receive_file(request, field, is_allowed):
+    """Stream a multipart body to disk. Returns ``(form, filename, content_type, HashingFile)``.
+
+    ``is_allowed(filename)`` is checked when a file part starts, before any of
+    it is written. Parts other than ``field`` are discarded; the returned file
+    must be passed to ``store_file`` or discarded.
+    """
+    if request.content_length is not None and request.content_length > store.max_bytes:
+        raise UploadError(f'File is larger than {store.max_bytes} bytes', 413)
+
+    written = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        if not filename:
+            raise UploadError('No selected file')
+        if not is_allowed(filename):
+            raise UploadError('File type not allowed')
+        part = HashingFile(store.tmp_dir, store.max_bytes)
+        written.append(part)
+        return part
+
+    parser = FormDataParser(stream_factory=stream_factory, max_form_memory_size=COPY_BUFFER)
+    try:
+        _, form, files = parser.parse(request.stream, request.mimetype, request.content_length, request.mimetype_params)
+    except Exception:
+        for part in written:
+            part.discard()
+        raise
+
+    storage = files.get(field)
+    for part in written:
+        part.close()
+        if storage is None or part is not storage.stream:
+            part.discard()
+    if storage is None:
+        raise UploadError('No file part')
+    return form, storage.filename, storage.mimetype or None, storage.stream
+
+
+def store_file(path, sha256, size, filename, doctor_id, content_type=None, discard_on_rollback=True):
+    """Turn a fully written temporary file into an ``UploadedFile``. The caller commits.
+
+    The temporary file is consumed when the transaction commits: moved into
+    place as a new blob, or replacing an identical one whose reference count
+    goes up. On rollback it is deleted unless ``discard_on_rollback`` is false.
+    """
+    stmt = dialect_insert(StoredBlob).values(sha256=sha256, size=size, refcount=1, created_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(index_elements=['sha256'], set_={'refcount': StoredBlob.refcount + 1})
+    db.session.execute(stmt)
+
+    target = blob_path(sha256)
+    _pending_moves().append((path, target, discard_on_rollback))
+
+    record = UploadedFile(
+        filename=secure_filename(filename),
+        file_path=target,
+        doctor_id=doctor_id,
+        sha256=sha256,
+        size=size,
+        content_type=content_type
+    )
+    db.session.add(record)
+    return record
+
+
+def release_file(record):
+    """Delete an ``UploadedFile`` and drop its blob if nothing else uses it. The caller commits."""
+    db.session.delete(record)
+    if record.sha256 is None:
+        _pending_unlinks().append(record.file_path)
+    else:
+        # The row goes first so the blob is no longer referenced when it is deleted
+        db.session.flush()
+        db.session.execute(
+            update(StoredBlob).where(StoredBlob.sha256 == record.sha256).values(refcount=StoredBlob.refcount - 1),
+            execution_options={'synchronize_session': False}
+        )
+        unused = db.session.execute(
+            delete(StoredBlob).where(StoredBlob.sha256 == record.sha256, StoredBlob.refcount <= 0)
+            .returning(StoredBlob.sha256)
+        ).first()
+        if unused:
+            _pending_unlinks().append(blob_path(record.sha256))
+
+
+def session_path(upload_session):
+    return os.path.join(store.tmp_dir, f'session-{upload_session.id}.part')
+
+
+def open_session(doctor_id, filename, size, content_type=None):
+    """Start a resumable upload of ``size`` bytes. The caller commits."""
+    if size > store.max_bytes:
+        raise UploadError(f'File is larger than {store.max_bytes} bytes', 413)
+    expire_sessions()
+    upload_session = UploadSession(doctor_id=doctor_id, filename=secure_filename(filename), size=size,
+                                   content_type=content_type, received=0)
+    db.session.add(upload_session)
+    db.session.flush()
+    open(session_path(upload_session), 'wb').close()
+    return upload_session
+
+
+def append_chunk(upload_session, offset, stream, length):
+    """Write up to ``length`` bytes from ``stream`` at ``offset``. The caller commits.
+
+    ``offset`` must equal the bytes already received, so a client that lost
+    a response resumes from the session's offset instead of sending twice.
+    Returns the ``UploadedFile`` once the last byte is in, otherwise None.
+    """
+    if offset != upload_session.received:
+        raise UploadError(f'Expected offset {upload_session.received}', 409)
+    if length is None:
+        raise UploadError('Content-Length is required', 411)
+    if length > store.chunk_size:
+        raise UploadError(f'Chunks are limited to {store.chunk_size} bytes', 413)
+    if offset + length > upload_session.size:
+        raise UploadError('Chunk extends past the declared size', 413)
+
+    # Read the body into a part of its own: until the offset is claimed, a
+    # concurrent request for the same offset may be writing too
+    part = HashingFile(store.tmp_dir, length)
+    try:
+        while part.size < length:
+            data = stream.read(min(COPY_BUFFER, length - part.size))
+            if not data:
+                break
+            part.write(data)
+        written = part.size
+
+        # The update holds the session row until commit, so only the winner appends
+        claimed = db.session.execute(
+            update(UploadSession).where(UploadSession.id == upload_session.id, UploadSession.received == offset)
+            .values(received=offset + written, updated_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not claimed:
+            raise UploadError('Chunk was sent concurrently with another', 409)
+
+        path = session_path(upload_session)
+        part.seek(0)
+        with open(path, 'r+b') as f:
+            # Drop whatever a rolled-back chunk left past the committed offset
+            f.truncate(offset)
+            f.seek(offset)
+            for data in iter(lambda: part.read(COPY_BUFFER), b''):
+                f.write(data)
+    finally:
+        part.discard()
+
+    upload_session.received = offset + written
+    if upload_session.received < upload_session.size:
+        return None
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(data)
+    # Keep the session file on rollback so the client can resend the last chunk
+    record = store_file(path, digest.hexdigest(), upload_session.size, upload_session.filename,
+                        upload_session.doctor_id, upload_session.content_type, discard_on_rollback=False)
+    db.session.delete(upload_session)
+    return record
+
+
+def cancel_session(upload_session):
+    """Abandon a resumable upload. The caller commits."""
+    _pending_unlinks().append(session_path(upload_session))
+    db.session.delete(upload_session)
+
+
+def expire_sessions():
+    """Delete sessions idle for longer than ``UPLOAD_SESSION_TTL``. The caller commits."""
+    cutoff = datetime.utcnow() - timedelta(seconds=store.session_ttl)
+    for upload_session in UploadSession.query.filter(UploadSession.updated_at < cutoff).limit(100):
+        cancel_session(upload_session)
+
+
+def _pending_unlinks():
+    return db.session.info.setdefault('pending_unlinks', [])
+
+
+def _pending_moves():
+    return db.session.info.setdefault('pending_blob_moves', [])
+
+
+class BlobStore:
+    def __init__(self, config):
+        self.folder = config['UPLOAD_FOLDER']
+        self.blob_dir = os.path.join(self.folder, 'blobs')
+        self.tmp_dir = os.path.join(self.folder, 'tmp')
+        self.max_bytes = config['UPLOAD_MAX_BYTES']
+        self.chunk_size = config['UPLOAD_CHUNK_SIZE']
+        self.session_ttl = config['UPLOAD_SESSION_TTL']
+        self.offload = config['UPLOAD_OFFLOAD']
+        self.accel_prefix = config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/'
+        self.cache_max_age = config['UPLOAD_CACHE_MAX_AGE']
+        if self.offload not in OFFLOAD_MODES:
+            raise ValueError(f"UPLOAD_OFFLOAD must be one of {', '.join(repr(mode) for mode in OFFLOAD_MODES)}")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+
+store = None
+
+
+def init_app(app):
+    global store
+    store = BlobStore(app.config)
+
+    @event.listens_for(Session, 'after_commit')
+    def _apply_file_changes(session):
+        # Unlink first: a transaction that dropped a blob and stored it again keeps the new copy
+        for path in session.info.pop('pending_unlinks', []):
+            _unlink(path)
+        for path, target, _ in session.info.pop('pending_blob_moves', []):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_file_changes(session):
+        session.info.pop('pending_unlinks', None)
+        for path, _, discard in session.info.pop('pending_blob_moves', []):
+            if discard:
+                _unlink(path)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
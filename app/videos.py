@@ -0,0 +1,172 @@
+"""YouTube search with a stale-while-revalidate cache.
+
+Results are cached per ``(query, max_results)`` in an in-process LRU and,
+with ``YOUTUBE_CACHE_SHARED``, in Redis so workers share one copy; a local
+entry past its TTL is checked against Redis before it is used. An entry
+younger than ``YOUTUBE_CACHE_TTL`` is served as is. Up to
+``YOUTUBE_CACHE_STALE`` seconds past that it is still served immediately
+while one background request refreshes it. Only a missing or fully expired
+entry makes the caller wait for the API.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from app import metrics
+from app.clients import clients
+
+
+class YouTubeError(Exception):
+    pass
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class RedisTier:
+    def __init__(self, config, expire):
+        import redis
+
+        self.prefix = config['YOUTUBE_CACHE_PREFIX']
+        self.expire = int(expire)
+        self.client = redis.Redis.from_url(config['REDIS_URL'])
+
+    def _key(self, key):
+        return f'{self.prefix}{key[1]}:{key[0]}'
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry['videos'], entry['fetched_at']
+
+    def set(self, key, entry):
+        videos, fetched_at = entry
+        self.client.setex(self._key(key), self.expire, json.dumps({'videos': videos, 'fetched_at': fetched_at}))
+
+
+class VideoSearch:
+    def __init__(self, app):
+        self.app = app
+        config = app.config
+        self.api_url = config['YOUTUBE_API_URL'].rstrip('/')
+        self.api_key = config['YOUTUBE_API_KEY']
+        self.timeout = config['YOUTUBE_TIMEOUT']
+        self.ttl = config['YOUTUBE_CACHE_TTL']
+        self.stale = config['YOUTUBE_CACHE_STALE']
+        self.local = LRUCache(config['YOUTUBE_CACHE_SIZE'])
+        self.shared = RedisTier(config, self.ttl + self.stale) if config['YOUTUBE_CACHE_SHARED'] else None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def fetch(self, query, max_results):
+        try:
+            with metrics.outbound('youtube'):
+                response = clients.get('youtube').get(f'{self.api_url}/search', params={
+                    'part': 'snippet',
+                    'q': query,
+                    'maxResults': max_results,
+                    'key': self.api_key,
+                    'type': 'video'
+                }, timeout=self.timeout)
+        except OSError as e:
+            # requests' exceptions derive from IOError
+            raise YouTubeError(f'YouTube API request failed: {e}') from e
+        if response.status_code != 200:
+            raise YouTubeError(f'YouTube API returned {response.status_code}')
+        try:
+            return [
+                {
+                    'id': video['id']['videoId'],
+                    'title': video['snippet']['title'],
+                    'description': video['snippet']['description']
+                }
+                for video in response.json().get('items', [])
+            ]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # A proxy error page or a changed schema is a failed fetch, like a 5xx
+            raise YouTubeError(f'YouTube API returned an unexpected response: {e!r}') from e
+
+    def _lookup(self, key):
+        entry = self.local.get(key)
+        # A stale local copy may already have been refreshed by another worker
+        if self.shared is not None and (entry is None or time.time() - entry[1] >= self.ttl):
+            try:
+                shared = self.shared.get(key)
+            except Exception:
+                self.app.logger.exception("YouTube shared cache lookup failed")
+                shared = None
+            if shared is not None and (entry is None or shared[1] > entry[1]):
+                entry = shared
+                self.local.set(key, entry)
+        return entry
+
+    def _store(self, key, videos):
+        entry = (videos, time.time())
+        self.local.set(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry)
+            except Exception:
+                self.app.logger.exception("YouTube shared cache store failed")
+
+    def _refresh(self, key):
+        try:
+            self._store(key, self.fetch(*key))
+        except Exception:
+            # Keep serving the stale entry; the next request past the TTL retries
+            self.app.logger.exception("Background refresh of YouTube search %r failed", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key,), name='youtube-refresh', daemon=True).start()
+
+    def search(self, query, max_results):
+        key = (' '.join(query.lower().split()), max_results)
+        entry = self._lookup(key)
+        if entry is not None:
+            videos, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return videos
+            if age < self.ttl + self.stale:
+                self._refresh_in_background(key)
+                return videos
+
+        videos = self.fetch(*key)
+        self._store(key, videos)
+        return videos
+
+
+video_search = None
+
+
+def init_app(app):
+    global video_search
+    video_search = VideoSearch(app)
@@ -8,4 +8,97 @@ class Config():
     FLASK_APP = os.environ.get('FLASK_APP')
     FLASK_DEBUG = os.environ.get('FLASK_DEBUG')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SECRET_KEY = os.environ.get('SECRET_KEY')
\ No newline at end of file
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    # Local stand-ins for Sendinblue, OpenAI and YouTube (scripts/fake_upstreams.py), e.g.
+    # http://localhost:8099; the per-service URLs below default to it when it is set
+    FAKE_UPSTREAM_URL = os.environ.get('FAKE_UPSTREAM_URL', '').rstrip('/') or None
+
+    # Email outbox: 'sendinblue' talks to the real API, 'stub' only logs (for offline load tests)
+    EMAIL_TRANSPORT = os.environ.get('EMAIL_TRANSPORT', 'sendinblue')
+    EMAIL_SENDER_ADDRESS = os.environ.get('EMAIL_SENDER_ADDRESS', 'your-email@example.com')
+    EMAIL_SENDER_NAME = os.environ.get('EMAIL_SENDER_NAME', 'Your Name')
+    SENDINBLUE_API_KEY = os.environ.get('SENDINBLUE_API_KEY') or ('fake' if FAKE_UPSTREAM_URL else None)
+    SENDINBLUE_API_URL = os.environ.get('SENDINBLUE_API_URL') or (f'{FAKE_UPSTREAM_URL}/sendinblue/v3' if FAKE_UPSTREAM_URL else None)
+    STUB_EMAIL_LATENCY_MS = int(os.environ.get('STUB_EMAIL_LATENCY_MS', 0))
+    OUTBOX_ENABLED = os.environ.get('OUTBOX_ENABLED', '1') == '1'
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 2))
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 20))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 5))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+    OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', 2))
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 60))
+
+    # Uploads are stored once per content hash under UPLOAD_FOLDER/blobs
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(basedir, 'app', 'api', 'uploads'))
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))  # largest PATCH to a resumable session
+    UPLOAD_SESSION_TTL = float(os.environ.get('UPLOAD_SESSION_TTL', 24 * 3600))
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get('UPLOAD_CACHE_MAX_AGE', 365 * 24 * 3600))
+    # Hand downloads to the proxy: '' (serve from the worker), 'x-sendfile' or 'x-accel-redirect' (nginx)
+    UPLOAD_OFFLOAD = os.environ.get('UPLOAD_OFFLOAD', '').lower()
+    UPLOAD_ACCEL_PREFIX = os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/')
+
+    # Seconds a cached per-day occupancy bitmap is trusted before it is reloaded
+    OCCUPANCY_TTL = float(os.environ.get('OCCUPANCY_TTL', 30))
+
+    # Server-sent events: 'local' delivers within one process, 'redis' fans out across workers
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'local')
+    EVENTS_CHANNEL_PREFIX = os.environ.get('EVENTS_CHANNEL_PREFIX', 'hello-belly:events:')
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', 300))
+    SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 100))
+
+    # Background jobs for heavy lifecycle operations (e.g. deleting a doctor)
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', '1') == '1'
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 1))
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 5))
+    JOBS_BATCH_SIZE = int(os.environ.get('JOBS_BATCH_SIZE', 1000))
+    JOBS_LEASE_SECONDS = int(os.environ.get('JOBS_LEASE_SECONDS', 300))
+
+    # OpenAI
+    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY') or ('fake' if FAKE_UPSTREAM_URL else None)
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or (f'{FAKE_UPSTREAM_URL}/openai/v1' if FAKE_UPSTREAM_URL else None)
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 30))
+
+    # Cache for /api/chatgpt answers: 'memory' (per process LRU) or 'redis' (shared)
+    CHATGPT_CACHE_BACKEND = os.environ.get('CHATGPT_CACHE_BACKEND', 'memory')
+    CHATGPT_CACHE_TTL = float(os.environ.get('CHATGPT_CACHE_TTL', 7 * 24 * 3600))
+    CHATGPT_CACHE_SIZE = int(os.environ.get('CHATGPT_CACHE_SIZE', 5000))
+    CHATGPT_CACHE_PREFIX = os.environ.get('CHATGPT_CACHE_PREFIX', 'hello-belly:chatgpt:')
+
+    # YouTube search; results are cached per (query, maxResults) and refreshed in the background once stale
+    YOUTUBE_API_KEY = os.environ.get('YOUTUBE_API_KEY')
+    YOUTUBE_API_URL = os.environ.get('YOUTUBE_API_URL') or (
+        f'{FAKE_UPSTREAM_URL}/youtube/v3' if FAKE_UPSTREAM_URL else 'https://www.googleapis.com/youtube/v3')
+    YOUTUBE_TIMEOUT = float(os.environ.get('YOUTUBE_TIMEOUT', 5))
+    YOUTUBE_CACHE_TTL = float(os.environ.get('YOUTUBE_CACHE_TTL', 6 * 3600))
+    YOUTUBE_CACHE_STALE = float(os.environ.get('YOUTUBE_CACHE_STALE', 7 * 24 * 3600))
+    YOUTUBE_CACHE_SIZE = int(os.environ.get('YOUTUBE_CACHE_SIZE', 500))
+    YOUTUBE_CACHE_SHARED = os.environ.get('YOUTUBE_CACHE_SHARED', '0') == '1'
+    YOUTUBE_CACHE_PREFIX = os.environ.get('YOUTUBE_CACHE_PREFIX', 'hello-belly:youtube:')
+
+    # Cached bodies for list endpoints, invalidated by per-collection versions: 'local' or 'redis' (shared by workers)
+    LIST_CACHE_BACKEND = os.environ.get('LIST_CACHE_BACKEND', 'local')
+    LIST_CACHE_TTL = float(os.environ.get('LIST_CACHE_TTL', 30))  # local backend: how stale another worker's write can be
+    LIST_CACHE_SIZE = int(os.environ.get('LIST_CACHE_SIZE', 10000))
+    LIST_CACHE_PREFIX = os.environ.get('LIST_CACHE_PREFIX', 'hello-belly:lists:')
+
+    # Logging: LOG_LEVELS overrides per logger, e.g. "app=DEBUG,sqlalchemy.engine=INFO"
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0))
+    REQUEST_ID_HEADER = os.environ.get('REQUEST_ID_HEADER', 'X-Request-ID')
+
+    # Request/SQL/outbound metrics served in Prometheus format at /api/metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+    # Development/test SQL checks: per-route query budgets and N+1 detection
+    QUERY_CHECK_ENABLED = os.environ.get('QUERY_CHECK_ENABLED', '0') == '1'
+    QUERY_CHECK_MODE = os.environ.get('QUERY_CHECK_MODE', 'log')  # 'log' or 'raise'
+    QUERY_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD', 5))
+    QUERY_DEFAULT_BUDGET = int(os.environ['QUERY_DEFAULT_BUDGET']) if os.environ.get('QUERY_DEFAULT_BUDGET') else None
@@ -0,0 +1,45 @@
+import os
+
+# GUNICORN_POOL picks what this server is for:
+#   all     every route on threaded workers (development, small deployments)
+#   api     everything except /api/stream, on threaded workers
+#   stream  /api/stream only, on gevent workers
+#
+# /api/stream holds its connection for up to SSE_MAX_DURATION. On a threaded
+# worker that pins one thread per open stream, so a handful of clients starve
+# ordinary requests. In production run two pools and let the proxy route
+# streams to the gevent one, where an idle stream costs a greenlet:
+#
+#   GUNICORN_POOL=api gunicorn -c gunicorn.conf.py -b 127.0.0.1:8000 run:app
+#   GUNICORN_POOL=stream gunicorn -c gunicorn.conf.py -b 127.0.0.1:8001 run:app
+#
+#   location /api/stream { proxy_pass http://127.0.0.1:8001; proxy_buffering off; }
+#   location / { proxy_pass http://127.0.0.1:8000; }
+pool = os.environ.get('GUNICORN_POOL', 'all')
+if pool not in ('all', 'api', 'stream'):
+    raise RuntimeError(f"GUNICORN_POOL must be 'all', 'api' or 'stream', not {pool!r}")
+
+if pool == 'stream':
+    workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+else:
+    workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+    threads = int(os.environ.get('GUNICORN_THREADS', 64 if pool == 'all' else 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Events published in one process only reach streams held by another through
+# Redis, so that is the default whenever there is more than one process
+if workers > 1 or pool != 'all':
+    os.environ.setdefault('EVENTS_BACKEND', 'redis')
+
+
+def on_starting(server):
+    """Refuse to start when published events could miss the process holding the stream."""
+    backend = os.environ.get('EVENTS_BACKEND', 'local')
+    if backend == 'local' and (server.cfg.workers > 1 or pool != 'all'):
+        raise RuntimeError(
+            f'EVENTS_BACKEND=local only delivers within one process; use EVENTS_BACKEND=redis '
+            f'with {server.cfg.workers} workers in the {pool!r} pool'
+        )
@@ -0,0 +1,25 @@
+"""Rebuild the chat inbox summaries from existing messages.
+
+    python scripts/backfill_chats.py
+
+Run once after upgrading to the migration that adds the unread counters;
+threads started before then have no summary row and would not show up in
+GET /api/chats.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    from app import app, db, inbox
+
+    with app.app_context():
+        threads = inbox.rebuild_summaries()
+        db.session.commit()
+    print(f"Rebuilt {threads} chat summaries")
+
+
+if __name__ == '__main__':
+    main()
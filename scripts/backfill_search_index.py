@@ -0,0 +1,24 @@
+"""Rebuild the people search index from the user and doctor tables.
+
+    python scripts/backfill_search_index.py
+
+Run once after upgrading to the migration that adds ``search_token``;
+people created before then are not found by GET /api/search_users.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    from app import app, db, search
+
+    with app.app_context():
+        people = search.rebuild_index()
+        db.session.commit()
+    print(f"Indexed {people} users and doctors")
+
+
+if __name__ == '__main__':
+    main()
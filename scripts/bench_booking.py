@@ -0,0 +1,299 @@
+"""Load-test the booking flow with concurrent clients and save the results as JSON.
+
+    python scripts/bench_booking.py --doctors 50 --clients 16 --duration 30 --output before.json
+    python scripts/bench_booking.py --doctors 50 --clients 16 --duration 30 --output after.json --compare before.json
+
+Uses DATABASE_URL when it is set (PostgreSQL for a realistic run),
+otherwise a throwaway SQLite file. Seeds DOCTORS doctors with FILL of their
+working slots booked for DAYS days, one appointment per booked slot, and
+MESSAGES chat messages; rows are prefixed ``bench-`` and seeding is skipped
+when they already exist. CLIENTS threads then loop through a mix of
+scenarios until DURATION seconds have passed: browse availability, book a
+slot then reschedule and (half the time) cancel it, and request then move
+time off. Each endpoint reports p50/p95/p99 latency, requests per second,
+status codes and SQL statements per request (from the metrics registry).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+START_DAY = date(2030, 1, 7)
+BATCH = 10000
+# schedule_meeting and the time-off routes subtract four hours from what they are sent
+CLIENT_OFFSET = timedelta(hours=4)
+SCENARIOS = {'browse': 5, 'book': 3, 'time_off': 1}
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed(args):
+    from app import availability, db, inbox
+    from app.models import Appointment, Doctor, Message, TimeSlot, User
+
+    if db.session.get(Doctor, 'bench-doc0') is not None:
+        print('Seed data already present, skipping seeding')
+        return
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    db.session.bulk_insert_mappings(Doctor, [
+        {'id': f'bench-doc{i}', 'name': f'Doctor {i}', 'email': f'bench-doc{i}@example.com'} for i in range(args.doctors)
+    ])
+    db.session.bulk_insert_mappings(User, [
+        {'id': f'bench-user{i}', 'name': f'Patient {i}', 'email': f'bench-user{i}@example.com'} for i in range(args.users)
+    ])
+
+    appointments, slots, booked = [], [], 0
+    for doctor in range(args.doctors):
+        for offset in range(args.days):
+            day = START_DAY + timedelta(days=offset)
+            for start in availability.working_slots(availability.DEFAULT_WORKING_HOURS, day):
+                if rng.random() >= args.fill:
+                    continue
+                appointment_id = f'bench-appt{booked}'
+                booked += 1
+                appointments.append({
+                    'id': appointment_id, 'date': start, 'purpose': 'Checkup', 'doctor_id': f'bench-doc{doctor}',
+                    'user_id': f'bench-user{rng.randrange(args.users)}', 'meeting_url': 'https://meet.jit.si/bench',
+                    'moderator_url': 'https://meet.jit.si/bench', 'meeting_password': 'bench', 'is_time_off': False
+                })
+                slots.append({'doctor_id': f'bench-doc{doctor}', 'start_time': start, 'is_available': False,
+                              'appointment_id': appointment_id})
+                if len(slots) >= BATCH:
+                    db.session.bulk_insert_mappings(Appointment, appointments)
+                    db.session.bulk_insert_mappings(TimeSlot, slots)
+                    appointments, slots = [], []
+    db.session.bulk_insert_mappings(Appointment, appointments)
+    db.session.bulk_insert_mappings(TimeSlot, slots)
+
+    messages = []
+    first = datetime.combine(START_DAY, datetime.min.time())
+    for i in range(args.messages):
+        user, doctor = rng.randrange(args.users), rng.randrange(args.doctors)
+        sender, receiver = f'bench-user{user}', f'bench-doc{doctor}'
+        if rng.random() < 0.5:
+            sender, receiver = receiver, sender
+        messages.append({'id': f'bench-msg{i}', 'sender_id': sender, 'receiver_id': receiver, 'message': f'Message {i}',
+                         'subject': 'Follow-up', 'thread_id': f'bench-thread{user}-{doctor}',
+                         'timestamp': first + timedelta(seconds=i)})
+        if len(messages) == BATCH:
+            db.session.bulk_insert_mappings(Message, messages)
+            messages = []
+    db.session.bulk_insert_mappings(Message, messages)
+    db.session.commit()
+    inbox.rebuild_summaries()
+    db.session.commit()
+    print(f'Seeded {args.doctors} doctors, {args.users} patients, {booked} appointments and '
+          f'{args.messages} messages in {time.perf_counter() - started:.1f} s')
+
+
+class Client:
+    def __init__(self, app, args, index, record):
+        self.http = app.test_client()
+        self.args = args
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.index = index
+        self.record = record
+        self.iteration = 0
+
+    def call(self, endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        response = self.http.open(path, method=method, **kwargs)
+        self.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    def free_slot(self, doctor, day):
+        response = self.call('get_available_slots', 'GET', '/api/available_slots',
+                             query_string={'doctor_id': doctor, 'date': day.isoformat()})
+        slots = response.get_json()['available_slots'] if response.status_code == 200 else []
+        return datetime.fromisoformat(self.rng.choice(slots)) if slots else None
+
+    def random_day(self):
+        return START_DAY + timedelta(days=self.rng.randrange(self.args.days))
+
+    def browse(self):
+        self.free_slot(f'bench-doc{self.rng.randrange(self.args.doctors)}', self.random_day())
+
+    def book(self):
+        doctor = f'bench-doc{self.rng.randrange(self.args.doctors)}'
+        slot = self.free_slot(doctor, self.random_day())
+        if slot is None:
+            return
+        patient = self.rng.randrange(self.args.users)
+        response = self.call('schedule_meeting', 'POST', '/api/schedule_meeting', json={
+            'date': (slot + CLIENT_OFFSET).isoformat(), 'purpose': 'Checkup', 'doctor': doctor,
+            'email': f'bench-user{patient}@example.com', 'name': f'Patient {patient}'
+        })
+        if response.status_code != 200:
+            return
+        appointment_id = response.get_json()['appointment']['id']
+
+        slot = self.free_slot(doctor, self.random_day())
+        if slot is not None:
+            self.call('reschedule_appointment', 'PUT', f'/api/appointments/{appointment_id}',
+                      json={'date': (slot + CLIENT_OFFSET).isoformat()})
+        if self.rng.random() < 0.5:
+            self.call('cancel_appointment', 'DELETE', f'/api/appointments/{appointment_id}')
+
+    def time_off(self):
+        # Beyond the seeded year, on a day no other client uses, so ranges never collide
+        self.iteration += 1
+        day = START_DAY + timedelta(days=self.args.days + 2 * (self.iteration * self.args.clients + self.index))
+        doctor = f'bench-doc{self.rng.randrange(self.args.doctors)}'
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=9)
+        response = self.call('request_time_off', 'POST', '/api/request_time_off', json={
+            'date': (start + CLIENT_OFFSET).isoformat(), 'end_date': (start + timedelta(hours=4) + CLIENT_OFFSET).isoformat(),
+            'purpose': 'Time off', 'doctor': doctor, 'email': f'{doctor}@example.com', 'name': 'Doctor'
+        })
+        if response.status_code != 201:
+            return
+        with self.http.application.app_context():
+            from app.models import Appointment
+            appointment = Appointment.query.filter_by(doctor_id=doctor, is_time_off=True, date=start).first()
+        if appointment is not None:
+            moved = start + timedelta(days=1)
+            self.call('reschedule_time_off', 'PUT', f'/api/request_time_off/{appointment.id}', json={
+                'new_start_date': (moved + CLIENT_OFFSET).isoformat(),
+                'new_end_date': (moved + timedelta(hours=4) + CLIENT_OFFSET).isoformat()
+            })
+
+    def run(self, deadline):
+        names, weights = zip(*SCENARIOS.items())
+        while time.perf_counter() < deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings, statuses, queries, elapsed):
+    endpoints = {}
+    for endpoint in sorted(timings):
+        ordered = sorted(timings[endpoint])
+        count, total_queries = queries.get(endpoint, (0, 0))
+        endpoints[endpoint] = {
+            'requests': len(ordered),
+            'rps': round(len(ordered) / elapsed, 1),
+            'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+            'max_ms': round(ordered[-1] * 1000, 2),
+            'queries_per_request': round(total_queries / count, 2) if count else None,
+            'status_codes': {str(status): n for status, n in sorted(statuses[endpoint].items())},
+        }
+    return endpoints
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    print(f'\nChange against {baseline_path}:')
+    for endpoint, current in results.items():
+        before = baseline.get(endpoint)
+        if not before:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries_per_request'):
+            if before.get(key) and current.get(key) is not None:
+                deltas.append(f'{key} {(current[key] - before[key]) / before[key] * 100:+.0f}%')
+        print(f'  {endpoint:24} {", ".join(deltas)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--fill', type=float, default=0.5)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_booking.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='earlier --output file to compare against')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ.setdefault('EMAIL_TRANSPORT', 'stub')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app import app, db, metrics
+
+    with app.app_context():
+        db.create_all()
+        seed(args)
+        dialect = db.engine.dialect.name
+
+    timings = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+
+    def record(endpoint, elapsed, status):
+        with lock:
+            timings[endpoint].append(elapsed)
+            statuses[endpoint][status] += 1
+
+    clients = [Client(app, args, i, record) for i in range(args.clients)]
+    queries_before = metrics.request_queries.totals()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=client.run, args=(deadline,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    queries = {}
+    for (endpoint,), (count, total) in metrics.request_queries.totals().items():
+        count_before, total_before = queries_before.get((endpoint,), (0, 0))
+        queries[endpoint] = (count - count_before, total - total_before)
+
+    endpoints = summarize(timings, statuses, queries, elapsed)
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'database': dialect,
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'elapsed_seconds': round(elapsed, 2),
+        'total_requests': sum(len(values) for values in timings.values()),
+        'endpoints': endpoints,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{results['total_requests']} requests in {elapsed:.1f} s from {args.clients} clients on {dialect}")
+    print(f"  {'endpoint':24} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8}  statuses")
+    for endpoint, stats in endpoints.items():
+        print(f"  {endpoint:24} {stats['requests']:>6} {stats['rps']:>7} {stats['p50_ms']:>6}ms {stats['p95_ms']:>6}ms "
+              f"{stats['p99_ms']:>6}ms {stats['queries_per_request'] or '-':>8}  {stats['status_codes']}")
+    print(f'Results written to {args.output}')
+    if args.compare:
+        compare(endpoints, args.compare)
+
+
+if __name__ == '__main__':
+    main()
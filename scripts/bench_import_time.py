@@ -0,0 +1,81 @@
+"""Measure how long a worker takes to import the app.
+
+    python scripts/bench_import_time.py --runs 5 --budget-ms 1200
+
+Imports ``app`` in fresh interpreters under ``python -X importtime`` and
+reports the median total plus the slowest top-level packages. Exits non-zero
+if the median exceeds BUDGET_MS or if a deferred SDK (openai,
+googleapiclient, sib_api_v3_sdk) was imported, so it can run as a CI check.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ('openai', 'googleapiclient', 'sib_api_v3_sdk')
+
+_line = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def import_once(env):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    loaded = set()
+    modules = {}
+    for match in _line.finditer(result.stderr):
+        _, cumulative, indent, name = match.groups()
+        loaded.add(name)
+        # ``app`` itself and what it imports directly; deeper imports are
+        # already counted in their parent's total
+        if len(indent) <= 3:
+            modules[name] = int(cumulative) / 1000
+    return modules, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'import.db')}")
+    env.setdefault('EMAIL_TRANSPORT', 'stub')
+
+    totals = []
+    per_module = defaultdict(list)
+    deferred_loaded = set()
+    for _ in range(args.runs):
+        modules, loaded = import_once(env)
+        deferred_loaded.update(name for name in loaded if name.split('.')[0] in DEFERRED)
+        totals.append(modules.get('app', 0))
+        for name, ms in modules.items():
+            per_module[name].append(ms)
+
+    median = statistics.median(totals)
+    print(f"import app: median {median:.0f} ms over {args.runs} runs (min {min(totals):.0f}, max {max(totals):.0f})")
+    per_module.pop('app', None)
+    slowest = sorted(per_module.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, timings in slowest[:args.top]:
+        print(f"  {statistics.median(timings):8.1f} ms  {name}")
+
+    failed = False
+    if deferred_loaded:
+        print(f"FAILED: deferred SDKs imported at startup: {', '.join(sorted(deferred_loaded))}")
+        failed = True
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"FAILED: median import time {median:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark /api/next_available_slots against a seeded SQLite database.
+
+    python scripts/bench_next_available.py --doctors 500 --days 90
+
+Seeds DOCTORS doctors with roughly FILL of their working slots booked over
+DAYS days, then times repeated requests for the earliest LIMIT openings.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--fill', type=float, default=0.6)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('EMAIL_TRANSPORT', 'stub')
+
+    from app import app, db
+    from app.models import Doctor, TimeSlot
+    from app import availability
+
+    start_day = date(2025, 1, 6)
+    with app.app_context():
+        db.create_all()
+        db.session.bulk_save_objects([Doctor(id=f'doc{i}', name=f'Doctor {i}', email=f'doc{i}@example.com') for i in range(args.doctors)])
+        rng = random.Random(42)
+        slots = []
+        for i in range(args.doctors):
+            for offset in range(args.days):
+                for start in availability.working_slots(availability.DEFAULT_WORKING_HOURS, start_day + timedelta(days=offset)):
+                    if rng.random() < args.fill:
+                        slots.append({'doctor_id': f'doc{i}', 'start_time': start, 'is_available': False})
+        db.session.bulk_insert_mappings(TimeSlot, slots)
+        db.session.commit()
+        print(f"Seeded {args.doctors} doctors, {len(slots)} booked slots over {args.days} days")
+
+    client = app.test_client()
+    url = f'/api/next_available_slots?start={datetime.combine(start_day, datetime.min.time()).isoformat()}&days={args.days}&limit={args.limit}'
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.data
+    timings.sort()
+    print(f"{args.runs} requests: p50 {statistics.median(timings):.1f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms, max {timings[-1]:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
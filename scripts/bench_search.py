@@ -0,0 +1,144 @@
+"""Benchmark /api/search_users against a seeded SQLite database.
+
+    python scripts/bench_search.py --users 1000000
+
+Seeds USERS users and DOCTORS doctors with random names, builds the search
+index, then times requests for prefixes of 1 to 6 letters and two-word
+queries taken from the seeded names. Each query is also run through
+``search.search`` directly and as the ``ilike '%term%'`` lookup the index
+replaced (which returned every match); the script exits non-zero if the
+index is slower at p50, p95 or p99, or at p50 on any one- or two-letter
+prefix.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIRST_NAMES = ['Ava', 'Olivia', 'Emma', 'Sophia', 'Mia', 'Amelia', 'Harper', 'Evelyn', 'Abigail', 'Emily',
+               'Liam', 'Noah', 'Oliver', 'Elijah', 'James', 'William', 'Benjamin', 'Lucas', 'Henry', 'Theodore',
+               'Maria', 'Fatima', 'Aisha', 'Mei', 'Yuki', 'Priya', 'Zara', 'Nadia', 'Ines', 'Chloe']
+SYLLABLES = ['an', 'ber', 'cal', 'dor', 'el', 'fin', 'gar', 'han', 'is', 'jon', 'kel', 'lan', 'mor', 'nor',
+             'ow', 'per', 'quin', 'ros', 'sten', 'tor', 'ul', 'van', 'wel', 'yar', 'zim']
+
+
+def random_name(rng):
+    last = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return f"{rng.choice(FIRST_NAMES)} {last.capitalize()}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('EMAIL_TRANSPORT', 'stub')
+
+    from app import app, db, search
+    from app.models import Doctor, User
+
+    rng = random.Random(42)
+    names = []
+    with app.app_context():
+        db.create_all()
+        for model, count, prefix in ((User, args.users, 'user'), (Doctor, args.doctors, 'doc')):
+            batch = []
+            for i in range(count):
+                name = random_name(rng)
+                names.append(name)
+                batch.append({'id': f'{prefix}{i}', 'name': name, 'email': f"{name.replace(' ', '.').lower()}{i}@example.com"})
+                if len(batch) == 10000:
+                    db.session.bulk_insert_mappings(model, batch)
+                    batch = []
+            if batch:
+                db.session.bulk_insert_mappings(model, batch)
+        db.session.commit()
+        started = time.perf_counter()
+        search.rebuild_index()
+        db.session.commit()
+        print(f"Seeded {args.users} users and {args.doctors} doctors, indexed in {time.perf_counter() - started:.1f} s")
+
+    queries = []
+    for _ in range(args.runs):
+        first, last = rng.choice(names).lower().split()
+        if rng.random() < 0.3:
+            queries.append(f"{first[:rng.randint(1, len(first))]} {last[:rng.randint(1, 4)]}")
+        else:
+            queries.append(rng.choice([first, last])[:rng.randint(1, 6)])
+
+    client = app.test_client()
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        response = client.get('/api/search_users', query_string={'term': query, 'limit': args.limit})
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.data
+
+    print(f"{args.runs} requests: " + ', '.join(f"{name} {value:.1f} ms" for name, value in percentiles(timings).items()))
+
+    indexed_timings, baseline = [], []
+    by_prefix = {}
+    with app.app_context():
+        for query in queries:
+            started = time.perf_counter()
+            search.search(query, args.limit)
+            indexed_timings.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            ilike_search(db, query)
+            baseline.append((time.perf_counter() - started) * 1000)
+            if ' ' not in query and len(query) <= 2:
+                indexed, scanned = by_prefix.setdefault(query, ([], []))
+                indexed.append(indexed_timings[-1])
+                scanned.append(baseline[-1])
+
+    failed = []
+    indexed_stats, ilike_stats = percentiles(indexed_timings), percentiles(baseline)
+    for label, stats in (('index', indexed_stats), ('ilike', ilike_stats)):
+        print(f"{label}: " + ', '.join(f"{name} {value:.1f} ms" for name, value in stats.items()))
+    for name in ('p50', 'p95', 'p99'):
+        if indexed_stats[name] > ilike_stats[name]:
+            failed.append(f"{name} {indexed_stats[name]:.1f} ms > ilike {ilike_stats[name]:.1f} ms")
+    for prefix, (indexed, scanned) in sorted(by_prefix.items()):
+        if statistics.median(indexed) > statistics.median(scanned):
+            failed.append(f"{prefix!r} p50 {statistics.median(indexed):.1f} ms > ilike {statistics.median(scanned):.1f} ms")
+    if failed:
+        print("FAILED: index search slower than ilike: " + '; '.join(failed))
+    sys.exit(1 if failed else 0)
+
+
+def ilike_search(db, term):
+    """The ``ilike '%term%'`` lookup of both tables that the search index replaced."""
+    from app.models import Doctor, User
+
+    pattern = f'%{term.lower()}%'
+    return [
+        row
+        for model in (User, Doctor)
+        for row in db.session.execute(
+            db.select(model.id, model.name, model.email).where(model.name.ilike(pattern) | model.email.ilike(pattern))
+        )
+    ]
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        'p50': statistics.median(timings),
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+        'max': timings[-1],
+    }
+
+
+if __name__ == '__main__':
+    main()
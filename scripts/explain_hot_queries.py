@@ -0,0 +1,158 @@
+"""Seed a realistic dataset and compare hot-query plans without and with indexes.
+
+    python scripts/explain_hot_queries.py --doctors 50 --users 2000
+    python scripts/explain_hot_queries.py --database-url postgresql:///scratch --i-know
+
+Runs against a throwaway SQLite file; DATABASE_URL is ignored. To compare
+plans on another engine, pass ``--database-url`` for an empty scratch
+database together with ``--i-know``: the script refuses to touch a database
+that already has any of the app's tables, creates them itself and drops them
+again when it is done. The secondary indexes declared on the models are
+dropped, every hot query from ``app/api/routes.py`` is EXPLAINed and timed,
+then the indexes are recreated and the same queries are run again.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(db, models, args):
+    rng = random.Random(7)
+    start = datetime(2025, 1, 6, 9, 0)
+    doctors = [models.Doctor(id=f'doc{i}', name=f'Doctor {i}', email=f'doc{i}@example.com') for i in range(args.doctors)]
+    users = [models.User(id=f'user{i}', name=f'Patient {i}', email=f'user{i}@example.com') for i in range(args.users)]
+    db.session.bulk_save_objects(doctors + users)
+
+    appointments, slots = [], []
+    for d in range(args.doctors):
+        for day in range(args.days):
+            for half_hour in range(16):
+                if rng.random() < 0.5:
+                    continue
+                moment = start + timedelta(days=day, minutes=30 * half_hour)
+                appointment_id = f'a{d}-{day}-{half_hour}'
+                appointments.append({
+                    'id': appointment_id, 'date': moment, 'purpose': 'Checkup', 'doctor_id': f'doc{d}',
+                    'user_id': f'user{rng.randrange(args.users)}', 'meeting_url': 'https://meet.jit.si/x',
+                    'moderator_url': 'https://meet.jit.si/x', 'meeting_password': 'x', 'is_time_off': False
+                })
+                slots.append({'doctor_id': f'doc{d}', 'start_time': moment, 'is_available': False, 'appointment_id': appointment_id})
+    db.session.bulk_insert_mappings(models.Appointment, appointments)
+    db.session.bulk_insert_mappings(models.TimeSlot, slots)
+
+    messages = []
+    for t in range(args.threads):
+        user_id, doctor_id = f'user{rng.randrange(args.users)}', f'doc{rng.randrange(args.doctors)}'
+        for m in range(args.messages_per_thread):
+            sender, receiver = (user_id, doctor_id) if m % 2 else (doctor_id, user_id)
+            messages.append({
+                'id': f'm{t}-{m}', 'sender_id': sender, 'receiver_id': receiver, 'message': 'Hello',
+                'subject': 'Question', 'thread_id': f'thread{t}', 'timestamp': start + timedelta(minutes=m)
+            })
+    db.session.bulk_insert_mappings(models.Message, messages)
+    db.session.bulk_insert_mappings(models.UploadedFile, [
+        {'filename': f'f{i}.pdf', 'file_path': f'/uploads/f{i}.pdf', 'doctor_id': f'doc{i % args.doctors}'}
+        for i in range(args.doctors * 20)
+    ])
+    db.session.commit()
+    print(f"Seeded {len(doctors)} doctors, {len(users)} users, {len(appointments)} appointments, "
+          f"{len(slots)} booked slots, {len(messages)} messages")
+
+
+def hot_queries(db, models):
+    TimeSlot, Appointment, Message, UploadedFile = models.TimeSlot, models.Appointment, models.Message, models.UploadedFile
+    day = datetime(2025, 2, 3)
+    select = db.select
+    return {
+        'available_slots': select(TimeSlot.start_time).where(
+            TimeSlot.doctor_id == 'doc3', TimeSlot.is_available == False,
+            TimeSlot.start_time >= day, TimeSlot.start_time < day + timedelta(days=1)),
+        'release_slots': select(TimeSlot.id).where(TimeSlot.appointment_id == 'a3-20-4'),
+        'doctor_appointments': select(Appointment.id).where(Appointment.doctor_id == 'doc3'),
+        'time_off_overlap': select(Appointment.id).where(
+            Appointment.doctor_id == 'doc3', Appointment.date < day + timedelta(days=7),
+            db.or_(Appointment.end_date > day,
+                   db.and_(Appointment.end_date.is_(None), Appointment.date > day - timedelta(minutes=30)))),
+        'list_appointments': select(Appointment.id).where(Appointment.user_id == 'user42'),
+        'get_messages': select(Message.id).where(Message.thread_id == 'thread17').order_by(Message.timestamp),
+        'get_chats_sent': select(Message.id).where(Message.sender_id == 'user42'),
+        'get_chats_received': select(Message.id).where(Message.receiver_id == 'user42'),
+        'list_files': select(UploadedFile.id).where(UploadedFile.doctor_id == 'doc3'),
+    }
+
+
+def explain(db, queries, repeat):
+    dialect = db.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        for name, query in queries.items():
+            sql = str(query.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plan = connection.exec_driver_sql(prefix + sql).fetchall()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(query).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            print(f"  {name:<22} {elapsed:8.3f} ms")
+            for row in plan:
+                print(f"      {row[-1]}")
+
+
+def run(db, models, args):
+    seed(db, models, args)
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    queries = hot_queries(db, models)
+
+    for index in indexes:
+        index.drop(db.engine, checkfirst=True)
+    print("\nWithout indexes:")
+    explain(db, queries, args.repeat)
+
+    for index in indexes:
+        index.create(db.engine, checkfirst=True)
+    print("\nWith indexes:")
+    explain(db, queries, args.repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--threads', type=int, default=2000)
+    parser.add_argument('--messages-per-thread', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', help='empty scratch database to use instead of a throwaway SQLite file')
+    parser.add_argument('--i-know', action='store_true',
+                        help='confirm that --database-url may be filled with fake rows and have its indexes dropped')
+    args = parser.parse_args()
+    if args.database_url and not args.i_know:
+        parser.error('--database-url seeds fake rows and drops indexes; pass --i-know to confirm it is a scratch database')
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'explain.db')}"
+    os.environ.setdefault('EMAIL_TRANSPORT', 'stub')
+
+    from app import app, db, models
+
+    with app.app_context():
+        existing = set(inspect(db.engine).get_table_names()) & set(db.metadata.tables)
+        if existing:
+            sys.exit(f"Refusing to run: {', '.join(sorted(existing))} already exist in {db.engine.url!r}; "
+                     "point --database-url at an empty database")
+        db.create_all()
+        try:
+            run(db, models, args)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""Serve local stand-ins for Sendinblue, OpenAI and YouTube with injectable latency, errors and throttling.
+
+    python scripts/fake_upstreams.py --port 8099 --openai latency=lognormal:800:0.5,token_ms=40,errors=0.02
+    FAKE_UPSTREAM_URL=http://localhost:8099 gunicorn run:app
+
+With ``FAKE_UPSTREAM_URL`` set, ``Config`` points OPENAI_BASE_URL,
+YOUTUBE_API_URL and SENDINBLUE_API_URL at this server:
+
+    POST /openai/v1/chat/completions    (plain and ``stream: true``)
+    GET  /youtube/v3/search
+    POST /sendinblue/v3/smtp/email
+
+Each service takes a comma-separated fault profile:
+
+    latency=SPEC       delay before the response starts, in ms: ``120``,
+                       ``uniform:50:300``, ``normal:200:50`` or
+                       ``lognormal:MEDIAN:SIGMA`` (long-tailed, the realistic one)
+    errors=RATE        fraction of requests answered with ``error_status`` (default 500)
+    error_status=CODE
+    hang=RATE          fraction of requests that stall for ``hang_seconds`` (default 120)
+                       before answering, to exercise client timeouts
+    rps=N              token-bucket limit; excess requests get 429 with Retry-After
+    concurrency=N      requests in flight at once; excess requests get 429
+    token_ms=SPEC      OpenAI streams only: delay between tokens
+    words=N            OpenAI answer length (default 60)
+
+GET /_fake/stats returns per-service counts by outcome; POST /_fake/config
+with ``{"openai": {"errors": 0.5}}`` changes a profile while the server runs,
+so one load test can move from a healthy to a failing dependency.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVICES = ('openai', 'youtube', 'sendinblue')
+DEFAULT_PROFILE = {
+    'latency': '0',
+    'errors': 0.0,
+    'error_status': 500,
+    'hang': 0.0,
+    'hang_seconds': 120.0,
+    'rps': None,
+    'concurrency': None,
+    'token_ms': '0',
+    'words': 60,
+}
+NUMERIC = {'errors': float, 'error_status': int, 'hang': float, 'hang_seconds': float, 'rps': float,
+           'concurrency': int, 'words': int}
+WORDS = ('during', 'pregnancy', 'it', 'is', 'common', 'to', 'feel', 'tired', 'and', 'staying', 'hydrated',
+         'gentle', 'exercise', 'regular', 'checkups', 'with', 'your', 'doctor', 'help', 'most', 'people')
+
+
+def parse_delay(spec):
+    """Turn a latency spec into a function returning seconds."""
+    kind, _, rest = str(spec).partition(':')
+    params = [float(value) for value in rest.split(':')] if rest else []
+    if not params:
+        fixed = float(kind) / 1000
+        return lambda: fixed
+    if kind == 'uniform':
+        low, high = params
+        return lambda: random.uniform(low, high) / 1000
+    if kind == 'normal':
+        mean, sd = params
+        return lambda: max(0.0, random.gauss(mean, sd)) / 1000
+    if kind == 'lognormal':
+        median, sigma = params
+        return lambda: random.lognormvariate(0, sigma) * median / 1000
+    raise ValueError(f'Unknown latency distribution {kind!r}')
+
+
+def parse_profile(spec):
+    profile = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = item.partition('=')
+        if key not in DEFAULT_PROFILE:
+            raise ValueError(f'Unknown fault setting {key!r}')
+        profile[key] = NUMERIC[key](value) if key in NUMERIC else value
+    return profile
+
+
+class Upstream:
+    """Fault profile, throttles and counters for one fake service."""
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.configure(profile)
+
+    def configure(self, changes):
+        with self._lock:
+            profile = dict(getattr(self, 'profile', DEFAULT_PROFILE))
+            profile.update(changes)
+            # Validate before swapping anything in
+            latency, token_delay = parse_delay(profile['latency']), parse_delay(profile['token_ms'])
+            self.profile, self.latency, self.token_delay = profile, latency, token_delay
+            self._tokens = profile['rps'] or 0
+            self._refilled = time.monotonic()
+
+    def admit(self):
+        """Return None to serve the request, or the (status, retry_after) to reject it with."""
+        with self._lock:
+            profile = self.profile
+            if profile['rps']:
+                now = time.monotonic()
+                self._tokens = min(profile['rps'], self._tokens + (now - self._refilled) * profile['rps'])
+                self._refilled = now
+                if self._tokens < 1:
+                    self.stats['throttled'] += 1
+                    return 429, max(1, round((1 - self._tokens) / profile['rps']))
+                self._tokens -= 1
+            if profile['concurrency'] and self._in_flight >= profile['concurrency']:
+                self.stats['throttled'] += 1
+                return 429, 1
+            self._in_flight += 1
+            return None
+
+    def release(self, outcome):
+        with self._lock:
+            self._in_flight -= 1
+            self.stats[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'profile': self.profile, 'in_flight': self._in_flight, 'outcomes': dict(self.stats)}
+
+
+def openai_error(status):
+    kind = 'rate_limit_exceeded' if status == 429 else 'server_error'
+    return {'error': {'message': f'Simulated {status} from the fake OpenAI server', 'type': kind, 'code': kind}}
+
+
+def youtube_error(status):
+    return {'error': {'code': status, 'message': f'Simulated {status} from the fake YouTube server'}}
+
+
+def sendinblue_error(status):
+    return {'code': 'too_many_requests' if status == 429 else 'internal_error',
+            'message': f'Simulated {status} from the fake Sendinblue server'}
+
+
+ERRORS = {'openai': openai_error, 'youtube': youtube_error, 'sendinblue': sendinblue_error}
+ROUTES = {
+    ('POST', '/openai/v1/chat/completions'): 'openai',
+    ('GET', '/youtube/v3/search'): 'youtube',
+    ('POST', '/sendinblue/v3/smtp/email'): 'sendinblue',
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstreams = {}
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        if url.path == '/_fake/stats' and method == 'GET':
+            return self.send_json(200, {name: upstream.snapshot() for name, upstream in self.upstreams.items()})
+        if url.path == '/_fake/config' and method == 'POST':
+            try:
+                for name, changes in self.read_json().items():
+                    self.upstreams[name].configure(changes)
+            except (KeyError, TypeError, ValueError) as e:
+                return self.send_json(400, {'error': f'Invalid fault profile: {e}'})
+            return self.send_json(200, {name: upstream.profile for name, upstream in self.upstreams.items()})
+
+        service = ROUTES.get((method, url.path))
+        if service is None:
+            return self.send_json(404, {'error': f'No fake for {method} {url.path}'})
+        upstream = self.upstreams[service]
+        body = self.read_json() if method == 'POST' else {}
+        rejected = upstream.admit()
+        if rejected:
+            status, retry_after = rejected
+            return self.send_json(status, ERRORS[service](status), headers=[('Retry-After', str(retry_after))])
+
+        outcome = 'error'
+        try:
+            profile = upstream.profile
+            delay = upstream.latency()
+            if random.random() < profile['hang']:
+                outcome = 'hung'
+                delay = profile['hang_seconds']
+            time.sleep(delay)
+            if random.random() < profile['errors']:
+                return self.send_json(profile['error_status'], ERRORS[service](profile['error_status']))
+            getattr(self, f'serve_{service}')(upstream, body, parse_qs(url.query))
+            if outcome != 'hung':
+                outcome = 'ok'
+        except (BrokenPipeError, ConnectionResetError):
+            outcome = 'client_gone'
+        finally:
+            upstream.release(outcome)
+
+    def serve_openai(self, upstream, body, query):
+        question = next((message.get('content', '') for message in reversed(body.get('messages', []))
+                         if message.get('role') == 'user'), '')
+        words = [random.choice(WORDS) for _ in range(upstream.profile['words'])]
+        tokens = [f'Simulated answer to "{question[:80]}":'] + [f' {word}' for word in words]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        model = body.get('model', 'gpt-3.5-turbo')
+
+        if not body.get('stream'):
+            return self.send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(question.split()), 'completion_tokens': len(tokens),
+                          'total_tokens': len(question.split()) + len(tokens)},
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None):
+            event = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            self.wfile.write(f'data: {json.dumps(event)}\n\n'.encode())
+            self.wfile.flush()
+
+        chunk({'role': 'assistant', 'content': ''})
+        for token in tokens:
+            time.sleep(upstream.token_delay())
+            chunk({'content': token})
+        chunk({}, 'stop')
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+    def serve_youtube(self, upstream, body, query):
+        q = query.get('q', [''])[0]
+        count = min(int(query.get('maxResults', ['5'])[0]), 50)
+        self.send_json(200, {
+            'kind': 'youtube#searchListResponse',
+            'pageInfo': {'totalResults': count, 'resultsPerPage': count},
+            'items': [{
+                'kind': 'youtube#searchResult',
+                'id': {'kind': 'youtube#video', 'videoId': uuid.uuid4().hex[:11]},
+                'snippet': {'title': f'{q} - video {i + 1}', 'description': f'Simulated result {i + 1} for {q}'},
+            } for i in range(count)],
+        })
+
+    def serve_sendinblue(self, upstream, body, query):
+        self.send_json(201, {'messageId': f'<{uuid.uuid4().hex}@fake-sendinblue>'})
+
+
+def make_server(host='127.0.0.1', port=0, profiles=None, verbose=False):
+    """A fake upstream server with its own counters; ``profiles`` maps a service to its fault settings.
+
+    Port 0 picks a free port (``server.server_port``). Call ``serve_forever``
+    to run it, for instance on a daemon thread from a test.
+    """
+    profiles = profiles or {}
+    unknown = set(profiles) - set(SERVICES)
+    if unknown:
+        raise ValueError(f"Unknown services: {', '.join(sorted(unknown))}")
+    handler = type('Handler', (Handler,), {
+        'upstreams': {service: Upstream(service, profiles.get(service, {})) for service in SERVICES},
+        'verbose': verbose,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--all', default='', metavar='PROFILE', help='fault profile applied to every service')
+    for service in SERVICES:
+        parser.add_argument(f'--{service}', default='', metavar='PROFILE')
+    parser.add_argument('--seed', type=int, help='make the injected faults reproducible')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    try:
+        shared = parse_profile(args.all)
+        server = make_server(args.host, args.port, {service: {**shared, **parse_profile(getattr(args, service))}
+                                                    for service in SERVICES}, args.verbose)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f'Fake upstreams on http://{args.host}:{args.port} (set FAKE_UPSTREAM_URL to this)')
+    for name, upstream in server.RequestHandlerClass.upstreams.items():
+        print(f'  {name}: {upstream.profile}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Hammer a single slot from many threads and check it is booked exactly once.
+
+    python scripts/stress_booking.py --threads 32
+
+Uses DATABASE_URL when it is set (point it at PostgreSQL for a realistic
+run; the tables must already exist), otherwise a throwaway SQLite file.
+Half of the threads book as distinct patients, the other half retry one
+request with the same Idempotency-Key.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress.db')}"
+    os.environ.setdefault('EMAIL_TRANSPORT', 'stub')
+
+    from app import app, db
+    from app.models import Appointment, Doctor, TimeSlot
+
+    with app.app_context():
+        db.create_all()
+        doctor = Doctor(id='stress-doctor', name='Dr Stress', email='stress-doctor@example.com')
+        db.session.merge(doctor)
+        db.session.commit()
+
+    slot = '2030-01-07T14:00:00'  # 10:00 once schedule_meeting applies its -4h offset
+    barrier = threading.Barrier(args.threads)
+    results = []
+    lock = threading.Lock()
+
+    def book(i):
+        client = app.test_client()
+        retry = i % 2 == 0
+        headers = {'Idempotency-Key': 'stress-retry'} if retry else {}
+        email = 'retry@example.com' if retry else f'patient{i}@example.com'
+        barrier.wait()
+        response = client.post('/api/schedule_meeting', headers=headers, json={
+            'date': slot, 'purpose': 'Stress', 'doctor': 'stress-doctor', 'email': email, 'name': f'Patient {i}'
+        })
+        body = response.get_json() or {}
+        with lock:
+            results.append((retry, response.status_code, body.get('appointment', {}).get('id')))
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print('Status codes:', dict(Counter(status for _, status, _ in results)))
+    with app.app_context():
+        appointments = Appointment.query.filter_by(doctor_id='stress-doctor').count()
+        slots = TimeSlot.query.filter_by(doctor_id='stress-doctor').count()
+    winners = {appointment_id for _, status, appointment_id in results if status == 200}
+    retry_ids = {appointment_id for retry, status, appointment_id in results if retry and status == 200}
+    print(f'Appointments: {appointments}, booked slot rows: {slots}, distinct winning appointments: {len(winners)}')
+
+    ok = appointments == 1 and slots == 1 and len(winners) == 1 and len(retry_ids) <= 1
+    print('OK' if ok else 'FAILED: slot was double booked')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
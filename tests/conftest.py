@@ -0,0 +1,84 @@
+"""Shared fixtures. The app reads its configuration at import time, so the
+environment is pointed at a throwaway SQLite database and offline backends
+before ``app`` is imported."""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+_tmp = tempfile.mkdtemp(prefix='hello-belly-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    'UPLOAD_FOLDER': os.path.join(_tmp, 'uploads'),
+    'EMAIL_TRANSPORT': 'stub',
+    'OUTBOX_ENABLED': '0',
+    'JOBS_ENABLED': '0',
+    'EVENTS_BACKEND': 'local',
+    'LOG_LEVEL': 'WARNING',
+    'OPENAI_API_KEY': 'test',
+    'YOUTUBE_API_KEY': 'test',
+})
+
+from app import app as flask_app, availability, db, listcache  # noqa: E402
+from app.models import Appointment, Doctor, TimeSlot, User  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.create_all()
+        yield db
+        db.session.remove()
+        db.drop_all()
+    # In-process caches would otherwise carry rows from one test into the next
+    availability.occupancy = availability.OccupancyIndex(app.config['OCCUPANCY_TTL'])
+    listcache.cache = listcache.ListCache(app.config)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def doctor(database):
+    doctor = Doctor(id='doc1', name='Dr Who', email='doc1@example.com')
+    database.session.add(doctor)
+    database.session.commit()
+    return doctor
+
+
+@pytest.fixture
+def patient(database):
+    user = User(id='user1', name='Pat Ient', email='patient@example.com')
+    database.session.add(user)
+    database.session.commit()
+    return user
+
+
+def add_appointments(doctor_id, user_id, count, first=datetime(2030, 1, 7, 9)):
+    """Bulk insert ``count`` booked appointments, with their slots, from ``first`` on."""
+    from datetime import timedelta
+
+    appointments, slots = [], []
+    for i in range(count):
+        start = first + timedelta(minutes=30 * i)
+        appointments.append({
+            'id': f'appt{i}', 'date': start, 'purpose': 'Checkup', 'doctor_id': doctor_id, 'user_id': user_id,
+            'meeting_url': 'https://meet.jit.si/x', 'moderator_url': 'https://meet.jit.si/x',
+            'meeting_password': 'x', 'is_time_off': False
+        })
+        slots.append({'doctor_id': doctor_id, 'start_time': start, 'is_available': False, 'appointment_id': f'appt{i}'})
+    db.session.bulk_insert_mappings(Appointment, appointments)
+    db.session.bulk_insert_mappings(TimeSlot, slots)
+    db.session.commit()
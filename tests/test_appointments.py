@@ -0,0 +1,36 @@
+"""Appointment lists run a fixed number of statements however many rows they return."""
+import pytest
+
+from app import querycheck
+
+from .conftest import add_appointments
+
+
+@pytest.mark.parametrize('count', [1, 100, 10000])
+def test_list_appointments_statement_count_is_constant(client, doctor, patient, count):
+    add_appointments(doctor.id, patient.id, count)
+    email, doctor_name = patient.email, doctor.name
+
+    with querycheck.count_queries() as queries:
+        response = client.get('/api/appointments', query_string={'email': email})
+
+    assert response.status_code == 200
+    appointments = response.get_json()['appointments']
+    assert len(appointments) == count
+    assert appointments[0]['doctor']['name'] == doctor_name
+    assert appointments[0]['user']['email'] == email
+    # The user lookup, then every appointment with its user and doctor joined in
+    assert queries.count == 2, queries.report()
+
+
+@pytest.mark.parametrize('count', [1, 100, 10000])
+def test_doctor_appointments_statement_count_is_constant(client, doctor, patient, count):
+    add_appointments(doctor.id, patient.id, count)
+    doctor_id = doctor.id
+
+    with querycheck.count_queries() as queries:
+        response = client.get('/api/doctor_appointments', query_string={'doctor_id': doctor_id})
+
+    assert response.status_code == 200
+    assert len(response.get_json()['appointments']) == count
+    assert queries.count == 1, queries.report()
@@ -0,0 +1,94 @@
+"""/api/chatgpt against scripts/fake_upstreams.py: one OpenAI call per question, however many ask."""
+import importlib.util
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import answers
+from app.clients import _openai, clients
+
+spec = importlib.util.spec_from_file_location(
+    'fake_upstreams', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts', 'fake_upstreams.py')
+)
+fake_upstreams = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fake_upstreams)
+
+
+@pytest.fixture
+def openai(app):
+    # Slow enough that every concurrent request arrives while the first is in flight
+    server = fake_upstreams.make_server(profiles={'openai': {'latency': '300', 'words': 5}})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    config = {**app.config, 'OPENAI_BASE_URL': f'http://127.0.0.1:{server.server_port}/openai/v1'}
+    clients.register('openai', lambda: _openai(config))
+    answers.cache = answers.AnswerCache(app)
+
+    yield server.RequestHandlerClass.upstreams['openai']
+
+    server.shutdown()
+    server.server_close()
+    clients.register('openai', lambda: _openai(app.config))
+    answers.cache = answers.AnswerCache(app)
+
+
+def ask(client, question, **extra):
+    return client.post('/api/chatgpt', json={'question': question, **extra})
+
+
+def test_concurrent_identical_questions_make_one_upstream_call(app, openai):
+    def worker(_):
+        return ask(app.test_client(), 'Is coffee safe while pregnant?')
+
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(worker, range(8)))
+
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.get_json()['answer'] for response in responses}) == 1
+    assert openai.snapshot()['outcomes'] == {'ok': 1}
+    stats = answers.cache.snapshot()
+    assert stats['misses'] == 1
+    assert stats['coalesced'] + stats['hits'] == 7
+
+
+def test_repeated_question_is_served_from_cache(client, openai):
+    first = ask(client, 'Is coffee safe while pregnant?')
+    again = ask(client, '  is COFFEE safe while pregnant ')
+
+    assert again.get_json() == first.get_json()
+    assert openai.snapshot()['outcomes'] == {'ok': 1}
+
+
+def test_streamed_answer_is_relayed_and_cached(client, openai):
+    response = ask(client, 'Can I fly in the third trimester?', stream=True)
+
+    assert response.mimetype == 'text/event-stream'
+    events = [
+        (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+        for block in response.get_data(as_text=True).split('\n\n') if block.startswith('event: ')
+    ]
+    tokens = [data['text'] for name, data in events if name == 'token']
+    assert len(tokens) > 1
+    assert events[-1] == ('done', {'answer': ''.join(tokens).strip()})
+
+    cached = ask(client, 'Can I fly in the third trimester?')
+    assert cached.get_json()['answer'] == ''.join(tokens).strip()
+    assert openai.snapshot()['outcomes'] == {'ok': 1}
+
+
+def test_upstream_error_is_reported_and_not_cached(client, openai):
+    # 400 is not retried by the SDK, so each request is exactly one upstream call
+    openai.configure({'errors': 1.0, 'error_status': 400})
+    failed = ask(client, 'Is sushi safe?')
+    assert failed.status_code == 500
+    assert 'error' in failed.get_json()
+
+    openai.configure({'errors': 0.0})
+    recovered = ask(client, 'Is sushi safe?')
+    assert recovered.status_code == 200
+    assert recovered.get_json()['answer'].startswith('Simulated answer')
+    assert openai.snapshot()['outcomes'] == {'error': 1, 'ok': 1}
+    assert answers.cache.snapshot()['errors'] == 1
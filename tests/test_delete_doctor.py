@@ -0,0 +1,33 @@
+"""A doctor being deleted is hidden and unbookable until the job has removed their rows."""
+from datetime import datetime
+
+from app import availability, db, jobs
+from app.models import Doctor, Job, TimeSlot
+
+from .conftest import add_appointments
+
+# Free and inside the default working hours
+SLOT = datetime(2030, 1, 8, 14)
+
+
+def test_doctor_is_blocked_as_soon_as_deletion_starts(client, doctor, patient):
+    add_appointments(doctor.id, patient.id, 3)
+
+    response = client.delete('/api/doctors/doc1')
+    assert response.status_code == 202
+
+    assert client.get('/api/doctors').get_json()['doctors'] == []
+    assert not availability.claim_slot('doc1', SLOT, 'late')
+    assert not availability.book_range('doc1', SLOT, SLOT.replace(hour=16), 'late')
+    db.session.rollback()
+    # The route shifts incoming times back by four hours
+    booked = client.post('/api/schedule_meeting', json={
+        'date': SLOT.replace(hour=18).isoformat(), 'purpose': 'Checkup', 'doctor': 'doc1',
+        'email': 'patient@example.com', 'name': 'Pat Ient',
+    })
+    assert booked.status_code == 404
+
+    jobs.runner.run_once()
+    assert db.session.get(Job, response.get_json()['job']['id']).status == 'succeeded'
+    assert db.session.get(Doctor, 'doc1') is None
+    assert TimeSlot.query.count() == 0
@@ -0,0 +1,29 @@
+"""Worker boot stays cheap: ``import app`` within budget and without the deferred SDKs."""
+import importlib.util
+import os
+import tempfile
+
+spec = importlib.util.spec_from_file_location(
+    'bench_import_time', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts', 'bench_import_time.py')
+)
+bench_import_time = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_import_time)
+
+# About 1 s here; the best of a few runs keeps a loaded machine from failing the build
+IMPORT_BUDGET_MS = 2000
+RUNS = 3
+
+
+def test_import_app_within_budget():
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'import.db')}"
+
+    totals, loaded = [], set()
+    for _ in range(RUNS):
+        modules, names = bench_import_time.import_once(env)
+        totals.append(modules['app'])
+        loaded |= names
+
+    assert min(totals) <= IMPORT_BUDGET_MS, f'import app took {min(totals):.0f} ms (best of {RUNS})'
+    deferred = sorted(name for name in loaded if name.split('.')[0] in bench_import_time.DEFERRED)
+    assert not deferred, f'deferred SDKs imported at startup: {deferred}'
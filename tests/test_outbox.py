@@ -0,0 +1,111 @@
+"""Booking emails are sent only if the booking commits, each by one worker, with retries."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, outbox
+from app.models import Appointment, EmailOutbox
+
+# Free and inside the default working hours
+SLOT = datetime(2030, 1, 8, 14)
+
+
+class FlakyTransport:
+    """Records what it sends and fails the first ``failures`` attempts."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def send(self, to_email, subject, body):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('Sendinblue is down')
+        self.sent.append((to_email, subject))
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(outbox.dispatcher, 'transport', FlakyTransport())
+    outbox.dispatcher._wakeup.clear()
+    return outbox.dispatcher
+
+
+def test_booking_emails_are_sent_after_it_commits(client, dispatcher, doctor):
+    # The route shifts incoming times back by four hours
+    response = client.post('/api/schedule_meeting', json={
+        'date': (SLOT + timedelta(hours=4)).isoformat(), 'purpose': 'Checkup', 'doctor': 'doc1',
+        'email': 'patient@example.com', 'name': 'Pat Ient',
+    })
+    assert response.status_code == 200
+    assert EmailOutbox.query.filter_by(status='pending').count() == 2
+    assert dispatcher._wakeup.is_set()
+
+    assert dispatcher.drain_once() == 2
+    assert sorted(to for to, _ in dispatcher.transport.sent) == ['doc1@example.com', 'patient@example.com']
+    assert {email.status for email in EmailOutbox.query} == {'sent'}
+    assert dispatcher.drain_once() == 0
+
+
+def test_rolled_back_booking_sends_nothing(dispatcher, doctor, patient):
+    db.session.add(Appointment(id='appt1', date=SLOT, purpose='Checkup', doctor_id='doc1', user_id='user1',
+                               meeting_url='https://meet.jit.si/x', moderator_url='https://meet.jit.si/x',
+                               meeting_password='x'))
+    outbox.enqueue_email('patient@example.com', 'Meeting Scheduled: Checkup', 'Details')
+    db.session.flush()
+    db.session.rollback()
+
+    assert 'outbox_dirty' not in db.session.info
+    assert not dispatcher._wakeup.is_set()
+    assert EmailOutbox.query.count() == 0
+    assert dispatcher.drain_once() == 0
+    assert dispatcher.transport.sent == []
+
+
+def test_claimed_email_is_leased_to_one_worker(app, dispatcher):
+    outbox.enqueue_email('patient@example.com', 'Reminder', 'Details')
+    db.session.commit()
+    email_id = EmailOutbox.query.one().id
+    now = datetime.utcnow()
+
+    assert dispatcher._claim(email_id, now)
+    assert not dispatcher._claim(email_id, now)
+    email = db.session.get(EmailOutbox, email_id)
+    assert email.attempts == 1
+    assert email.next_attempt_at == now + timedelta(seconds=app.config['OUTBOX_LEASE_SECONDS'])
+    # Not due again until the lease runs out
+    assert dispatcher.drain_once() == 0
+
+    email.next_attempt_at = now - timedelta(seconds=1)
+    db.session.commit()
+    assert dispatcher.drain_once() == 1
+    assert db.session.get(EmailOutbox, email_id).attempts == 2
+
+
+def test_failed_send_is_retried_with_backoff(app, dispatcher, monkeypatch):
+    dispatcher.transport.failures = 1
+    outbox.enqueue_email('patient@example.com', 'Reminder', 'Details')
+    db.session.commit()
+
+    before = datetime.utcnow()
+    assert dispatcher.drain_once() == 1
+    email = EmailOutbox.query.one()
+    assert (email.status, email.attempts, email.last_error) == ('pending', 1, 'Sendinblue is down')
+    base = timedelta(seconds=app.config['OUTBOX_BACKOFF_BASE'])
+    # The first retry waits the base delay plus up to half of it in jitter
+    assert before + base <= email.next_attempt_at <= datetime.utcnow() + base * 1.5
+    assert dispatcher.drain_once() == 0
+
+    email.next_attempt_at = before
+    db.session.commit()
+    assert dispatcher.drain_once() == 1
+    email = EmailOutbox.query.one()
+    assert (email.status, email.attempts, email.last_error) == ('sent', 2, None)
+    assert dispatcher.transport.sent == [('patient@example.com', 'Reminder')]
+
+    monkeypatch.setitem(app.config, 'OUTBOX_MAX_ATTEMPTS', 1)
+    dispatcher.transport.failures = 1
+    outbox.enqueue_email('doc1@example.com', 'Reminder', 'Details')
+    db.session.commit()
+    assert dispatcher.drain_once() == 1
+    assert EmailOutbox.query.filter_by(to_email='doc1@example.com').one().status == 'failed'
@@ -0,0 +1,71 @@
+"""Routes stay within their ``@query_budget`` and run no N+1 queries."""
+from datetime import datetime
+
+import pytest
+
+from app import db, inbox, querycheck
+from app.models import Message
+
+from .conftest import add_appointments
+
+GET_ROUTES = [
+    ('/api/appointments', {'email': 'patient@example.com'}),
+    ('/api/doctor_appointments', {'doctor_id': 'doc1'}),
+    ('/api/doctors', {}),
+    ('/api/admin/doctors', {}),
+    ('/api/available_slots', {'doctor_id': 'doc1', 'date': '2030-01-07'}),
+    ('/api/available_slots', {'doctor_id': 'doc1', 'date': '2030-01-07', 'days': 31}),
+    ('/api/next_available_slots', {'start': '2030-01-07T09:00:00'}),
+    ('/api/search_users', {'term': 'pat'}),
+    ('/api/chats', {'userId': 'user1'}),
+    ('/api/messages', {'threadId': 'thread1'}),
+]
+
+
+@pytest.fixture
+def seeded(doctor, patient):
+    add_appointments(doctor.id, patient.id, 20)
+    for i in range(10):
+        message = Message(id=f'msg{i}', sender_id=patient.id if i % 2 else doctor.id,
+                          receiver_id=doctor.id if i % 2 else patient.id, message=f'Message {i}',
+                          subject='Follow-up', thread_id='thread1', timestamp=datetime(2030, 1, 1, 12, i))
+        db.session.add(message)
+        inbox.record_message(message)
+    db.session.commit()
+
+
+def budget_for(app, method, path):
+    adapter = app.url_map.bind('localhost')
+    endpoint, _ = adapter.match(path, method=method)
+    return getattr(app.view_functions[endpoint], 'query_budget')
+
+
+@pytest.mark.parametrize('path,params', GET_ROUTES)
+def test_get_routes_stay_within_budget(app, client, seeded, path, params):
+    with querycheck.count_queries() as queries:
+        response = client.get(path, query_string=params)
+    assert response.status_code == 200, response.data
+    queries.assert_at_most(budget_for(app, 'GET', path))
+    queries.assert_no_n_plus_one()
+
+
+def test_booking_routes_stay_within_budget(app, client, seeded):
+    with querycheck.count_queries() as queries:
+        response = client.post('/api/schedule_meeting', json={
+            'date': '2030-02-04T14:00:00', 'purpose': 'Checkup', 'doctor': 'doc1',
+            'email': 'patient@example.com', 'name': 'Pat Ient'
+        })
+    assert response.status_code == 200, response.data
+    assert queries.count > 0
+    queries.assert_at_most(budget_for(app, 'POST', '/api/schedule_meeting'))
+    appointment_id = response.get_json()['appointment']['id']
+
+    with querycheck.count_queries() as queries:
+        response = client.put(f'/api/appointments/{appointment_id}', json={'date': '2030-02-04T15:00:00'})
+    assert response.status_code == 200, response.data
+    queries.assert_at_most(budget_for(app, 'PUT', f'/api/appointments/{appointment_id}'))
+
+    with querycheck.count_queries() as queries:
+        response = client.delete(f'/api/appointments/{appointment_id}')
+    assert response.status_code == 200, response.data
+    queries.assert_at_most(budget_for(app, 'DELETE', f'/api/appointments/{appointment_id}'))
@@ -0,0 +1,51 @@
+"""People search intersects every word before ranking, and bookings only re-index real changes."""
+from app import booking, db, querycheck, search
+from app.models import SearchToken, User
+
+
+def test_multi_word_search_finds_people_behind_a_common_first_word(client):
+    # Far more "ann..." tokens than the old 1000-per-word cut, all sorting before the match
+    db.session.bulk_insert_mappings(User, [
+        {'id': f'u{i}', 'name': f'Ann{i:05d} Smith', 'email': f'ann{i}@example.com'} for i in range(1500)
+    ] + [{'id': 'target', 'name': 'Annz Zimmer', 'email': 'target@example.com'}])
+    search.rebuild_index()
+    db.session.commit()
+
+    results = client.get('/api/search_users', query_string={'term': 'ann zim'}).get_json()
+    assert [person['id'] for person in results['results']] == ['target']
+
+
+def test_upsert_user_reindexes_only_new_or_renamed_users():
+    def tokens():
+        return {row.token for row in SearchToken.query.filter_by(person_id=user_id)}
+
+    user_id = booking.upsert_user('new1', 'pat@example.com', 'Pat Ient')
+    assert db.session.info['search_dirty'] == {('user', 'new1')}
+    db.session.commit()
+    assert 'ient' in tokens()
+
+    with querycheck.count_queries() as queries:
+        assert booking.upsert_user('new2', 'pat@example.com', 'Pat Ient') == user_id
+        db.session.commit()
+    assert not db.session.info.get('search_dirty')
+    # The no-op upsert, then the id lookup; nothing is re-tokenized
+    assert queries.count == 2, queries.report()
+
+    assert booking.upsert_user('new3', 'pat@example.com', 'Pat Renamed', update_name=False) == user_id
+    assert not db.session.info.get('search_dirty')
+    assert booking.upsert_user('new4', 'pat@example.com', 'Pat Renamed') == user_id
+    db.session.commit()
+    assert 'renamed' in tokens() and 'ient' not in tokens()
+
+
+def test_punctuated_names_and_whole_emails_are_found():
+    db.session.add_all([
+        User(id='mj', name='Mary-Jane Watson', email='mj@example.com'),
+        User(id='ob', name="Siobhan O'Brien", email='s.obrien@example.com'),
+    ])
+    db.session.commit()
+
+    assert [person['id'] for person in search.search('Mary-Jane', 10)] == ['mj']
+    assert [person['id'] for person in search.search("o'brien", 10)] == ['ob']
+    assert [person['id'] for person in search.search('s.obrien@example.com', 10)] == ['ob']
+    assert search.query_words('Mary-Jane  s.obrien@Example.com') == ['mary', 'jane', 's.obrien@example.com']
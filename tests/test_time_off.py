@@ -0,0 +1,95 @@
+"""Time off claims its slots in a fixed number of statements and never takes booked ones."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import availability, db, querycheck
+from app.models import Appointment, TimeSlot
+
+START = datetime(2030, 1, 7, 9)
+
+
+def add_appointment(appointment_id, start, end=None):
+    db.session.add(Appointment(
+        id=appointment_id, date=start, end_date=end, purpose='Leave', doctor_id='doc1', user_id='user1',
+        meeting_url='N/A', moderator_url='N/A', meeting_password='N/A', is_time_off=end is not None
+    ))
+    db.session.commit()
+
+
+def slots_of(appointment_id):
+    return TimeSlot.query.filter_by(appointment_id=appointment_id).count()
+
+
+def request_time_off(client, start, end, purpose='Leave'):
+    # The route shifts incoming times back by four hours
+    return client.post('/api/request_time_off', json={
+        'date': (start + timedelta(hours=4)).isoformat(),
+        'end_date': (end + timedelta(hours=4)).isoformat(),
+        'purpose': purpose, 'doctor': 'doc1', 'email': 'patient@example.com', 'name': 'Pat Ient',
+    })
+
+
+@pytest.mark.parametrize('length', [timedelta(hours=1), timedelta(days=1), timedelta(days=90), timedelta(days=365)])
+def test_book_and_release_statement_count_is_constant(doctor, patient, length):
+    add_appointment('off1', START, START + length)
+    doctor_id = doctor.id
+
+    with querycheck.count_queries() as queries:
+        assert availability.book_range(doctor_id, START, START + length, 'off1')
+    assert queries.count == 1, queries.report()
+    db.session.commit()
+    assert slots_of('off1') == length // availability.SLOT_LENGTH
+
+    with querycheck.count_queries() as queries:
+        availability.release_slots('off1')
+    assert queries.count == 1, queries.report()
+    db.session.commit()
+    assert slots_of('off1') == 0
+
+
+def test_overlapping_time_off_is_rejected_and_keeps_the_first_range(client, doctor, patient):
+    first = request_time_off(client, START + timedelta(hours=4), START + timedelta(hours=7))
+    assert first.status_code == 201
+    first_id = Appointment.query.filter_by(is_time_off=True).one().id
+
+    inside = request_time_off(client, START + timedelta(hours=5), START + timedelta(hours=6))
+    assert inside.status_code == 400
+    assert Appointment.query.filter_by(is_time_off=True).count() == 1
+    assert slots_of(first_id) == 6
+
+
+def test_book_range_does_not_take_slots_held_by_another_appointment(doctor, patient):
+    add_appointment('off1', START, START + timedelta(hours=3))
+    assert availability.book_range(doctor.id, START, START + timedelta(hours=3), 'off1')
+    db.session.commit()
+    add_appointment('off2', START + timedelta(hours=1), START + timedelta(hours=2))
+
+    assert not availability.book_range(doctor.id, START + timedelta(hours=1), START + timedelta(hours=2), 'off2')
+    db.session.rollback()
+    assert slots_of('off1') == 6
+    assert slots_of('off2') == 0
+
+
+def test_time_off_spanning_an_appointment_is_rejected(client, doctor, patient):
+    add_appointment('appt', START + timedelta(hours=1))
+    assert availability.claim_slot(doctor.id, START + timedelta(hours=1), 'appt')
+    db.session.commit()
+
+    response = request_time_off(client, START, START + timedelta(hours=2))
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Some time slots within the range are already booked'
+    assert Appointment.query.filter_by(is_time_off=True).count() == 0
+
+
+def test_reschedule_onto_own_range_is_allowed(client, doctor, patient):
+    add_appointment('off1', START, START + timedelta(hours=2))
+    assert availability.book_range(doctor.id, START, START + timedelta(hours=2), 'off1')
+    db.session.commit()
+
+    response = client.put('/api/request_time_off/off1', json={
+        'new_start_date': (START + timedelta(hours=5)).isoformat(),
+        'new_end_date': (START + timedelta(hours=7)).isoformat(),
+    })
+    assert response.status_code == 200
+    assert slots_of('off1') == 4
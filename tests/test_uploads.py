@@ -0,0 +1,124 @@
+"""Blobs appear only once their row is committed, are served with caching, ranges and offload,
+and racing chunks cannot mix."""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import db, uploads
+from app.models import StoredBlob
+
+
+def upload(client, content=b'hello scan', filename='scan.pdf'):
+    return client.post('/api/upload', data={'doctor_id': 'doc1', 'file': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+
+def test_list_files_returns_download_urls(client, doctor):
+    stored = upload(client).get_json()['file']
+
+    files = client.get('/api/files', query_string={'doctor_id': 'doc1'}).get_json()['files']
+    assert files == [stored]
+    assert client.get(files[0]['url']).data == b'hello scan'
+
+
+def test_blob_is_moved_into_place_on_commit_only(tmp_path, doctor):
+    path = tmp_path / 'part'
+    path.write_bytes(b'rolled back')
+    sha256 = '0' * 64
+
+    uploads.store_file(str(path), sha256, 11, 'scan.pdf', 'doc1')
+    db.session.flush()
+    assert not os.path.exists(uploads.blob_path(sha256))
+    db.session.rollback()
+    assert not path.exists()
+    assert not os.path.exists(uploads.blob_path(sha256))
+    assert db.session.get(StoredBlob, sha256) is None
+
+    path.write_bytes(b'committed')
+    uploads.store_file(str(path), sha256, 9, 'scan.pdf', 'doc1')
+    db.session.commit()
+    assert not path.exists()
+    with open(uploads.blob_path(sha256), 'rb') as f:
+        assert f.read() == b'committed'
+
+
+def test_blob_is_revalidated_with_its_hash(client, doctor):
+    url = upload(client).get_json()['file']['url']
+    sha256 = hashlib.sha256(b'hello scan').hexdigest()
+
+    first = client.get(url)
+    assert first.get_etag() == (sha256, False)
+    assert first.cache_control.immutable
+    revalidated = client.get(url, headers={'If-None-Match': f'"{sha256}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+
+def test_blob_ranges(client, doctor):
+    url = upload(client, content=b'0123456789abcdef').get_json()['file']['url']
+
+    partial = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.headers['Content-Range'] == 'bytes 0-9/16'
+    assert partial.data == b'0123456789'
+    assert client.get(url, headers={'Range': 'bytes=100-200'}).status_code == 416
+
+
+@pytest.mark.parametrize('mode, header', [('x-sendfile', 'X-Sendfile'), ('x-accel-redirect', 'X-Accel-Redirect')])
+def test_offload_hands_the_blob_to_the_proxy(client, doctor, monkeypatch, mode, header):
+    url = upload(client).get_json()['file']['url']
+    sha256 = hashlib.sha256(b'hello scan').hexdigest()
+    monkeypatch.setattr(uploads.store, 'offload', mode)
+    monkeypatch.setattr(uploads.store, 'accel_prefix', '/protected/')
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == b''
+    expected = {
+        'X-Sendfile': uploads.blob_path(sha256),
+        'X-Accel-Redirect': f'/protected/blobs/{sha256[:2]}/{sha256}',
+    }
+    assert response.headers[header] == expected[header]
+    assert response.get_etag() == (sha256, False)
+
+
+class GatedBody(io.BytesIO):
+    """Request body that waits for the other request before it is read."""
+
+    def __init__(self, content, barrier):
+        super().__init__(content)
+        self.barrier = barrier
+
+    def read(self, *args):
+        if self.tell() == 0:
+            self.barrier.wait(timeout=5)
+        return super().read(*args)
+
+
+def test_concurrent_chunks_at_one_offset_keep_only_the_winner(app, doctor):
+    client = app.test_client()
+    session_id = client.post('/api/upload/sessions', json={
+        'doctor_id': 'doc1', 'filename': 'scan.pdf', 'size': 20,
+    }).get_json()['session']['id']
+    barrier = threading.Barrier(2)
+
+    def patch(content):
+        # Both requests have passed the offset check before either body is read
+        return app.test_client().patch(
+            f'/api/upload/sessions/{session_id}', input_stream=GatedBody(content, barrier),
+            headers={uploads.OFFSET_HEADER: '0', 'Content-Length': str(len(content))},
+        )
+
+    with ThreadPoolExecutor(2) as pool:
+        responses = dict(zip((b'a' * 10, b'b' * 10), pool.map(patch, (b'a' * 10, b'b' * 10))))
+
+    assert sorted(response.status_code for response in responses.values()) == [200, 409]
+    winner = next(content for content, response in responses.items() if response.status_code == 200)
+    finished = client.patch(f'/api/upload/sessions/{session_id}', data=b'c' * 10,
+                            headers={uploads.OFFSET_HEADER: '10'})
+    assert finished.status_code == 201
+    assert client.get(f"/api/uploads/{finished.get_json()['filePath']}").data == winner + b'c' * 10
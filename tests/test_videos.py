@@ -0,0 +1,113 @@
+"""YouTube search serves stale entries through upstream failures and defers to fresher shared copies."""
+import importlib.util
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+from app import videos
+from app.clients import clients
+
+spec = importlib.util.spec_from_file_location(
+    'fake_upstreams', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'scripts', 'fake_upstreams.py')
+)
+fake_upstreams = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(fake_upstreams)
+
+
+class DictTier:
+    """Shared tier held in a dict, standing in for Redis."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, entry):
+        self.entries[key] = entry
+
+
+def test_stale_local_entry_is_replaced_by_fresher_shared_entry(app, monkeypatch):
+    search = videos.VideoSearch(app)
+    search.shared = DictTier()
+    key = ('prenatal yoga', 5)
+    now = time.time()
+    search.local.set(key, (['old'], now - search.ttl - 1))
+    search.shared.set(key, (['new'], now))
+
+    def fetch(*args):
+        raise AssertionError('the shared entry is fresh; nothing should be fetched')
+    monkeypatch.setattr(search, 'fetch', fetch)
+    monkeypatch.setattr(search, '_refresh_in_background', fetch)
+
+    assert search.search('Prenatal  yoga', 5) == ['new']
+    assert search.local.get(key) == (['new'], now)
+
+
+def test_fresh_local_entry_skips_the_shared_tier(app):
+    search = videos.VideoSearch(app)
+    search.shared = DictTier()
+    key = ('prenatal yoga', 5)
+    search.local.set(key, (['local'], time.time()))
+    search.shared.get = None  # any shared lookup would fail
+
+    assert search.search('prenatal yoga', 5) == ['local']
+
+
+@pytest.fixture
+def youtube(app):
+    server = fake_upstreams.make_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    videos.video_search = videos.VideoSearch(app)
+    videos.video_search.api_url = f'http://127.0.0.1:{server.server_port}/youtube/v3'
+
+    yield server.RequestHandlerClass.upstreams['youtube']
+
+    server.shutdown()
+    server.server_close()
+    videos.video_search = videos.VideoSearch(app)
+
+
+def wait_for_refresh(search):
+    deadline = time.time() + 5
+    while search._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+    assert not search._refreshing
+
+
+def test_upstream_error_keeps_serving_the_stale_entry(client, youtube):
+    search = videos.video_search
+    key = ('prenatal yoga', 5)
+    fetched_at = time.time() - search.ttl - 1
+    search.local.set(key, (['stale'], fetched_at))
+    youtube.configure({'errors': 1.0, 'error_status': 500})
+
+    response = client.get('/api/youtube', query_string={'query': 'prenatal yoga'})
+    assert response.status_code == 200
+    assert response.get_json()['videos'] == ['stale']
+    wait_for_refresh(search)
+    assert youtube.snapshot()['outcomes'] == {'error': 1}
+    assert search.local.get(key) == (['stale'], fetched_at)
+
+    # Past the stale window the caller waits for the API, and its failure is reported
+    search.local.set(key, (['stale'], time.time() - search.ttl - search.stale - 1))
+    assert client.get('/api/youtube', query_string={'query': 'prenatal yoga'}).status_code == 502
+
+    youtube.configure({'errors': 0.0})
+    recovered = client.get('/api/youtube', query_string={'query': 'prenatal yoga'}).get_json()['videos']
+    assert len(recovered) == 5 and recovered[0]['title'].startswith('prenatal yoga')
+
+
+@pytest.mark.parametrize('body', [b'<html>Bad gateway</html>', b'[]', b'{"items": [{"snippet": {}}]}'])
+def test_unexpected_response_body_is_a_youtube_error(youtube, monkeypatch, body):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    monkeypatch.setattr(clients.get('youtube'), 'get', lambda *args, **kwargs: response)
+
+    with pytest.raises(videos.YouTubeError):
+        videos.video_search.fetch('prenatal yoga', 5)